@@ -33,15 +33,22 @@
 import sys
 import os
 import fcntl
-import re
+import mmap
+import struct
 import errno
 import time
-from collections import MutableMapping
+from collections import MutableMapping, Mapping
+from contextlib import contextmanager
 
 __all__ = ['StrictModeException', 'exception_occured',
 		'SCOPE', 'ConfigRegistry']
 
 INVALID_VALUE_CHARS = '\r\n'
+# snapshot: magic, inode, mtime and size of text file, number of entries
+SNAPSHOT_HEADER = struct.Struct('<8sQdQI')
+SNAPSHOT_MAGIC = 'UCRSNAP1'
+# snapshot index entry: offset and length of key and value
+SNAPSHOT_ENTRY = struct.Struct('<IIII')
 
 
 class StrictModeException(Exception):
@@ -75,13 +82,20 @@ class ConfigRegistry(MutableMapping):
 		FORCED: 'base-forced.conf',
 	}
 
-	def __init__(self, filename=None, write_registry=NORMAL):
+	def __init__(self, filename=None, write_registry=NORMAL, read_only=False):
+		"""
+		Create merged registry.
+		With `read_only` the values are served from the memory mapped
+		snapshots written on save, which are shared by all processes.
+		"""
 		super(ConfigRegistry, self).__init__()
 		self.file = os.getenv('UNIVENTION_BASECONF') or filename or None
 		if self.file:
 			self.scope = ConfigRegistry.CUSTOM
 		else:
 			self.scope = write_registry
+		self.read_only = read_only
+		self._batch = None  # key -> old value during batch()
 		self._registry = {}
 		for reg in range(ConfigRegistry.MAX):
 			if self.file and reg != ConfigRegistry.CUSTOM:
@@ -98,12 +112,14 @@ class ConfigRegistry(MutableMapping):
 		else:
 			filename = os.path.join(ConfigRegistry.PREFIX,
 				ConfigRegistry.BASES[reg])
+		if self.read_only:
+			return _ConfigRegistrySnapshot(filename=filename)
 		return _ConfigRegistry(filename=filename)
 
 	def load(self):
 		"""Load registry from file."""
 		for reg in self._registry.values():
-			if isinstance(reg, _ConfigRegistry):
+			if isinstance(reg, (_ConfigRegistry, _ConfigRegistrySnapshot)):
 				reg.load()
 		strict = self.is_true('ucr/encoding/strict')
 		for reg in self._registry.values():
@@ -140,9 +156,55 @@ class ConfigRegistry(MutableMapping):
 			self.save()
 		self.unlock()
 
+	@contextmanager
+	def batch(self, run_handlers=True):
+		"""
+		Collect all changes and commit them at once: the registry file is
+		saved once, the replication log is written once and the handlers of
+		all changed variables are called once.
+		> with ConfigRegistry().batch() as ucr:
+		>   ucr['key'] = 'value'
+		>   del ucr['other']
+		Nested batches are merged into the outermost one.
+		"""
+		if self._batch is not None:
+			yield self
+			return
+
+		self.lock()
+		changed = {}
+		try:
+			self.load()
+			self._batch = {}
+			try:
+				yield self
+			finally:
+				batch, self._batch = self._batch, None
+			registry = self._registry[self.scope]
+			for key, old_value in batch.iteritems():
+				new_value = registry.get(key)
+				if (old_value, new_value) != (None, None):
+					changed[key] = (old_value, new_value)
+			if changed:
+				self.save()
+		finally:
+			self.unlock()
+
+		if changed and run_handlers:
+			# Import located here, because on module level, a circular import
+			# would be created
+			from univention.config_registry.frontend import _run_changed
+			_run_changed(self, changed)
+
+	def _remember(self, key):
+		"""Remember old value of key while collecting changes."""
+		if self._batch is not None and key not in self._batch:
+			self._batch[key] = self._registry[self.scope].get(key)
+
 	def __delitem__(self, key):
 		"""Delete registry key."""
 		registry = self._registry[self.scope]
+		self._remember(key)
 		del registry[key]
 
 	def __getitem__(self, key):
@@ -154,6 +216,7 @@ class ConfigRegistry(MutableMapping):
 	def __setitem__(self, key, value):
 		"""Set registry value."""
 		registry = self._registry[self.scope]
+		self._remember(key)
 		registry[key] = value
 
 	def __contains__(self, key):
@@ -213,7 +276,7 @@ class ConfigRegistry(MutableMapping):
 			ConfigRegistry.CUSTOM,
 		):
 			registry = self._registry[reg]
-			if not isinstance(registry, _ConfigRegistry):
+			if not isinstance(registry, (_ConfigRegistry, _ConfigRegistrySnapshot)):
 				continue
 			for key, value in registry.items():
 				if key not in merge:
@@ -255,6 +318,7 @@ class ConfigRegistry(MutableMapping):
 		changed = {}
 		for key, value in changes.iteritems():
 			old_value = registry.get(key, None)
+			self._remember(key)
 			if value is None:
 				try:
 					del registry[key]
@@ -295,42 +359,72 @@ class _ConfigRegistry(dict):
 		# only accept valid UTF-8
 		self.strict_encoding = False
 		self.lock_file = None
+		# (inode, mtime, size) of the file the current content was loaded from
+		self._stamp = None
+
+	@staticmethod
+	def _get_stamp(stat):
+		"""Return identification of file content."""
+		return (stat.st_ino, stat.st_mtime, stat.st_size)
 
 	def load(self):
-		"""Load sub registry from file."""
-		import_failed = False
+		"""Load sub registry from file unless unchanged since last load."""
 		try:
-			reg_file = open(self.file, 'r')
+			stamp = self._get_stamp(os.stat(self.file))
 		except EnvironmentError:
-			import_failed = True
-		else:
-			import_failed = reg_file.readline() == '' and reg_file.readline() == ''
+			stamp = None
+		if stamp is not None and stamp == self._stamp:
+			return
+
+		import_failed = stamp is None
+		if not import_failed:
+			try:
+				stamp, new = self._parse_file(self.file)
+			except EnvironmentError:
+				import_failed = True
+			else:
+				import_failed = not stamp[2]
 
 		if import_failed:
 			try:
-				reg_file = open(self.backup_file, 'r')
+				stamp, new = self._parse_file(self.backup_file)
 			except EnvironmentError:
 				return
 
-		reg_file.seek(0)
-		new = {}
-		for line in reg_file:
-			line = re.sub(r'^[^:]*#.*$', "", line)
-			if line == '':
-				continue
-			if line.find(': ') == -1:
-				continue
-
-			key, value = line.split(': ', 1)
-			new[key] = value.strip()
-		reg_file.close()
-
-		self.update(new)
+		dict.update(self, new)
 		for key in set(self.keys()) - set(new.keys()):
-			self.pop(key, None)
+			dict.pop(self, key, None)
 
 		if import_failed:
 			self.__save_file(self.file)
+			self._stamp = None
+		else:
+			self._stamp = stamp
+
+	def _parse_file(self, filename):
+		"""Return (stamp, content) of registry file."""
+		with open(filename, 'r') as reg_file:
+			stamp = self._get_stamp(os.fstat(reg_file.fileno()))
+			if not stamp[2]:
+				return (stamp, {})
+			buf = mmap.mmap(reg_file.fileno(), 0, access=mmap.ACCESS_READ)
+			try:
+				return (stamp, self._parse(iter(buf.readline, '')))
+			finally:
+				buf.close()
+
+	@staticmethod
+	def _parse(lines):
+		"""Parse registry file content."""
+		new = {}
+		for line in lines:
+			sep = line.find(': ')
+			if sep < 0:
+				continue
+			if line.find('#', 0, line.find(':')) >= 0:  # comment
+				continue
+			new[line[:sep]] = line[sep + 2:].strip()
+		return new
 
 	def __create_base_conf(self):
 		"""Create sub registry file."""
@@ -365,11 +459,13 @@ class _ConfigRegistry(dict):
 			reg_file.flush()
 			os.fsync(reg_file.fileno())
 			# close fd
+			stamp = self._get_stamp(os.fstat(reg_file.fileno()))
 			reg_file.close()
 			try:
 				os.chmod(temp_filename, mode)
 				os.chown(temp_filename, user, group)
 				os.rename(temp_filename, filename)
+				return stamp
 			except OSError as ex:
 				if ex.errno == errno.EBUSY:
 					with open(filename, 'w+') as fd:
@@ -389,10 +485,44 @@ class _ConfigRegistry(dict):
 			if ex.errno != errno.EACCES:
 				raise
 
+	def __save_snapshot(self, stamp):
+		"""Save memory mappable snapshot for the text file identified by stamp."""
+		filename = self.file + _ConfigRegistrySnapshot.SUFFIX
+		temp_filename = '%s.temp' % filename
+		items = sorted((self._encode(key), self._encode(val)) for key, val in self.items())
+		index = []
+		offset = SNAPSHOT_HEADER.size + SNAPSHOT_ENTRY.size * len(items)
+		for key, val in items:
+			index.append(SNAPSHOT_ENTRY.pack(offset, len(key), offset + len(key), len(val)))
+			offset += len(key) + len(val)
+		try:
+			with open(temp_filename, 'wb') as snap_file:
+				snap_file.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, stamp[0], stamp[1], stamp[2], len(items)))
+				snap_file.write(''.join(index))
+				for key, val in items:
+					snap_file.write(key)
+					snap_file.write(val)
+			os.chmod(temp_filename, os.stat(self.file).st_mode & 0o777)
+			os.rename(temp_filename, filename)
+		except EnvironmentError as ex:
+			# suppress certain errors
+			if ex.errno != errno.EACCES:
+				raise
+
+	@staticmethod
+	def _encode(text):
+		"""Return UTF-8 encoded text."""
+		if isinstance(text, unicode):
+			return text.encode('UTF-8')
+		return text
+
 	def save(self):
 		"""Save sub registry to file."""
-		for filename in (self.backup_file, self.file):
-			self.__save_file(filename)
+		self.__save_file(self.backup_file)
+		stamp = self.__save_file(self.file)
+		if stamp:
+			self.__save_snapshot(stamp)
+			self._stamp = stamp
 
 	def lock(self):
 		"""Lock sub registry file."""
@@ -414,8 +544,34 @@ class _ConfigRegistry(dict):
 				value.decode('UTF-8')  # only accept valid UTF-8 encoded bytes
 			except UnicodeError:
 				raise StrictModeException('value is not UTF-8 encoded')
+		self._stamp = None
 		return dict.__setitem__(self, key, value)
 
+	def __delitem__(self, key):
+		"""Delete value from sub registry."""
+		self._stamp = None
+		return dict.__delitem__(self, key)
+
+	def clear(self):
+		self._stamp = None
+		return dict.clear(self)
+
+	def pop(self, *args):
+		self._stamp = None
+		return dict.pop(self, *args)
+
+	def popitem(self):
+		self._stamp = None
+		return dict.popitem(self)
+
+	def setdefault(self, key, default=None):
+		self._stamp = None
+		return dict.setdefault(self, key, default)
+
+	def update(self, *args, **kwargs):
+		self._stamp = None
+		return dict.update(self, *args, **kwargs)
+
 	@staticmethod
 	def remove_invalid_chars(seq):
 		"""Remove non-UTF-8 characters from value."""
@@ -428,4 +584,125 @@ class _ConfigRegistry(dict):
 		return '\n'.join(['%s: %s' % (key, self.remove_invalid_chars(val)) for
 			key, val in sorted(self.items())])
 
+
+class _ConfigRegistrySnapshot(Mapping):
+
+	"""
+	Read-only value store.
+	This is a single value store served from the memory mapped snapshot
+	written next to the text file by <_ConfigRegistry.save()>. Keys are
+	looked up by binary search in the sorted index. If the snapshot does
+	not belong to the current text file, the text file is parsed instead.
+	"""
+	SUFFIX = '.snapshot'
+
+	def __init__(self, filename):
+		self.file = filename
+		self.backup_file = self.file + '.bak'
+		self.snapshot_file = self.file + self.SUFFIX
+		self._stamp = None
+		self._buf = None
+		self._count = 0
+		self._fallback = {}
+
+	def load(self):
+		"""Map snapshot or load text file unless unchanged since last load."""
+		try:
+			stamp = _ConfigRegistry._get_stamp(os.stat(self.file))
+		except EnvironmentError:
+			stamp = None
+		if stamp is not None and stamp == self._stamp:
+			return
+
+		self._close()
+		self._stamp = stamp
+		if stamp is not None and self._map(stamp):
+			return
+
+		for filename in (self.file, self.backup_file):
+			try:
+				with open(filename, 'r') as reg_file:
+					content = reg_file.read()
+			except EnvironmentError:
+				continue
+			if content:
+				self._fallback = _ConfigRegistry._parse(content.splitlines(True))
+				break
+
+	def _map(self, stamp):
+		"""Memory map snapshot if it belongs to the text file identified by stamp."""
+		try:
+			with open(self.snapshot_file, 'rb') as snap_file:
+				buf = mmap.mmap(snap_file.fileno(), 0, access=mmap.ACCESS_READ)
+		except (EnvironmentError, ValueError):
+			return False
+		try:
+			magic, ino, mtime, size, count = SNAPSHOT_HEADER.unpack_from(buf)
+		except struct.error:
+			magic = None
+		if magic != SNAPSHOT_MAGIC or (ino, mtime, size) != stamp or \
+				len(buf) < SNAPSHOT_HEADER.size + SNAPSHOT_ENTRY.size * count:
+			buf.close()
+			return False
+		self._buf = buf
+		self._count = count
+		return True
+
+	def _close(self):
+		"""Release current content."""
+		if self._buf is not None:
+			self._buf.close()
+		self._buf = None
+		self._count = 0
+		self._fallback = {}
+
+	def _entry(self, pos):
+		"""Return key and value offsets of index entry."""
+		return SNAPSHOT_ENTRY.unpack_from(self._buf, SNAPSHOT_HEADER.size + SNAPSHOT_ENTRY.size * pos)
+
+	def _key(self, pos):
+		"""Return key of index entry."""
+		key_off, key_len, _val_off, _val_len = self._entry(pos)
+		return self._buf[key_off:key_off + key_len]
+
+	def _item(self, pos):
+		"""Return key and value of index entry."""
+		key_off, key_len, val_off, val_len = self._entry(pos)
+		return (self._buf[key_off:key_off + key_len], self._buf[val_off:val_off + val_len])
+
+	def __getitem__(self, key):
+		"""Return value from sub registry."""
+		if self._buf is None:
+			return self._fallback[key]
+		key = _ConfigRegistry._encode(key)
+		low, high = 0, self._count
+		while low < high:
+			mid = (low + high) // 2
+			cur = self._key(mid)
+			if cur < key:
+				low = mid + 1
+			elif cur > key:
+				high = mid
+			else:
+				return self._item(mid)[1]
+		raise KeyError(key)
+
+	def __iter__(self):
+		"""Iterate over all keys in sub registry."""
+		if self._buf is None:
+			return iter(self._fallback)
+		return (self._key(pos) for pos in xrange(self._count))
+
+	def __len__(self):
+		"""Return number of keys in sub registry."""
+		if self._buf is None:
+			return len(self._fallback)
+		return self._count
+
+	def items(self):
+		"""Return all (key, value) pairs of sub registry."""
+		if self._buf is None:
+			return self._fallback.items()
+		return [self._item(pos) for pos in xrange(self._count)]
+
 # vim:set sw=4 ts=4 noet:
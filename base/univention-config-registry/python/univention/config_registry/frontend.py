@@ -87,30 +87,41 @@ def replog(ucr, var, old_value, value=None):
 	This function writes a new entry to replication logfile if
 	this feature has been enabled.
 	"""
-	if ucr.is_true('ucr/replog/enabled', False):
-		if value is not None:
-			method = 'set'
-			varvalue = "%s=%s" % (var, escape_value(value))
-		else:
-			method = 'unset'
-			varvalue = "'%s'" % var
+	replog_changes(ucr, {var: (old_value, value)})
 
+
+def replog_changes(ucr, changed):
+	"""
+	This function writes a block of entries for all changes to replication
+	logfile if this feature has been enabled.
+	"""
+	if ucr.is_true('ucr/replog/enabled', False):
 		scope_arg = {
 			ConfigRegistry.LDAP: '--ldap-policy ',
 			ConfigRegistry.FORCED: '--force ',
 			ConfigRegistry.SCHEDULE: '--schedule ',
 		}.get(ucr.scope, '')
+		now = time.strftime("%Y-%m-%d %H:%M:%S")
+
+		log = []
+		for var, (old_value, value) in sorted(changed.items()):
+			if value is not None:
+				method = 'set'
+				varvalue = "%s=%s" % (var, escape_value(value))
+			else:
+				method = 'unset'
+				varvalue = "'%s'" % var
 
-		if old_value is None:
-			old_value = "[Previously undefined]"
+			if old_value is None:
+				old_value = "[Previously undefined]"
 
-		log = '%s: %s %s%s old:%s\n' % (time.strftime("%Y-%m-%d %H:%M:%S"),
-			method, scope_arg, varvalue, old_value)
+			log.append('%s: %s %s%s old:%s\n' % (now,
+				method, scope_arg, varvalue, old_value))
 		try:
 			if not os.path.isfile(REPLOG_FILE):
 				os.close(os.open(REPLOG_FILE, os.O_CREAT, 0o640))
 			logfile = open(REPLOG_FILE, "a+")
-			logfile.write(log)
+			logfile.write(''.join(log))
 			logfile.close()
 		except EnvironmentError as ex:
 			print >> sys.stderr, ("E: exception occurred while writing to " +
@@ -186,14 +197,13 @@ def ucr_update(ucr, changes):
 	"""
 	Set or unset the given config registry variables.
 	"""
-	with ucr:
-		changed = ucr.update(changes)
-	_run_changed(ucr, changed)
+	with ucr.batch():
+		ucr.update(changes)
 
 
 def _run_changed(ucr, changed, msg=None):
+	replog_changes(ucr, changed)
 	for key, (old_value, new_value) in changed.iteritems():
-		replog(ucr, key, old_value, new_value)
 		if msg:
 			scope, _value = ucr.get(key, (0, None), getscope=True)
 			if scope > ucr.scope:
@@ -237,9 +247,20 @@ def handler_commit(args, opts=dict()):
 	ucr = ConfigRegistry()
 	ucr.load()
 
+	jobs = opts.get('jobs') or ucr.get('ucr/commit/jobs') or 1
+	try:
+		jobs = int(jobs)
+	except ValueError:
+		print >> sys.stderr, 'E: invalid number of jobs: %s' % (jobs,)
+		sys.exit(1)
+
 	handlers = ConfigHandlers()
 	handlers.load()
-	handlers.commit(ucr, args)
+	timing = handlers.commit(ucr, args, jobs=jobs)
+
+	if opts.get('timing', False):
+		for duration, handler in sorted(timing, key=lambda d_h: d_h[0], reverse=True):
+			print '%8.3fs %s' % (duration, handler)
 
 
 def handler_register(args, opts=dict()):
@@ -493,9 +514,12 @@ Actions:
     `version/version: 1.0` => `version_version="1.0"`
     (deprecated: use --shell dump instead)
 
-  commit [file1 ...]:
+  commit [--jobs <count>] [--timing] [file1 ...]:
     rebuild configuration file from univention template; if
     no file is specified ALL configuration files are rebuilt
+    --jobs: number of templates rendered in parallel
+            (default controlled via ucr/commit/jobs)
+    --timing: print rendering time of each file, slowest first
 
   filter [file]:
     evaluate a template file, expects python inline code in UTF-8 or US-ASCII
@@ -570,7 +594,11 @@ OPT_COMMANDS = {
 	},
 	'filter': {
 		'encode-utf8': [BOOL, False],
-	}
+	},
+	'commit': {
+		'jobs': [STRING, None],
+		'timing': [BOOL, False],
+	},
 }
 
 
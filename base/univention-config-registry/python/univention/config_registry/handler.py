@@ -40,7 +40,11 @@ import random
 import re
 import subprocess
 import cPickle
+import marshal
 import errno
+import time
+import threading
+from multiprocessing.pool import ThreadPool
 from pwd import getpwnam
 from grp import getgrnam
 from univention.config_registry.misc import replace_umlaut, directory_files
@@ -52,11 +56,26 @@ VARIABLE_PATTERN = re.compile('@%@([^@]+)@%@')
 VARIABLE_TOKEN = re.compile('@%@')
 EXECUTE_TOKEN = re.compile('@!@')
 WARNING_PATTERN = re.compile('(UCRWARNING|BCWARNING|UCRWARNING_ASCII)=(.+)')
+REGEX_SPECIAL = frozenset('.^$*+?{}[]\\|()')
 
 INFO_DIR = '/etc/univention/templates/info'
 FILE_DIR = '/etc/univention/templates/files'
 SCRIPT_DIR = '/etc/univention/templates/scripts'
 MODULE_DIR = '/etc/univention/templates/modules'
+PYTHON_HEADER = '''\
+# -*- coding: utf-8 -*-
+import univention.config_registry
+configRegistry = univention.config_registry.ConfigRegistry()
+configRegistry.load()
+# for compatibility
+baseConfig = configRegistry
+%s
+'''
+MARSHAL_LOADER = 'import sys, marshal; exec(marshal.loads(sys.stdin.read()))'
+# serialize import path manipulation of parallel handlers
+MODULE_LOCK = threading.Lock()
+# serialize the scripts of parallel handlers, they are not written to run concurrently
+SCRIPT_LOCK = threading.Lock()
 # only ascii in the WARNING_TEXT !!!
 WARNING_TEXT = '''\
 Warning: This file is auto-generated and might be overwritten by
@@ -77,23 +96,7 @@ def run_filter(template, directory, srcfiles=set(), opts=dict()):
 			start = i.next()
 			end = i.next()
 			name = template[start.end():end.start()]
-
-			if name in directory:
-				value = directory[name]
-			else:
-				match = WARNING_PATTERN.match(name)
-				if match:
-					mode, prefix = match.groups()
-					if mode == "UCRWARNING_ASCII":
-						value = warning_string(prefix, srcfiles=srcfiles,
-							enforce_ascii=True)
-					else:
-						value = warning_string(prefix, srcfiles=srcfiles)
-				else:
-					value = ''
-
-			if isinstance(value, (list, tuple)):
-				value = value[0]
+			value = _substitute(name, directory, srcfiles)
 			template = template[:start.start()] + value + template[end.end():]
 		except StopIteration:
 			break
@@ -103,19 +106,7 @@ def run_filter(template, directory, srcfiles=set(), opts=dict()):
 		try:
 			start = i.next()
 			end = i.next()
-
-			proc = subprocess.Popen((sys.executable,),
-				stdin=subprocess.PIPE, stdout=subprocess.PIPE,
-				close_fds=True)
-			value = proc.communicate('''\
-# -*- coding: utf-8 -*-
-import univention.config_registry
-configRegistry = univention.config_registry.ConfigRegistry()
-configRegistry.load()
-# for compatibility
-baseConfig = configRegistry
-%s
-''' % template[start.end():end.start()])[0]
+			value = _run_python(template[start.end():end.start()])
 			template = template[:start.start()] + value + template[end.end():]
 
 		except StopIteration:
@@ -124,6 +115,194 @@ baseConfig = configRegistry
 	return template
 
 
+def run_filter_file(path, directory, srcfiles=set(), opts=dict(), template=None):
+	"""Process a template file using the template cache."""
+	if template is None:
+		template = TEMPLATES.get(path)
+	try:
+		return template.render(directory, srcfiles, opts)
+	except TemplateFallback:
+		with open(path, 'r') as tmpl:
+			return run_filter(tmpl.read(), directory, srcfiles, opts)
+
+
+def _substitute(name, directory, srcfiles):
+	"""Return value for @%@name@%@."""
+	if name in directory:
+		value = directory[name]
+	else:
+		match = WARNING_PATTERN.match(name)
+		if match:
+			mode, prefix = match.groups()
+			if mode == "UCRWARNING_ASCII":
+				value = warning_string(prefix, srcfiles=srcfiles,
+					enforce_ascii=True)
+			else:
+				value = warning_string(prefix, srcfiles=srcfiles)
+		else:
+			value = ''
+
+	if isinstance(value, (list, tuple)):
+		value = value[0]
+	return value
+
+
+def _run_python(code):
+	"""Execute Python source code and return its output."""
+	proc = subprocess.Popen((sys.executable,),
+		stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+		close_fds=True)
+	return proc.communicate(PYTHON_HEADER % (code,))[0]
+
+
+def _run_marshal(data):
+	"""Execute marshalled Python code object and return its output."""
+	proc = subprocess.Popen((sys.executable, '-c', MARSHAL_LOADER),
+		stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+		close_fds=True)
+	return proc.communicate(data)[0]
+
+
+class TemplateFallback(Exception):
+
+	"""Template must be processed by run_filter()."""
+
+
+class Template(object):
+
+	"""
+	Pre-parsed template.
+	The template is split into static text, variables and Python sections.
+	Python sections not containing any variable are compiled in advance.
+	"""
+	STATIC, VARIABLE, EXECUTE = range(3)
+
+	def __init__(self, text):
+		# split into static text and variables
+		parts = text.split('@%@')
+		if len(parts) % 2 == 0:  # unmatched last token
+			parts[-2:] = ['@%@'.join(parts[-2:])]
+		tokens = []
+		for pos, part in enumerate(parts):
+			if pos % 2:
+				tokens.append((Template.VARIABLE, part))
+			else:
+				# split static text at Python section delimiters
+				for sub, static in enumerate(part.split('@!@')):
+					if sub:
+						tokens.append((Template.EXECUTE, None))
+					tokens.append((Template.STATIC, static))
+		# group tokens between pairs of delimiters into Python sections
+		delimiters = [pos for pos, (typ, _data) in enumerate(tokens) if typ == Template.EXECUTE]
+		if len(delimiters) % 2:  # unmatched last token
+			tokens[delimiters.pop()] = (Template.STATIC, '@!@')
+		self.chunks = []
+		pos = 0
+		while delimiters:
+			start, end = delimiters.pop(0), delimiters.pop(0)
+			self.chunks += tokens[pos:start]
+			self.chunks.append(self._compile(tokens[start + 1:end]))
+			pos = end + 1
+		self.chunks += tokens[pos:]
+
+	@staticmethod
+	def _compile(tokens):
+		"""Return chunk for Python section."""
+		if all(typ == Template.STATIC for typ, _data in tokens):
+			source = PYTHON_HEADER % (''.join(data for _typ, data in tokens),)
+			try:
+				code = compile(source, '<stdin>', 'exec')
+			except (SyntaxError, TypeError, ValueError):
+				pass  # report error at run time
+			else:
+				return (Template.EXECUTE, marshal.dumps(code))
+		return (Template.EXECUTE, tokens)
+
+	def render(self, directory, srcfiles=set(), opts=dict()):
+		"""Process template: substitute variables and execute Python sections."""
+		result = []
+		for typ, data in self.chunks:
+			if typ == Template.STATIC:
+				result.append(data)
+			elif typ == Template.VARIABLE:
+				result.append(self._substitute(data, directory, srcfiles))
+			elif isinstance(data, str):
+				result.append(_run_marshal(data))
+			else:
+				result.append(_run_python(''.join(
+					self._substitute(name, directory, srcfiles) if typ == Template.VARIABLE else name
+					for typ, name in data)))
+		return ''.join(result)
+
+	@staticmethod
+	def _substitute(name, directory, srcfiles):
+		"""Return value for @%@name@%@ or fall back if it contains tokens."""
+		value = _substitute(name, directory, srcfiles)
+		if '@%@' in value or '@!@' in value:
+			raise TemplateFallback(name)
+		return value
+
+
+class TemplateCache(object):
+
+	"""Persistent cache of pre-parsed templates."""
+	CACHE_FILE = '/var/cache/univention-config/templates'
+	VERSION = '%s %d\n' % ('univention-config template cache, python', sys.hexversion)
+
+	def __init__(self):
+		self._templates = None  # path -> ((mtime, size), Template)
+		self._dirty = False
+		self._lock = threading.Lock()
+
+	def load(self):
+		"""Load cached templates."""
+		self._templates = {}
+		self._dirty = False
+		try:
+			with open(TemplateCache.CACHE_FILE, 'r') as cache_file:
+				if cache_file.readline() == TemplateCache.VERSION:
+					self._templates = cPickle.load(cache_file)
+		except (Exception, cPickle.UnpicklingError):
+			pass
+
+	def save(self):
+		"""Write cache file if changed."""
+		with self._lock:
+			if not self._dirty:
+				return
+			try:
+				with open(TemplateCache.CACHE_FILE, 'w') as cache_file:
+					cache_file.write(TemplateCache.VERSION)
+					cPickle.dump(self._templates, cache_file, cPickle.HIGHEST_PROTOCOL)
+				self._dirty = False
+			except IOError as ex:
+				if ex.errno not in (errno.EACCES, errno.ENOENT):
+					raise
+
+	def get(self, path):
+		"""Return pre-parsed template for file."""
+		stat = os.stat(path)
+		key = (stat.st_mtime, stat.st_size)
+		with self._lock:
+			if self._templates is None:
+				self.load()
+			try:
+				cached_key, template = self._templates[path]
+				if cached_key == key:
+					return template
+			except KeyError:
+				pass
+		with open(path, 'r') as tmpl:
+			template = Template(tmpl.read())
+		with self._lock:
+			self._templates[path] = (key, template)
+			self._dirty = True
+		return template
+
+
+TEMPLATES = TemplateCache()
+
+
 def run_script(script, arg, changes):
 	"""
 	Execute script with command line arguments using a shell and pass changes
@@ -137,9 +316,10 @@ def run_script(script, arg, changes):
 			diff.append('%s@%%@%s@%%@%s\n' % (key, value[0], value[1]))
 
 	cmd = script + " " + arg
-	proc = subprocess.Popen(cmd, shell=True, stdin=subprocess.PIPE,
-			close_fds=True)
-	proc.communicate(''.join(diff))
+	with SCRIPT_LOCK:
+		proc = subprocess.Popen(cmd, shell=True, stdin=subprocess.PIPE,
+				close_fds=True)
+		proc.communicate(''.join(diff))
 
 
 def run_module(modpath, arg, ucr, changes):
@@ -150,15 +330,16 @@ def run_module(modpath, arg, ucr, changes):
 		'preinst': lambda obj: getattr(obj, 'preinst'),
 		'postinst': lambda obj: getattr(obj, 'postinst'),
 	}
-	# temporarily prepend MODULE_DIR to load path
-	sys.path.insert(0, MODULE_DIR)
-	module_name = os.path.splitext(modpath)[0]
-	try:
-		module = __import__(module_name.replace(os.path.sep, '.'))
-		arg2meth[arg](module)(ucr, changes)
-	except (AttributeError, ImportError) as ex:
-		print >> sys.stderr, ex
-	del sys.path[0]
+	with MODULE_LOCK:
+		# temporarily prepend MODULE_DIR to load path
+		sys.path.insert(0, MODULE_DIR)
+		module_name = os.path.splitext(modpath)[0]
+		try:
+			module = __import__(module_name.replace(os.path.sep, '.'))
+			arg2meth[arg](module)(ucr, changes)
+		except (AttributeError, ImportError) as ex:
+			print >> sys.stderr, ex
+		del sys.path[0]
 
 
 def warning_string(prefix='# ', width=80, srcfiles=set(), enforce_ascii=False):
@@ -202,6 +383,9 @@ class ConfigHandlerDiverting(ConfigHandler):
 		"""Return unique hash."""
 		return hash(self.to_file)
 
+	def __str__(self):
+		return self.to_file
+
 	def __cmp__(self, other):
 		"""Compare this to other handler."""
 		return cmp(self.to_file, other.to_file)
@@ -231,6 +415,15 @@ class ConfigHandlerDiverting(ConfigHandler):
 		elif stat:
 			os.chmod(to_file, stat.st_mode)
 
+	def _make_to_dir(self):
+		"""Create the directory of the file, which may be created at the same time by another handler of a parallel commit."""
+		to_dir = os.path.dirname(self.to_file)
+		try:
+			os.makedirs(to_dir, 0o755)
+		except OSError as ex:
+			if ex.errno != errno.EEXIST or not os.path.isdir(to_dir):
+				raise
+
 	def _call_silent(self, *cmd):
 		"""Call command with stdin, stdout, and stderr redirected from/to
 		devnull."""
@@ -318,9 +511,7 @@ class ConfigHandlerMultifile(ConfigHandlerDiverting):
 		if self.def_count == 0 or not self.from_files:
 			return
 
-		to_dir = os.path.dirname(self.to_file)
-		if not os.path.isdir(to_dir):
-			os.makedirs(to_dir, 0o755)
+		self._make_to_dir()
 
 		if os.path.isfile(self.dummy_from_file):
 			stat = os.stat(self.dummy_from_file)
@@ -337,11 +528,11 @@ class ConfigHandlerMultifile(ConfigHandlerDiverting):
 
 			for from_file in sorted(self.from_files, key=os.path.basename):
 				try:
-					from_fp = open(from_file, 'r')
+					template = TEMPLATES.get(from_file)
 				except EnvironmentError:
 					continue
-				to_fp.write(run_filter(from_fp.read(), ucr,
-					srcfiles=self.from_files, opts=filter_opts))
+				to_fp.write(run_filter_file(from_file, ucr,
+					srcfiles=self.from_files, opts=filter_opts, template=template))
 
 			self._set_perm(stat, tmp_to_file)
 			to_fp.close()
@@ -401,9 +592,7 @@ class ConfigHandlerFile(ConfigHandlerDiverting):
 
 		print 'File: %s' % self.to_file
 
-		to_dir = os.path.dirname(self.to_file)
-		if not os.path.isdir(to_dir):
-			os.makedirs(to_dir, 0o755)
+		self._make_to_dir()
 
 		try:
 			stat = os.stat(self.from_file)
@@ -413,16 +602,14 @@ class ConfigHandlerFile(ConfigHandlerDiverting):
 
 		tmp_to_file = self._temp_file_name()
 		try:
-			from_fp = open(self.from_file, 'r')
 			to_fp = open(tmp_to_file, 'w')
 
 			filter_opts = {}
 
-			to_fp.write(run_filter(from_fp.read(), ucr,
+			to_fp.write(run_filter_file(self.from_file, ucr,
 				srcfiles=[self.from_file], opts=filter_opts))
 
 			self._set_perm(stat, tmp_to_file)
-			from_fp.close()
 			to_fp.close()
 
 			try:
@@ -457,6 +644,9 @@ class ConfigHandlerScript(ConfigHandler):
 		super(ConfigHandlerScript, self).__init__()
 		self.script = script
 
+	def __str__(self):
+		return self.script
+
 	def __call__(self, args):
 		"""Call external programm after change."""
 		_ucr, changed = args
@@ -473,6 +663,9 @@ class ConfigHandlerModule(ConfigHandler):
 		super(ConfigHandlerModule, self).__init__()
 		self.module = module
 
+	def __str__(self):
+		return self.module
+
 	def __call__(self, args):
 		"""Call python module after change."""
 		ucr, changed = args
@@ -485,6 +678,88 @@ def grep_variables(text):
 	return set(VARIABLE_PATTERN.findall(text))
 
 
+def literal_prefix(pattern):
+	"""Return the literal prefix every variable matching the regular
+	expression pattern must start with.
+	>>> literal_prefix('interfaces/.*/address')
+	'interfaces/'
+	>>> literal_prefix('foo?')
+	'fo'
+	"""
+	if '|' in pattern:
+		return ''
+	for pos, char in enumerate(pattern):
+		if char in REGEX_SPECIAL:
+			if char in '*?{':
+				pos = max(pos - 1, 0)
+			return pattern[:pos]
+	return pattern
+
+
+class VariableIndex(object):
+
+	"""
+	Index from variable names to handlers.
+	Each registered variable is a regular expression matched against the
+	beginning of the changed variable names. The expressions are grouped by
+	their literal prefix, so only those expressions sharing a prefix with a
+	changed variable need to be compiled and matched.
+	"""
+
+	def __init__(self, v2h=()):
+		self._literals = {}  # prefix -> set(handlers)
+		self._patterns = {}  # prefix -> [(pattern, set(handlers))]
+		self._length = 0
+		self._compiled = {}  # pattern -> compiled regular expression or None
+		for reg_var, handlers in dict(v2h).items():
+			self.add(reg_var, handlers)
+
+	def __getstate__(self):
+		"""Do not persist compiled regular expressions."""
+		state = dict(self.__dict__)
+		state['_compiled'] = {}
+		return state
+
+	def add(self, reg_var, handlers):
+		"""Register handlers for variable pattern."""
+		prefix = literal_prefix(reg_var)
+		if prefix == reg_var:
+			self._literals.setdefault(prefix, set()).update(handlers)
+		else:
+			self._patterns.setdefault(prefix, []).append((reg_var, handlers))
+		self._length = max(self._length, len(prefix))
+
+	def _compile(self, reg_var):
+		"""Return compiled regular expression or None."""
+		try:
+			return self._compiled[reg_var]
+		except KeyError:
+			pass
+		try:
+			_re = re.compile(reg_var)
+		except re.error as ex:
+			print >> sys.stderr, 'Failed to compile regular expression %s: %s' % (reg_var, ex)
+			_re = None
+		self._compiled[reg_var] = _re
+		return _re
+
+	def lookup(self, variables):
+		"""Return set of handlers registered for changes in variables."""
+		pending_handlers = set()
+		for variable in variables:
+			for pos in xrange(min(len(variable), self._length) + 1):
+				prefix = variable[:pos]
+				try:
+					pending_handlers |= self._literals[prefix]
+				except KeyError:
+					pass
+				for reg_var, handlers in self._patterns.get(prefix, ()):
+					_re = self._compile(reg_var)
+					if _re is not None and _re.match(variable):
+						pending_handlers |= handlers
+		return pending_handlers
+
+
 class ConfigHandlers:
 
 	"""Manage handlers for configuration variables."""
@@ -493,9 +768,12 @@ class ConfigHandlers:
 	# 1: with version header
 	# 2: switch to handlers mapping to set, drop file, add multifile.def_count
 	# 3: split config_registry into sub modules
-	VERSION = 3
-	VERSION_MIN = 3
-	VERSION_MAX = 3
+	# 4: add variable index
+	# 5: add target file index and .info modification times
+	# 6: add set of all handlers
+	VERSION = 6
+	VERSION_MIN = 6
+	VERSION_MAX = 6
 	VERSION_TEXT = 'univention-config cache, version'
 	VERSION_NOTICE = '%s %s\n' % (VERSION_TEXT, VERSION)
 	VERSION_RE = re.compile('^%s (?P<version>[0-9]+)$' % VERSION_TEXT)
@@ -503,6 +781,10 @@ class ConfigHandlers:
 	_handlers = {}    # variable -> set(handlers)
 	_multifiles = {}  # multifile -> handler
 	_subfiles = {}    # multifile -> [(subfile, variables)] // pending
+	_index = None     # VariableIndex for _handlers
+	_files = {}       # target file -> set(handlers)
+	_stamp = {}       # .info file -> modification time
+	_all = set()      # all handlers, also those without variables
 
 	def __init__(self):
 		pass
@@ -539,6 +821,10 @@ class ConfigHandlers:
 					_files = pickler.load()
 				self._subfiles = pickler.load()
 				self._multifiles = pickler.load()
+				self._index = pickler.load()
+				self._files = pickler.load()
+				self._stamp = pickler.load()
+				self._all = pickler.load()
 			finally:
 				cache_file.close()
 		except (Exception, cPickle.UnpicklingError):
@@ -700,23 +986,46 @@ class ConfigHandlers:
 		self._handlers.clear()
 		self._multifiles.clear()
 		self._subfiles.clear()
+		self._files.clear()
+		self._all.clear()
+		self._stamp = self._get_info_stamp()
 
 		handlers = set()
-		for info in directory_files(INFO_DIR):
-			if not info.endswith('.info'):
-				continue
+		for info in sorted(self._stamp):
 			for section in parseRfc822(open(info, 'r').read()):
 				handler = self.get_handler(section)
 				if handler:
 					handlers.add(handler)
 		for handler in handlers:
-			for variable in handler.variables:
-				v2h = self._handlers.setdefault(variable, set())
-				v2h.add(handler)
+			self._add_handler(handler)
+		self._index = VariableIndex(self._handlers)
 
 		self._save_cache()
 		return handlers
 
+	@staticmethod
+	def _get_info_stamp():
+		"""Return modification time of all .info files."""
+		stamp = {}
+		for info in directory_files(INFO_DIR):
+			if not info.endswith('.info'):
+				continue
+			try:
+				stamp[info] = os.stat(info).st_mtime
+			except EnvironmentError:
+				pass
+		return stamp
+
+	def _add_handler(self, handler):
+		"""Add handler to variable and target file mapping."""
+		self._all.add(handler)
+		for variable in handler.variables:
+			v2h = self._handlers.setdefault(variable, set())
+			v2h.add(handler)
+		if isinstance(handler, ConfigHandlerDiverting):
+			f2h = self._files.setdefault(handler.to_file, set())
+			f2h.add(handler)
+
 	def update_divert(self, handlers):
 		"""Synchronize diversions with handlers."""
 		wanted = dict([(h.to_file, h) for h in handlers if
@@ -761,6 +1070,10 @@ class ConfigHandlers:
 				pickler.dump(self._handlers)
 				pickler.dump(self._subfiles)
 				pickler.dump(self._multifiles)
+				pickler.dump(self._index)
+				pickler.dump(self._files)
+				pickler.dump(self._stamp)
+				pickler.dump(self._all)
 		except IOError as ex:
 			if ex.errno != errno.EACCES:
 				raise
@@ -777,12 +1090,13 @@ class ConfigHandlers:
 		for handler in handlers:
 			if isinstance(handler, ConfigHandlerDiverting):
 				handler.install_divert()
+			self._add_handler(handler)
 			values = {}
 			for variable in handler.variables:
-				v2h = self._handlers.setdefault(variable, set())
-				v2h.add(handler)
 				values[variable] = ucr[variable]
 			handler((ucr, values))
+		TEMPLATES.save()
+		self._index = VariableIndex(self._handlers)
 
 		self._save_cache()
 		return handlers
@@ -826,6 +1140,7 @@ class ConfigHandlers:
 
 		for handler in mf_handlers - obsolete_handlers:
 			self.call_handler(ucr, handler)
+		TEMPLATES.save()
 
 		try:
 			# remove cache file to force rebuild of cache
@@ -838,61 +1153,70 @@ class ConfigHandlers:
 		"""Call handlers registered for changes in variables."""
 		if not variables:
 			return
-		pending_handlers = set()
-
-		for reg_var, handlers in self._handlers.items():
-			try:
-				_re = re.compile(reg_var)
-			except re.error as ex:
-				print >> sys.stderr, 'Failed to compile regular expression %s: %s' % (reg_var, ex)
-				continue
-
-			for variable in variables:
-				if _re.match(variable):
-					pending_handlers |= handlers
-		for handler in pending_handlers:
+		for handler in self.find_handlers(variables):
 			handler(arg)
-
-	def commit(self, ucr, filelist=list()):
-		"""Call handlers to (re-)generate files."""
+		TEMPLATES.save()
+
+	def find_handlers(self, variables):
+		"""Return set of handlers registered for changes in variables."""
+		if self._index is None:
+			self._index = VariableIndex(self._handlers)
+		return self._index.lookup(variables)
+
+	def commit(self, ucr, filelist=list(), jobs=1):
+		"""
+		Call handlers to (re-)generate files.
+		File and multifile handlers are rendered by up to `jobs` parallel
+		workers; script and module handlers are called afterwards one after
+		the other.
+		Returns list of (seconds, handler) for all called handlers.
+		"""
 		_filelist = []
 		for fname in filelist:
 			fname = os.path.expanduser(fname)
 			fname = os.path.expandvars(fname)
 			fname = os.path.abspath(fname)
 			_filelist.append(fname)
+		# rebuild cache if any .info file changed
+		if self._stamp != self._get_info_stamp():
+			self.update()
 		# find handlers
 		pending_handlers = set()
-		for fname in directory_files(INFO_DIR):
-			if not fname.endswith('.info'):
-				continue
-			for section in parseRfc822(open(fname, 'r').read()):
-				if not section.get('Type'):
-					continue
-				handler = None
-				if _filelist:
-					files = section.get('File') or section.get('Multifile') or ()
-					for filename in files:
-						if not os.path.isabs(filename):
-							filename = '/%s' % filename
-						if filename in _filelist:
-							handler = self.get_handler(section)
-							break
-					else:
-						continue
-				else:
-					handler = self.get_handler(section)
-				if handler:
-					pending_handlers.add(handler)
+		if _filelist:
+			for fname in _filelist:
+				pending_handlers |= self._files.get(fname, set())
+		else:
+			pending_handlers |= self._all
 		# call handlers
-		for handler in pending_handlers:
-			self.call_handler(ucr, handler)
+		files = sorted((handler for handler in pending_handlers if
+			isinstance(handler, ConfigHandlerDiverting)), key=str)
+		others = sorted((handler for handler in pending_handlers if not
+			isinstance(handler, ConfigHandlerDiverting)), key=str)
+		timing = []
+		if jobs > 1 and len(files) > 1:
+			pool = ThreadPool(min(jobs, len(files)))
+			try:
+				timing += pool.map(lambda handler: self._timed_call_handler(ucr, handler), files)
+			finally:
+				pool.close()
+				pool.join()
+		else:
+			timing += [self._timed_call_handler(ucr, handler) for handler in files]
+		timing += [self._timed_call_handler(ucr, handler) for handler in others]
+		TEMPLATES.save()
+		return timing
+
+	def _timed_call_handler(self, ucr, handler):
+		"""Call handler and return (seconds, handler)."""
+		start = time.time()
+		self.call_handler(ucr, handler)
+		return (time.time() - start, handler)
 
 	def call_handler(self, ucr, handler):
 		"""Call handler passing current configuration variables."""
 		values = {}
 		for variable in handler.variables:
-			if variable in self._handlers.keys():
+			if variable in self._handlers:
 				if ".*" in variable:
 					for i in range(4):
 						val = variable.replace(".*", "%s" % i)
@@ -0,0 +1,67 @@
+#!/usr/bin/python
+"""Micro-benchmark for handler dispatch of univention.config_registry."""
+# pylint: disable-msg=C0103,E0611
+import os
+import re
+import sys
+import timeit
+from tempfile import mkdtemp
+from shutil import rmtree
+from optparse import OptionParser
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.path.pardir, 'python'))
+import univention.config_registry.handler as uch
+
+
+def create_info_tree(info_dir, count):
+	"""Create synthetic .info files with script and module handlers."""
+	for i in xrange(count):
+		with open(os.path.join(info_dir, 'bench%05d.info' % (i,)), 'w') as info:
+			info.write('Type: script\nScript: bench%d\nVariables: bench/%d/value\nVariables: bench/%d/.*/option\n\n' % (i, i, i))
+			info.write('Type: module\nModule: bench%d.py\nVariables: service/%d/autostart\nVariables: interfaces/.*/bench%d\n' % (i, i, i))
+
+
+def legacy_find_handlers(handlers, variables):
+	"""Handler resolution by compiling every registered pattern."""
+	pending_handlers = set()
+	for reg_var, v2h in handlers._handlers.items():  # pylint: disable-msg=W0212
+		_re = re.compile(reg_var)
+		for variable in variables:
+			if _re.match(variable):
+				pending_handlers |= v2h
+	return pending_handlers
+
+
+def main():
+	"""Time handler resolution for `ucr set`."""
+	parser = OptionParser()
+	parser.add_option('--handlers', type='int', default=5000, help='number of .info files [%default]')
+	parser.add_option('--repeat', type='int', default=5, help='number of repetitions [%default]')
+	options, args = parser.parse_args()
+	variables = args or ['bench/42/value', 'interfaces/eth0/address']
+
+	work_dir = mkdtemp()
+	try:
+		uch.INFO_DIR = os.path.join(work_dir, 'info')
+		os.mkdir(uch.INFO_DIR)
+		uch.ConfigHandlers.CACHE_FILE = os.path.join(work_dir, 'cache')
+		create_info_tree(uch.INFO_DIR, options.handlers)
+		uch.ConfigHandlers().update()
+
+		def ucr_set(find):
+			"""Load cache and resolve handlers like a fresh `ucr set`."""
+			re.purge()
+			handlers = uch.ConfigHandlers()
+			handlers.load()
+			found = find(handlers, variables)
+			return sorted(getattr(handler, 'script', None) or handler.module for handler in found)
+
+		assert ucr_set(legacy_find_handlers) == ucr_set(uch.ConfigHandlers.find_handlers)
+		for name, find in (('legacy', legacy_find_handlers), ('indexed', uch.ConfigHandlers.find_handlers)):
+			best = min(timeit.repeat(lambda: ucr_set(find), repeat=options.repeat, number=1))
+			print '%-8s %8.3f ms' % (name, best * 1000)
+	finally:
+		rmtree(work_dir)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,73 @@
+#!/usr/bin/python
+"""Benchmark cold vs. warm rendering of UCR templates."""
+# pylint: disable-msg=C0103,E0611,W0212
+import os
+import sys
+import timeit
+from tempfile import mkdtemp
+from shutil import rmtree
+from optparse import OptionParser
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.path.pardir, 'python'))
+import univention.config_registry.handler as uch
+
+TOP_DIR = os.path.join(os.path.dirname(__file__), os.path.pardir, os.path.pardir, os.path.pardir)
+
+
+def largest_templates(count):
+	"""Return the largest templates shipped in the source tree."""
+	templates = []
+	for dirpath, dirnames, filenames in os.walk(TOP_DIR):
+		if '.git' in dirnames:
+			dirnames.remove('.git')
+		if '%sconffiles%s' % (os.path.sep, os.path.sep) not in dirpath + os.path.sep:
+			continue
+		for filename in filenames:
+			path = os.path.join(dirpath, filename)
+			templates.append((os.path.getsize(path), path))
+	return [path for _size, path in sorted(templates, reverse=True)[:count]]
+
+
+def main():
+	"""Time cold (run_filter) and warm (cached Template) rendering."""
+	parser = OptionParser(usage='%prog [options] [template...]')
+	parser.add_option('--count', type='int', default=10, help='number of largest shipped templates [%default]')
+	parser.add_option('--repeat', type='int', default=5, help='number of repetitions [%default]')
+	parser.add_option('--execute', action='store_true', help='execute Python sections in sub-processes')
+	options, templates = parser.parse_args()
+	templates = templates or largest_templates(options.count)
+	if not options.execute:
+		# only measure template processing itself
+		uch._run_python = uch._run_marshal = lambda code: ''
+
+	work_dir = mkdtemp()
+	try:
+		uch.TemplateCache.CACHE_FILE = os.path.join(work_dir, 'templates')
+		directory = {}
+		for path in templates:
+			uch.TEMPLATES.get(path)
+			directory.update((name, 'value') for name in uch.grep_variables(open(path, 'r').read()))
+		uch.TEMPLATES.save()
+
+		def cold():
+			"""Read and process template source."""
+			for path in templates:
+				with open(path, 'r') as tmpl:
+					uch.run_filter(tmpl.read(), directory)
+
+		def warm():
+			"""Load template cache and render pre-parsed templates."""
+			uch.TEMPLATES = uch.TemplateCache()
+			for path in templates:
+				uch.run_filter_file(path, directory)
+
+		for path in templates:
+			print '%8d %s' % (os.path.getsize(path), os.path.relpath(path, TOP_DIR))
+		for name, func in (('cold', cold), ('warm', warm)):
+			best = min(timeit.repeat(func, repeat=options.repeat, number=1))
+			print '%-5s %8.3f ms' % (name, best * 1000)
+	finally:
+		rmtree(work_dir)
+
+
+if __name__ == '__main__':
+	main()
@@ -404,5 +404,158 @@ class TestConfigRegistry(unittest.TestCase):
 			self.fail('Timeout')
 
 
+	def test_load_unchanged(self):
+		"""Skip re-loading unchanged file."""
+		ucr = ConfigRegistry()
+		ucr['foo'] = 'bar'
+		ucr.save()
+		ucr.load()
+
+		def fail(filename):
+			self.fail('%s parsed again' % (filename,))
+		ucr._registry[ConfigRegistry.NORMAL]._parse_file = fail
+		ucr.load()
+		self.assertEqual(ucr['foo'], 'bar')
+
+	def test_load_changed(self):
+		"""Re-load changed file."""
+		ucr = ConfigRegistry()
+		ucr['foo'] = 'bar'
+		ucr.save()
+		ucr.load()
+
+		ucr2 = ConfigRegistry()
+		ucr2['foo'] = 'baz'
+		ucr2.save()
+		ucr.load()
+		self.assertEqual(ucr['foo'], 'baz')
+
+	def test_load_modified(self):
+		"""Re-load discards unsaved modifications."""
+		ucr = ConfigRegistry()
+		ucr['foo'] = 'bar'
+		ucr.save()
+		ucr.load()
+
+		ucr['foo'] = 'baz'
+		ucr['bar'] = 'baz'
+		ucr.load()
+		self.assertEqual(ucr['foo'], 'bar')
+		self.assertEqual(ucr['bar'], None)
+
+	def test_load_format(self):
+		"""Parse registry file."""
+		fname = os.path.join(self.work_dir, ConfigRegistry.BASES[ConfigRegistry.NORMAL])
+		with open(fname, 'w') as reg_file:
+			reg_file.write('# univention_ base.conf\n\nfoo: bar \n#baz: bar\nno value\na:b#c: d\nempty: \n')
+		ucr = ConfigRegistry()
+		ucr.load()
+		self.assertEqual(dict(ucr.items()), {'foo': 'bar', 'a:b#c': 'd', 'empty': ''})
+
+
+	def test_batch(self):
+		"""Collect changes and save once."""
+		ucr = ConfigRegistry()
+		ucr['foo'] = 'foo'
+		ucr['bar'] = 'bar'
+		ucr.save()
+		saved = []
+		ucr.save = lambda: (saved.append(True), ConfigRegistry.save(ucr))
+		with ucr.batch(run_handlers=False):
+			ucr['foo'] = 'baz'
+			del ucr['bar']
+			ucr.update({'baz': 'foo', 'foo': 'bam'})
+			with ucr.batch(run_handlers=False):
+				ucr['nested'] = 'value'
+		self.assertEqual(saved, [True])
+
+		ucr = ConfigRegistry()
+		ucr.load()
+		self.assertEqual(ucr['foo'], 'bam')
+		self.assertEqual(ucr['bar'], None)
+		self.assertEqual(ucr['baz'], 'foo')
+		self.assertEqual(ucr['nested'], 'value')
+
+	def test_batch_abort(self):
+		"""Discard batch on exception."""
+		ucr = ConfigRegistry()
+		try:
+			with ucr.batch(run_handlers=False):
+				ucr['foo'] = 'bar'
+				raise ValueError()
+		except ValueError:
+			pass
+		self.assertEqual(ucr._batch, None)
+
+		ucr = ConfigRegistry()
+		ucr.load()
+		self.assertEqual(ucr['foo'], None)
+
+
+	def test_read_only(self):
+		"""Serve read-only registry from snapshots."""
+		ucr = ConfigRegistry()
+		ucr['foo'] = 'bar'
+		ucr['baz'] = 'normal'
+		ucr.save()
+		ucr = ConfigRegistry(write_registry=ConfigRegistry.FORCED)
+		ucr['baz'] = 'forced'
+		ucr.save()
+
+		ucr = ConfigRegistry(read_only=True)
+		ucr.load()
+		registry = ucr._registry[ConfigRegistry.NORMAL]
+		self.assertNotEqual(registry._buf, None)
+		self.assertEqual(ucr['foo'], 'bar')
+		self.assertEqual(ucr.get('baz', getscope=True), (ConfigRegistry.FORCED, 'forced'))
+		self.assertEqual(ucr['unset'], None)
+		self.assertTrue('foo' in ucr)
+		self.assertEqual(sorted(ucr.items()), [('baz', 'forced'), ('foo', 'bar')])
+		self.assertRaises(TypeError, ucr.__setitem__, 'foo', 'baz')
+
+	def test_read_only_reload(self):
+		"""Re-map read-only registry after save."""
+		ucr = ConfigRegistry()
+		ucr['foo'] = 'bar'
+		ucr.save()
+		ucr_ro = ConfigRegistry(read_only=True)
+		ucr_ro.load()
+
+		ucr['foo'] = 'baz'
+		ucr.save()
+		ucr_ro.load()
+		self.assertEqual(ucr_ro['foo'], 'baz')
+
+	def test_read_only_stale(self):
+		"""Fall back to text file if snapshot is stale."""
+		ucr = ConfigRegistry()
+		ucr['foo'] = 'bar'
+		ucr.save()
+		fname = os.path.join(self.work_dir, ConfigRegistry.BASES[ConfigRegistry.NORMAL])
+		with open(fname, 'a') as reg_file:
+			reg_file.write('\nbar: baz\n')
+
+		ucr = ConfigRegistry(read_only=True)
+		ucr.load()
+		self.assertEqual(ucr._registry[ConfigRegistry.NORMAL]._buf, None)
+		self.assertEqual(ucr['foo'], 'bar')
+		self.assertEqual(ucr['bar'], 'baz')
+
+	def test_read_only_lookup(self):
+		"""Binary search in snapshot."""
+		ucr = ConfigRegistry()
+		for i in range(100):
+			ucr['key/%03d' % (i,)] = 'value %d' % (i,)
+		ucr.save()
+
+		ucr = ConfigRegistry(read_only=True)
+		ucr.load()
+		for i in range(100):
+			self.assertEqual(ucr['key/%03d' % (i,)], 'value %d' % (i,))
+		self.assertEqual(ucr['key/'], None)
+		self.assertEqual(ucr['key/100'], None)
+		self.assertEqual(len(ucr), 100)
+
+
 if __name__ == '__main__':
 	unittest.main()
@@ -0,0 +1,247 @@
+#!/usr/bin/python
+"""Unit test for univention.config_registry.handler."""
+# pylint: disable-msg=C0103,E0611,R0904
+import unittest
+import os
+import sys
+from tempfile import mkdtemp
+from shutil import rmtree
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.path.pardir, 'python'))
+import univention.config_registry.handler as uch
+
+
+class TestVariableIndex(unittest.TestCase):
+
+	"""Unit test for univention.config_registry.handler.VariableIndex"""
+
+	def setUp(self):
+		"""Create object."""
+		self.index = uch.VariableIndex({
+			'foo': set(['literal']),
+			'interfaces/.*/address': set(['pattern']),
+			'.*/autostart': set(['anchored']),
+		})
+
+	def test_literal(self):
+		"""Literal variable name."""
+		self.assertEqual(set(['literal']), self.index.lookup(['foo']))
+
+	def test_literal_prefix(self):
+		"""Variable names are matched at the beginning only."""
+		self.assertEqual(set(['literal']), self.index.lookup(['foo/bar']))
+
+	def test_pattern(self):
+		"""Regular expression."""
+		self.assertEqual(set(['pattern']), self.index.lookup(['interfaces/eth0/address']))
+		self.assertEqual(set(), self.index.lookup(['interfaces/eth0/netmask']))
+
+	def test_no_prefix(self):
+		"""Regular expression without literal prefix."""
+		self.assertEqual(set(['anchored']), self.index.lookup(['cups/autostart']))
+
+	def test_multiple(self):
+		"""Union of handlers for multiple variables."""
+		self.assertEqual(set(['literal', 'pattern']), self.index.lookup(['foo', 'interfaces/eth1/address', 'bar']))
+
+	def test_invalid(self):
+		"""Invalid regular expressions are skipped."""
+		index = uch.VariableIndex({'a[': set(['invalid'])})
+		stderr, sys.stderr = sys.stderr, open(os.path.devnull, 'w')
+		try:
+			self.assertEqual(set(), index.lookup(['a[']))
+		finally:
+			sys.stderr = stderr
+
+	def test_literal_prefix_function(self):
+		"""Literal prefix of regular expressions."""
+		self.assertEqual('foo', uch.literal_prefix('foo'))
+		self.assertEqual('foo/', uch.literal_prefix('foo/.*'))
+		self.assertEqual('fo', uch.literal_prefix('foo*'))
+		self.assertEqual('', uch.literal_prefix('foo|bar'))
+		self.assertEqual('', uch.literal_prefix('(?i)foo'))
+
+
+class TestTemplate(unittest.TestCase):
+
+	"""Unit test for univention.config_registry.handler.Template"""
+
+	def _check(self, text, directory={'a': '1', 'b': '2'}):
+		"""Compare pre-parsed template with run_filter()."""
+		self.assertEqual(uch.run_filter(text, directory), uch.Template(text).render(directory))
+
+	def test_static(self):
+		"""Template without tokens."""
+		self._check('foo\nbar\n')
+
+	def test_variables(self):
+		"""Substitute variables."""
+		self._check('@%@a@%@ @%@b@%@ @%@c@%@\n')
+
+	def test_unmatched(self):
+		"""Keep unmatched tokens."""
+		self._check('@%@a@%@ @%@b')
+		self._check('@%@a@%@ @!@b')
+
+	def test_warning(self):
+		"""Substitute warning text."""
+		self._check('@%@UCRWARNING=# @%@\n')
+
+	def test_variable_spans_section(self):
+		"""Variables take precedence over Python sections."""
+		self._check('x@%@a@!@b@%@y@!@@!@')
+
+	def test_compiled(self):
+		"""Python sections without variables are compiled."""
+		template = uch.Template('a @!@print 1@!@ b @!@print @%@a@%@@!@')
+		typ, code = template.chunks[1]
+		self.assertEqual(uch.Template.EXECUTE, typ)
+		self.assertTrue(isinstance(code, str))
+		typ, tokens = template.chunks[3]
+		self.assertEqual(uch.Template.EXECUTE, typ)
+		self.assertEqual([(uch.Template.STATIC, 'print '), (uch.Template.VARIABLE, 'a'), (uch.Template.STATIC, '')], tokens)
+
+	def test_fallback(self):
+		"""Values containing tokens are processed by run_filter()."""
+		self.assertRaises(uch.TemplateFallback, uch.Template('@%@a@%@').render, {'a': '@!@'})
+
+
+class TestConfigHandlers(unittest.TestCase):
+
+	"""Unit test for univention.config_registry.handler.ConfigHandlers"""
+
+	def setUp(self):
+		"""Create info directory."""
+		self.work_dir = mkdtemp()
+		self.info_dir = os.path.join(self.work_dir, 'info')
+		os.mkdir(self.info_dir)
+		self.file_dir = os.path.join(self.work_dir, 'files')
+		self.old = (uch.INFO_DIR, uch.FILE_DIR, uch.ConfigHandlers.CACHE_FILE, uch.TemplateCache.CACHE_FILE, uch.TEMPLATES, uch.parseRfc822)
+		uch.INFO_DIR = self.info_dir
+		uch.FILE_DIR = self.file_dir
+		uch.ConfigHandlers.CACHE_FILE = os.path.join(self.work_dir, 'cache')
+		uch.TemplateCache.CACHE_FILE = os.path.join(self.work_dir, 'templates')
+		uch.TEMPLATES = uch.TemplateCache()
+		self.stdout, sys.stdout = sys.stdout, open(os.path.devnull, 'w')
+
+	def tearDown(self):
+		"""Remove info directory."""
+		sys.stdout = self.stdout
+		uch.INFO_DIR, uch.FILE_DIR, uch.ConfigHandlers.CACHE_FILE, uch.TemplateCache.CACHE_FILE, uch.TEMPLATES, uch.parseRfc822 = self.old
+		rmtree(self.work_dir)
+
+	def _write_info(self, name, text):
+		"""Write .info file."""
+		with open(os.path.join(self.info_dir, '%s.info' % (name,)), 'w') as info:
+			info.write(text)
+
+	def test_cached_index(self):
+		"""Variable index is persisted in cache."""
+		self._write_info('a', 'Type: script\nScript: a\nVariables: a/.*\n\nType: module\nModule: b.py\nVariables: b\n')
+		uch.ConfigHandlers().update()
+
+		handlers = uch.ConfigHandlers()
+		handlers.load()
+		found = handlers.find_handlers(['a/x', 'b'])
+		self.assertEqual(set(['a', 'b']), set(os.path.basename(getattr(h, 'script', getattr(h, 'module', None))) for h in found))
+		self.assertEqual(set(), handlers.find_handlers(['c']))
+
+
+	def _write_template(self, name, text):
+		"""Write file template and info file; return target file name."""
+		target = os.path.join(self.work_dir, 'out', name).lstrip('/')
+		template = os.path.join(self.file_dir, target)
+		if not os.path.isdir(os.path.dirname(template)):
+			os.makedirs(os.path.dirname(template))
+		with open(template, 'w') as tmpl:
+			tmpl.write(text)
+		self._write_info(name, 'Type: file\nFile: %s\n' % (target,))
+		return '/' + target
+
+	def _no_parse(self, text):
+		"""Fail on parsing .info files."""
+		self.fail('.info file parsed')
+
+	def test_commit_cached(self):
+		"""Commit single file from warm cache without parsing .info files."""
+		target = self._write_template('a', 'a=@%@a@%@\n')
+		self._write_template('b', 'b=@%@b@%@\n')
+		uch.ConfigHandlers().update()
+		uch.parseRfc822 = self._no_parse
+
+		handlers = uch.ConfigHandlers()
+		handlers.load()
+		handlers.commit({'a': '1', 'b': '2'}, [target])
+		self.assertEqual('a=1\n', open(target, 'r').read())
+		self.assertFalse(os.path.exists(target.replace('/a', '/b')))
+
+	def test_commit_stale(self):
+		"""Rebuild cache on modified .info files."""
+		uch.ConfigHandlers().update()
+		target = self._write_template('a', 'a=@%@a@%@\n')
+
+		handlers = uch.ConfigHandlers()
+		handlers.load()
+		handlers.commit({'a': '1'})
+		self.assertEqual('a=1\n', open(target, 'r').read())
+
+
+	def test_commit_parallel(self):
+		"""Render templates in parallel and report timing."""
+		targets = [self._write_template(name, '%s=@%%@%s@%%@\n' % (name, name)) for name in 'abcd']
+		self._write_info('z', 'Type: script\nScript: z\nVariables: a\n')
+		handlers = uch.ConfigHandlers()
+		handlers.update()
+		timing = handlers.commit(dict((name, name.upper()) for name in 'abcd'), jobs=3)
+		for name, target in zip('abcd', targets):
+			self.assertEqual('%s=%s\n' % (name, name.upper()), open(target, 'r').read())
+		self.assertEqual(targets + [os.path.join(uch.SCRIPT_DIR, 'z')], [str(handler) for _duration, handler in timing])
+
+	def test_commit_all(self):
+		"""Full commit calls all handlers, also those without variables."""
+		target = self._write_template('a', 'static\n')
+		self._write_info('z', 'Type: script\nScript: z\nVariables: a\n')
+		handlers = uch.ConfigHandlers()
+		handlers.update()
+		handlers._add_handler(uch.ConfigHandlerModule('y'))
+		handlers._save_cache()
+
+		handlers = uch.ConfigHandlers()
+		handlers.load()
+		called = []
+		handlers.call_handler = lambda ucr, handler: called.append(str(handler))
+		handlers.commit({})
+		self.assertEqual([target, os.path.join(uch.SCRIPT_DIR, 'z'), 'y'], called)
+
+	def test_make_to_dir(self):
+		"""The directory of a file may already have been created by a parallel handler."""
+		handler = uch.ConfigHandlerFile('', os.path.join(self.work_dir, 'out', 'a'))
+		handler._make_to_dir()
+		handler._make_to_dir()
+		self.assertTrue(os.path.isdir(os.path.join(self.work_dir, 'out')))
+		open(os.path.join(self.work_dir, 'file'), 'w').close()
+		handler = uch.ConfigHandlerFile('', os.path.join(self.work_dir, 'file', 'a'))
+		self.assertRaises(OSError, handler._make_to_dir)
+
+
+	def test_template_cache(self):
+		"""Pre-parsed templates are persisted."""
+		target = self._write_template('a', 'a=@%@a@%@\n')
+		template = os.path.join(self.file_dir, target.lstrip('/'))
+		handlers = uch.ConfigHandlers()
+		handlers.update()
+		handlers.commit({'a': '1'})
+		self.assertTrue(os.path.exists(uch.TemplateCache.CACHE_FILE))
+
+		uch.TEMPLATES = uch.TemplateCache()
+		cached = uch.TEMPLATES.get(template)
+		self.assertTrue(cached is uch.TEMPLATES.get(template))
+
+		with open(template, 'a') as tmpl:
+			tmpl.write('b=@%@b@%@\n')
+		self.assertFalse(cached is uch.TEMPLATES.get(template))
+		handlers.commit({'a': '1', 'b': '2'}, [target])
+		self.assertEqual('a=1\nb=2\n', open(target, 'r').read())
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -31,9 +31,13 @@
 # <http://www.gnu.org/licenses/>.
 
 import re
+import time
+import threading
+from collections import OrderedDict
 import ldap
 import ldap.schema
 import ldap.sasl
+from ldap.controls import SimplePagedResultsControl
 import univention.debug
 from univention.config_registry import ConfigRegistry
 from ldapurl import LDAPUrl
@@ -116,6 +120,77 @@ def getMachineConnection(start_tls=2, decode_ignorelist=[], ldap_master=True, se
 			raise exc
 
 
+class _PolicyCache(object):
+	"""
+	Per-connection cache of the container and policy objects read by
+	:py:meth:`access.getPolicies`.
+
+	Entries expire after `ttl` seconds and are then revalidated by comparing
+	their `entryCSN`, so only changed objects are transferred again.
+	A `ttl` of `None` never expires, `0` disables the cache.
+	The least recently used objects are dropped once `MAX_ENTRIES` objects are cached.
+	The cache may be shared by several threads using the same connection.
+	"""
+	MAX_ENTRIES = 10000
+
+	def __init__(self, ttl):
+		self.ttl = ttl
+		self._entries = OrderedDict()  # dn.lower(): {tuple(attr): (expiry, csn, entry)}, least recently used first
+		self._lock = threading.Lock()
+
+	def get(self, lo, dn, attr):
+		"""Return the attributes `attr` of `dn` or `None` if the object does not exist."""
+		if self.ttl == 0:
+			return self._fetch(lo, dn, attr)[1]
+
+		key = dn.lower()
+		now = time.time()
+		with self._lock:
+			entries = self._entries.pop(key, {})
+			self._entries[key] = entries
+			cached = entries.get(tuple(attr))
+		if cached is not None:
+			expiry, csn, entry = cached
+			if expiry is None or now < expiry:
+				return entry
+			if csn is not None and lo.get(dn, ['entryCSN']).get('entryCSN', [None])[0] == csn:
+				self._store(key, attr, (self._expiry(now), csn, entry))
+				return entry
+
+		csn, entry = self._fetch(lo, dn, attr)
+		self._store(key, attr, (self._expiry(now), csn, entry))
+		return entry
+
+	def _store(self, key, attr, value):
+		with self._lock:
+			entries = self._entries.pop(key, {})
+			entries[tuple(attr)] = value
+			self._entries[key] = entries
+			while len(self._entries) > self.MAX_ENTRIES:
+				self._entries.popitem(last=False)
+
+	def _expiry(self, now):
+		return None if self.ttl is None else now + self.ttl
+
+	@staticmethod
+	def _fetch(lo, dn, attr):
+		try:
+			entry = lo.get(dn, attr + ['entryCSN'], required=True)
+		except ldap.NO_SUCH_OBJECT:
+			return None, None
+		csn = entry.pop('entryCSN', [None])[0]
+		return csn, entry
+
+	def invalidate(self, dn):
+		"""Drop all cached entries of `dn`."""
+		with self._lock:
+			self._entries.pop(dn.lower(), None)
+
+	def clear(self):
+		with self._lock:
+			self._entries.clear()
+
+
 class access:
 
 	def __init__(self, host='localhost', port=None, base='', binddn='', bindpw='', start_tls=2, ca_certfile=None, decode_ignorelist=[], use_ldaps=False, uri=None, follow_referral=False, reconnect=True):
@@ -163,6 +238,13 @@ class access:
 
 		self.client_connection_attempt = client_retry_count + 1
 
+		try:
+			policy_cache_ttl = int(ucr.get('ldap/client/policy-cache/ttl', 0))
+		except ValueError:
+			univention.debug.debug(univention.debug.LDAP, univention.debug.ERROR, "Unable to read ldap/client/policy-cache/ttl, please reset to an integer value")
+			policy_cache_ttl = 0
+		self._policy_cache = _PolicyCache(max(0, policy_cache_ttl))
+
 		self.__open(ca_certfile)
 
 	def __encode_pwd(self, pwd):
@@ -324,6 +406,91 @@ class access:
 		_d = univention.debug.function('uldap.searchDn filter=%s base=%s scope=%s unique=%d required=%d' % (filter, base, scope, unique, required))
 		return [x[0] for x in self.search(filter, base, scope, ['dn'], unique, required, timeout, sizelimit, serverctrls)]
 
+	def search_iter(self, filter='(objectClass=*)', base='', scope='sub', attr=[], unique=False, required=False, timeout=-1, sizelimit=0, serverctrls=None, page_size=1000):
+		'''do paged ldap search, yielding (dn, attrs) as the pages arrive
+
+		The OpenLDAP server keeps only one paged search per connection, so
+		concurrent paged searches on one connection invalidate each other.
+		Connections shared by several threads must pass page_size=0, which
+		streams the entries of a single search without the paged results control.'''
+
+		univention.debug.debug(univention.debug.LDAP, univention.debug.INFO, 'uldap.search_iter filter=%s base=%s scope=%s attr=%s unique=%d required=%d timeout=%d sizelimit=%d page_size=%d' % (filter, base, scope, attr, unique, required, timeout, sizelimit, page_size))
+
+		if not base:
+			base = self.base
+
+		if scope == 'base+one':
+			scopes = (ldap.SCOPE_BASE, ldap.SCOPE_ONELEVEL)
+		elif scope == 'sub' or scope == 'domain':
+			scopes = (ldap.SCOPE_SUBTREE,)
+		elif scope == 'one':
+			scopes = (ldap.SCOPE_ONELEVEL,)
+		else:
+			scopes = (ldap.SCOPE_BASE,)
+
+		count = 0
+		for ldap_scope in scopes:
+			if page_size:
+				results = self.__search_paged(base, ldap_scope, filter, attr, serverctrls, timeout, sizelimit, page_size)
+			else:
+				results = self.__search_stream(base, ldap_scope, filter, attr, serverctrls, timeout, sizelimit)
+			for res in results:
+				count += 1
+				if unique and count > 1:
+					raise ldap.INAPPROPRIATE_MATCHING({'desc': 'more than one object'})
+				if sizelimit and count > sizelimit:
+					raise ldap.SIZELIMIT_EXCEEDED({'desc': 'Size limit exceeded'})
+				yield res
+		if required and count < 1:
+			raise ldap.NO_SUCH_OBJECT({'desc': 'no object'})
+
+	def searchDn_iter(self, filter='(objectClass=*)', base='', scope='sub', unique=False, required=False, timeout=-1, sizelimit=0, serverctrls=None, page_size=1000):
+		'''do paged ldap search, yielding the dn of each object as the pages arrive'''
+		for dn, attr in self.search_iter(filter, base, scope, ['dn'], unique, required, timeout, sizelimit, serverctrls, page_size):
+			yield dn
+
+	def __search_stream(self, base, scope, filter, attr, serverctrls, timeout, sizelimit):
+		result_timeout = timeout if timeout >= 0 else None
+		msgid = self.lo.search_ext(base, scope, filter, attr, serverctrls=serverctrls, clientctrls=None, timeout=timeout, sizelimit=sizelimit)
+		try:
+			while True:
+				rtype, rdata, rmsgid, rctrls = self.lo.result3(msgid, all=0, timeout=result_timeout)
+				for res in rdata:
+					yield res
+				if rtype == ldap.RES_SEARCH_RESULT:
+					msgid = None
+					break
+		finally:
+			if msgid is not None:  # consumer stopped early
+				try:
+					self.lo.abandon(msgid)
+				except ldap.LDAPError:
+					pass
+
+	def __search_paged(self, base, scope, filter, attr, serverctrls, timeout, sizelimit, page_size):
+		page_ctrl = SimplePagedResultsControl(False, page_size, '')
+		ctrls = [page_ctrl] + list(serverctrls or [])
+		result_timeout = timeout if timeout >= 0 else None
+		msgid = self.lo.search_ext(base, scope, filter, attr, serverctrls=ctrls, clientctrls=None, timeout=timeout, sizelimit=sizelimit)
+		try:
+			while True:
+				rtype, rdata, rmsgid, rctrls = self.lo.result3(msgid, timeout=result_timeout)
+				msgid = None
+				for res in rdata:
+					yield res
+
+				cookies = [ctrl.cookie for ctrl in rctrls if ctrl.controlType == SimplePagedResultsControl.controlType]
+				if not cookies or not cookies[0]:
+					break
+				page_ctrl.cookie = cookies[0]
+				msgid = self.lo.search_ext(base, scope, filter, attr, serverctrls=ctrls, clientctrls=None, timeout=timeout, sizelimit=sizelimit)
+		finally:
+			if msgid is not None:  # consumer stopped early
+				try:
+					self.lo.abandon(msgid)
+				except ldap.LDAPError:
+					pass
+
 	def getPolicies(self, dn, policies=None, attrs=None, result=None, fixedattrs=None):
 		if attrs is None:
 			attrs = {}
@@ -331,6 +498,27 @@ class access:
 			policies = []
 		_d = univention.debug.function('uldap.getPolicies dn=%s policies=%s attrs=%s' % (
 			dn, policies, attrs))
+		return self.__get_policies(dn, policies, attrs, self._policy_cache)
+
+	def getPoliciesMany(self, dns):
+		"""
+		Resolve the policies of many objects at once.
+
+		Containers and policies shared by the objects are only fetched once,
+		even if the policy cache is disabled.
+
+		:param dns: The DNs of the objects.
+		:returns: A dictionary mapping each DN to the result of :py:meth:`getPolicies`.
+		"""
+		_d = univention.debug.function('uldap.getPoliciesMany')
+		cache = self._policy_cache if self._policy_cache.ttl else _PolicyCache(None)
+		return dict((dn, self.__get_policies(dn, None, None, cache)) for dn in dns)
+
+	def __get_policies(self, dn, policies, attrs, cache):
+		if attrs is None:
+			attrs = {}
+		if policies is None:
+			policies = []
 		if not dn and not policies:  # if policies is set apply a fictionally referenced list of policies
 			return {}
 
@@ -351,13 +539,12 @@ class access:
 			obj_dn = dn
 			while True:
 				for policy_dn in policies:
-					self._merge_policy(policy_dn, obj_dn, object_classes, result)
+					self._merge_policy(policy_dn, obj_dn, object_classes, result, cache)
 				dn = self.parentDn(dn)
 				if not dn:
 					break
-				try:
-					parent = self.get(dn, attr=['univentionPolicyReference'], required=True)
-				except ldap.NO_SUCH_OBJECT:
+				parent = cache.get(self, dn, ['univentionPolicyReference'])
+				if parent is None:
 					break
 				policies = parent.get('univentionPolicyReference', [])
 
@@ -366,8 +553,8 @@ class access:
 			"getPolicies: result: %s" % result)
 		return result
 
-	def _merge_policy(self, policy_dn, obj_dn, object_classes, result):
-		pattrs = self.get(policy_dn)
+	def _merge_policy(self, policy_dn, obj_dn, object_classes, result, cache=None):
+		pattrs = (cache or self._policy_cache).get(self, policy_dn, ['*'])
 		if not pattrs:
 			return
 
@@ -396,7 +583,7 @@ class access:
 				continue
 
 			if key not in values or key in fixed:
-				value = [] if key in empty else pattrs.get(key, [])
+				value = [] if key in empty else list(pattrs.get(key, []))
 				univention.debug.debug(
 					univention.debug.LDAP, univention.debug.INFO,
 					"getPolicies: %s sets: %s=%s" % (policy_dn, key, value))
@@ -432,6 +619,7 @@ class access:
 			nal[key] |= set(val)
 
 		nal = self.__encode_entry([(k, list(v)) for k, v in nal.items()])
+		self._policy_cache.invalidate(dn)
 
 		try:
 			rtype, rdata, rmsgid, resp_ctrls = self.lo.add_ext_s(dn, nal, serverctrls=serverctrls)
@@ -510,6 +698,7 @@ class access:
 
 	def modify_s(self, dn, ml):
 		"""Redirect modify_s directly to lo"""
+		self._policy_cache.invalidate(dn)
 		try:
 			self.lo.modify_ext_s(dn, ml)
 		except ldap.REFERRAL as exc:
@@ -522,6 +711,7 @@ class access:
 		"""Redirect modify_ext_s directly to lo"""
 		if not serverctrls:
 			serverctrls = []
+		self._policy_cache.invalidate(dn)
 
 		try:
 			rtype, rdata, rmsgid, resp_ctrls = self.lo.modify_ext_s(dn, ml, serverctrls=serverctrls)
@@ -554,6 +744,7 @@ class access:
 		"""Redirect rename_ext_s directly to lo"""
 		if not serverctrls:
 			serverctrls = []
+		self._policy_cache.clear()  # the DNs of the whole subtree change
 
 		try:
 			rtype, rdata, rmsgid, resp_ctrls = self.lo.rename_s(dn, newrdn, newsuperior, serverctrls=serverctrls)
@@ -570,6 +761,7 @@ class access:
 		univention.debug.debug(univention.debug.LDAP, univention.debug.INFO, 'uldap.delete %s' % dn)
 		if dn:
 			univention.debug.debug(univention.debug.LDAP, univention.debug.INFO, 'delete')
+			self._policy_cache.invalidate(dn)
 			try:
 				self.lo.delete_s(dn)
 			except ldap.REFERRAL as exc:
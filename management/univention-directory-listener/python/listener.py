@@ -34,7 +34,7 @@ import os
 import pwd
 import univention.config_registry
 
-configRegistry = univention.config_registry.ConfigRegistry()
+configRegistry = univention.config_registry.ConfigRegistry(read_only=True)
 configRegistry.load()
 
 baseConfig = configRegistry
@@ -128,7 +128,7 @@ LOG_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
 
 _logger_cache = dict()
 _handler_cache = dict()
-_ucr = ConfigRegistry()
+_ucr = ConfigRegistry(read_only=True)
 _ucr.load()
 
 
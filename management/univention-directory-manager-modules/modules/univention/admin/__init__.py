@@ -30,6 +30,7 @@
 # /usr/share/common-licenses/AGPL-3; if not, see
 # <http://www.gnu.org/licenses/>.
 
+import os
 import types
 import copy
 import sys
@@ -40,10 +41,10 @@ from ldap.filter import filter_format
 import univention.config_registry
 import univention.debug
 
-__all__ = ('configRegistry', 'ucr_overwrite_properties', 'pattern_replace', 'property', 'option', 'ucr_overwrite_module_layout', 'ucr_overwrite_layout', 'extended_attribute', 'tab', 'field', 'policiesGroup', 'modules', 'objects', 'syntax', 'hook', 'mapping')
+__all__ = ('configRegistry', 'ucr_overwrite_properties', 'pattern_replace', 'files_stamp', 'property', 'option', 'ucr_overwrite_module_layout', 'ucr_overwrite_layout', 'extended_attribute', 'tab', 'field', 'policiesGroup', 'modules', 'objects', 'syntax', 'hook', 'mapping')
 
 
-configRegistry = univention.config_registry.ConfigRegistry()
+configRegistry = univention.config_registry.ConfigRegistry(read_only=True)
 configRegistry.load()
 
 # baseconfig legacy
@@ -107,6 +108,19 @@ def ucr_overwrite_properties(module, lo):
 			continue
 
 
+def files_stamp(files):
+	"""Return the modification times and sizes of `files` to detect changes,
+	e.g. of the files in syntax.d and hooks.d."""
+	stamp = []
+	for fn in files:
+		try:
+			st = os.stat(fn)
+		except OSError:
+			continue
+		stamp.append((fn, st.st_mtime, st.st_size))
+	return stamp
+
+
 def pattern_replace(pattern, object):
 	"""Replaces patterns like <attribute:command,...>[range] with values
 	of the specified UDM attribute."""
@@ -30,8 +30,11 @@
 # /usr/share/common-licenses/AGPL-3; if not, see
 # <http://www.gnu.org/licenses/>.
 
+from contextlib import contextmanager
+
 import ldap
 from ldap.filter import filter_format
+from ldap.controls.libldap import AssertionControl
 
 import univention.debug
 import univention.admin.locking
@@ -54,6 +57,9 @@ _type2attr = {
 	'mac': 'macAddress',
 	'groupName': 'cn'
 }
+_ranges = [{'first': 1000, 'last': 55000}, {'first': 65536, 'last': 1000000}]
+_range_allocators = {}  # id(lo) -> RangeAllocator
+
 _type2scope = {
 	'uidNumber': 'base',
 	'gidNumber': 'base',
@@ -190,17 +196,161 @@ def acquireUnique(lo, position, type, value, attr, scope='base'):
 	raise univention.admin.uexceptions.noLock(_('The attribute %r could not get locked.') % (type,))
 
 
+class RangeAllocator(object):
+	"""Hands out uidNumber and gidNumber values from blocks reserved in advance.
+
+	A block is reserved by advancing the `univentionLastUsedValue` counters of
+	both uidNumber and gidNumber with one modify each, guarded by an assertion on
+	the old value, so :func:`acquireRange` continues after the block. IDs already
+	used by existing objects are found with one search per block instead of one
+	search per ID. Each handed out ID is still locked until it is confirmed, as
+	:func:`acquireRange` may go back into the block after a confirmation.
+	If the second counter changed meanwhile, the first one is set back.
+
+	Use :func:`reserveRange`, or :func:`register` and :func:`close` for an
+	allocator which lives longer than a block of code.
+	"""
+	types = ('uidNumber', 'gidNumber')
+	retries = 10
+
+	def __init__(self, lo, position, size=100, ranges=_ranges):
+		self.lo = lo
+		self.position = position
+		self.size = size
+		self.ranges = ranges
+		self.free = []
+		self.handed_out = set()
+		self.block = None
+
+	def _counter(self, atype):
+		return 'cn=%s,cn=temporary,cn=univention,%s' % (ldap.dn.escape_dn_chars(atype), self.position.getBase())
+
+	def _set_counter(self, atype, old, new):
+		assertion = AssertionControl(True, filter_format('(univentionLastUsedValue=%s)', [old]))
+		self.lo.modify(self._counter(atype), [('univentionLastUsedValue', old, new)], exceptions=True, serverctrls=[assertion])
+
+	def _reset_counters(self, atypes, counters, end):
+		"""Set the counters advanced by a failed reservation back, unless they changed meanwhile."""
+		for atype in atypes:
+			try:
+				self._set_counter(atype, str(end), counters[atype][0])
+			except ldap.ASSERTION_FAILED:
+				univention.debug.debug(univention.debug.ADMIN, univention.debug.WARN, 'ALLOCATE: %s values %d-%d are skipped' % (atype, int(counters[atype][0]) + 1, end))
+
+	def _reserve(self):
+		"""Reserve the next block. Returns False if the counters are missing or the ranges are exhausted."""
+		for attempt in range(self.retries):
+			counters = dict((atype, self.lo.getAttr(self._counter(atype), 'univentionLastUsedValue')) for atype in self.types)
+			if not all(counters.values()):
+				return False
+			start = max(int(value[0]) for value in counters.values()) + 1
+			for _range in self.ranges:
+				if start <= _range['last']:
+					start = max(start, _range['first'])
+					end = min(start + self.size - 1, _range['last'])
+					break
+			else:
+				return False
+
+			advanced = []
+			try:
+				for atype in self.types:
+					self._set_counter(atype, counters[atype][0], str(end))
+					advanced.append(atype)
+			except ldap.ASSERTION_FAILED:
+				univention.debug.debug(univention.debug.ADMIN, univention.debug.INFO, 'ALLOCATE: concurrent allocation, retrying block reservation')
+				self._reset_counters(advanced, counters, end)
+				continue
+
+			used = set()
+			ids = range(start, end + 1)
+			for i in range(0, len(ids), 250):
+				_filter = '(|%s)' % ''.join('(uidNumber=%d)(gidNumber=%d)' % (id_, id_) for id_ in ids[i:i + 250])
+				for dn, attrs in self.lo.search(base=self.position.getBase(), filter=_filter, attr=list(self.types)):
+					used.update(int(value) for atype in self.types for value in attrs.get(atype, []))
+			self.free = [id_ for id_ in ids if id_ not in used]
+			self.block = (start, end)
+			univention.debug.debug(univention.debug.ADMIN, univention.debug.INFO, 'ALLOCATE: reserved IDs %d-%d, %d already used' % (start, end, len(used)))
+			return True
+		return False
+
+	def request(self, atype):
+		"""Return the next free ID or None if no block could be reserved."""
+		while True:
+			while not self.free:
+				if not self._reserve():
+					return None
+			value = str(self.free.pop(0))
+			try:
+				univention.admin.locking.lock(self.lo, self.position, atype, value, scope=_type2scope[atype])
+			except (univention.admin.uexceptions.noLock, univention.admin.uexceptions.objectExists):
+				univention.debug.debug(univention.debug.ADMIN, univention.debug.INFO, 'ALLOCATE: Cant Lock ID %r' % value)
+				continue
+			self.handed_out.add(value)
+			return value
+
+	def release(self, value):
+		"""Take back an ID which was not used."""
+		if value in self.handed_out:
+			self.handed_out.discard(value)
+			self.free.insert(0, int(value))
+
+	def register(self):
+		"""Hand out the uidNumber and gidNumber values requested through `lo` from this
+		allocator until :func:`close` is called. Returns the allocator."""
+		_range_allocators[id(self.lo)] = self
+		return self
+
+	def close(self):
+		"""Stop handing out IDs and give the unused IDs of the last block back, unless other IDs were allocated meanwhile."""
+		if _range_allocators.get(id(self.lo)) is self:
+			del _range_allocators[id(self.lo)]
+		if not self.block or not self.free:
+			return
+		start, end = self.block
+		last = max([start - 1] + [id_ for id_ in range(start, end + 1) if id_ not in self.free])
+		try:
+			for atype in self.types:
+				self._set_counter(atype, str(end), str(last))
+		except ldap.ASSERTION_FAILED:
+			univention.debug.debug(univention.debug.ADMIN, univention.debug.INFO, 'ALLOCATE: IDs %d-%d stay reserved' % (last + 1, end))
+		self.free = []
+		self.block = None
+
+
+@contextmanager
+def reserveRange(lo, position, size=100):
+	"""Hand out uidNumber and gidNumber values requested through `lo` from reserved blocks of `size` IDs,
+	e.g. while creating many users or groups."""
+	allocator = RangeAllocator(lo, position, size).register()
+	try:
+		yield allocator
+	finally:
+		allocator.close()
+
+
 def request(lo, position, type, value=None):
 	if type in ('uidNumber', 'gidNumber'):
-		return acquireRange(lo, position, type, _type2attr[type], [{'first': 1000, 'last': 55000}, {'first': 65536, 'last': 1000000}], scope=_type2scope[type])
+		allocator = _range_allocators.get(id(lo))
+		if allocator:
+			value = allocator.request(type)
+			if value:
+				return value
+		return acquireRange(lo, position, type, _type2attr[type], _ranges, scope=_type2scope[type])
 	return acquireUnique(lo, position, type, value, _type2attr[type], scope=_type2scope[type])
 
 
 def confirm(lo, position, type, value):
-	if type in ('uidNumber', 'gidNumber'):
+	allocator = _range_allocators.get(id(lo))
+	if allocator and type in allocator.types and value in allocator.handed_out:
+		pass  # the counter already points behind the reserved block
+	elif type in ('uidNumber', 'gidNumber'):
 		lo.modify('cn=%s,cn=temporary,cn=univention,%s' % (ldap.dn.escape_dn_chars(type), position.getBase()), [('univentionLastUsedValue', '1', value)])
 	univention.admin.locking.unlock(lo, position, type, value, _type2scope[type])
 
 
 def release(lo, position, type, value):
+	allocator = _range_allocators.get(id(lo))
+	if allocator and type in allocator.types:
+		allocator.release(value)
 	univention.admin.locking.unlock(lo, position, type, value, _type2scope[type])
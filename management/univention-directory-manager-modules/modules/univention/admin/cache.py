@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+#
+# Univention Admin Modules
+#  caches for values looked up by the handlers
+#
+# Copyright 2018 Univention GmbH
+#
+# http://www.univention.de/
+#
+# All rights reserved.
+#
+# The source code of this program is made available
+# under the terms of the GNU Affero General Public License version 3
+# (GNU AGPL V3) as published by the Free Software Foundation.
+#
+# Binary versions of this program provided by Univention to you as
+# well as other copyrighted, protected or trademarked materials like
+# Logos, graphics, fonts, specific documentations and configurations,
+# cryptographic keys etc. are subject to a license agreement between
+# you and Univention and not subject to the GNU AGPL V3.
+#
+# In the case you use this program under the terms of the GNU AGPL V3,
+# the program is provided in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License with the Debian GNU/Linux or Univention distribution in file
+# /usr/share/common-licenses/AGPL-3; if not, see
+# <http://www.gnu.org/licenses/>.
+
+"""Size bounded caches with a time to live, shared by all handlers of a process.
+
+Use :func:`get_cache` to get the cache of a name and :func:`statistics` to
+monitor the caches of a process.
+"""
+
+import time
+import threading
+from collections import OrderedDict
+
+import univention.debug
+
+DEFAULT_SIZE = 10000
+DEFAULT_TTL = 300
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+class Cache(object):
+	"""A thread safe cache which evicts the least recently used entry if it is full.
+
+	:param name: The name shown in the statistics.
+	:param maxsize: The maximum number of entries.
+	:param ttl: The number of seconds an entry is valid. `None` lets entries never expire, a negative value disables the cache.
+
+	The values are stored as they are, so they must not be modified after :func:`set` or :func:`get`.
+	"""
+
+	def __init__(self, name, maxsize=DEFAULT_SIZE, ttl=DEFAULT_TTL):
+		self.name = name
+		self.maxsize = maxsize
+		self.ttl = ttl
+		self._lock = threading.Lock()
+		self._entries = OrderedDict()  # key: (value, csn, expiry)
+		self.hits = self.misses = self.evictions = self.expirations = 0
+
+	@property
+	def enabled(self):
+		return self.maxsize > 0 and (self.ttl is None or self.ttl >= 0)
+
+	def __len__(self):
+		return len(self._entries)
+
+	def __contains__(self, key):
+		with self._lock:
+			return self._lookup(key, None) is not None
+
+	def get(self, key, default=None, csn=None):
+		"""Return the value of `key`. If `csn` is given, the value is only returned if it was stored with the same entryCSN."""
+		with self._lock:
+			entry = self._lookup(key, csn)
+			if entry is None:
+				self.misses += 1
+				return default
+			self.hits += 1
+			return entry[0]
+
+	def set(self, key, value, csn=None):
+		"""Store `value` for `key`, optionally together with the entryCSN of the LDAP object it was read from."""
+		if not self.enabled:
+			return
+		with self._lock:
+			self._entries.pop(key, None)
+			self._entries[key] = (value, csn, None if self.ttl is None else time.time() + self.ttl)
+			while len(self._entries) > self.maxsize:
+				self._entries.popitem(last=False)
+				self.evictions += 1
+
+	def invalidate(self, key):
+		with self._lock:
+			self._entries.pop(key, None)
+
+	def invalidate_attrs(self, dn, attr):
+		"""Drop the attributes `attr` of the LDAP object `dn` stored by :func:`get_attrs`."""
+		self.invalidate((dn.lower(), tuple(attr)))
+
+	def clear(self):
+		with self._lock:
+			self._entries.clear()
+
+	def set_ttl(self, ttl):
+		"""Change the time to live of new entries; all entries are dropped if the cache is disabled."""
+		self.ttl = ttl
+		if not self.enabled:
+			self.clear()
+
+	def get_attrs(self, lo, dn, attr):
+		"""Return the attributes `attr` of the LDAP object `dn` like :func:`lo.get`.
+
+		Expired entries are revalidated by reading the entryCSN of the object,
+		the attributes are only read again if it has changed."""
+		if not self.enabled:
+			return lo.get(dn, attr=list(attr))
+		key = (dn.lower(), tuple(attr))
+		with self._lock:
+			entry = self._entries.get(key)
+			valid = entry is not None and self._lookup(key, None) is not None
+			if valid:
+				self.hits += 1
+		if valid:
+			return entry[0]
+		if entry is not None and entry[1]:
+			# expired: keep the value if the object has not changed since
+			csn = lo.getAttr(dn, 'entryCSN')
+			if csn and csn[0] == entry[1]:
+				self.set(key, entry[0], entry[1])
+				with self._lock:
+					self.hits += 1
+				return entry[0]
+		with self._lock:
+			self.misses += 1
+		attrs = lo.get(dn, attr=list(attr) + ['entryCSN'])
+		csn = attrs.pop('entryCSN', [None])[0]
+		if attrs:
+			self.set(key, attrs, csn)
+		return attrs
+
+	def statistics(self):
+		return {
+			'size': len(self._entries),
+			'maxsize': self.maxsize,
+			'ttl': self.ttl,
+			'hits': self.hits,
+			'misses': self.misses,
+			'evictions': self.evictions,
+			'expirations': self.expirations,
+		}
+
+	def _lookup(self, key, csn):
+		entry = self._entries.get(key)
+		if entry is None:
+			return None
+		if entry[2] is not None and entry[2] <= time.time():
+			del self._entries[key]
+			self.expirations += 1
+			return None
+		if csn is not None and entry[1] != csn:
+			del self._entries[key]
+			return None
+		# mark as most recently used
+		del self._entries[key]
+		self._entries[key] = entry
+		return entry
+
+
+def get_cache(name, maxsize=DEFAULT_SIZE, ttl=DEFAULT_TTL):
+	"""Return the cache called `name`, which is created with `maxsize` and `ttl` on first use."""
+	with _caches_lock:
+		try:
+			return _caches[name]
+		except KeyError:
+			univention.debug.debug(univention.debug.ADMIN, univention.debug.INFO, 'cache: creating %s (maxsize=%r, ttl=%r)' % (name, maxsize, ttl))
+			cache = _caches[name] = Cache(name, maxsize, ttl)
+			return cache
+
+
+def statistics():
+	"""Return the statistics of all caches of this process, e.g. `{'name': {'hits': 1, 'misses': 2, ...}}`."""
+	with _caches_lock:
+		caches = _caches.values()
+	return dict((cache.name, cache.statistics()) for cache in caches)
+
+
+def format_statistics():
+	"""Return one line with the statistics of each cache of this process, for processes with their own logging."""
+	return ['cache %s: %s' % (name, ', '.join('%s=%s' % item for item in sorted(stats.items()))) for name, stats in sorted(statistics().items())]
+
+
+def log_statistics(level=univention.debug.PROCESS):
+	for line in format_statistics():
+		univention.debug.debug(univention.debug.ADMIN, level, line)
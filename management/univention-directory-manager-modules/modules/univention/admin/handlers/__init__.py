@@ -50,12 +50,14 @@ import traceback
 
 import ipaddr
 import ldap
-from ldap.filter import filter_format
+from ldap.filter import filter_format, escape_filter_chars
 from ldap.dn import explode_rdn, explode_dn, escape_dn_chars, str2dn, dn2str
 from ldap.controls.readentry import PostReadControl
+from ldap.controls.libldap import MatchedValuesControl
 
 import univention.debug
 
+import univention.admin.cache
 import univention.admin.filter
 import univention.admin.uldap
 import univention.admin.mapping
@@ -89,6 +91,47 @@ def disable_ad_restrictions(disable=True):
 	_prevent_to_change_ad_properties = disable
 
 
+# maximum number of assertions OR'ed into one prefetch search
+PREFETCH_CHUNK = 500
+
+# gidNumber of the primary groups by their DN, invalidated by groups/group when a group is created, changed, moved or removed
+cache_gidNumber = univention.admin.cache.get_cache('gidNumber')
+
+
+def normalize_dn(dn):
+	try:
+		return DN(dn.lower())
+	except ValueError:
+		return dn.lower()
+
+
+def prefetch_search(lo, base, scope, template, attribute, wanted, attr, normalize=lambda value: value.lower(), matched_values=False):
+	"""Replaces many searches which only differ in the value of `attribute` by a few combined searches.
+
+	:param template: The search filter with a `%s` placeholder for the OR'ed assertions on `attribute`.
+	:param wanted: A list of `(value, results)` tuples. Each entry whose `attribute` matches `value`
+		is appended to the list `results` (only once, even if several values of the same list match).
+	:param attr: The attributes to fetch; `attribute` is added to it.
+	:param normalize: Function to compare the values of `attribute` case insensitive.
+	:param matched_values: Only fetch the values of `attribute` which match, e.g. the searched members
+		instead of all members of large groups. Only use it if `attr` contains no other real attributes.
+	"""
+	index = {}
+	for value, results in wanted:
+		index.setdefault(normalize(value), []).append(results)
+	values = sorted(set(value for value, results in wanted))
+	for i in range(0, len(values), PREFETCH_CHUNK):
+		assertions = ''.join('(%s=%s)' % (attribute, escape_filter_chars(value)) for value in values[i:i + PREFETCH_CHUNK])
+		# servers without support for the matched values control return all values
+		serverctrls = [MatchedValuesControl(False, '(%s)' % (assertions,))] if matched_values else None
+		for dn, attrs in lo.search(template % ('(|%s)' % (assertions,),), base=base, scope=scope, attr=attr + [attribute], unique=False, serverctrls=serverctrls):
+			targets = []
+			for value in set(normalize(value) for value in attrs.get(attribute, [])):
+				targets.extend(results for results in index.get(value, []) if not any(results is target for target in targets))
+			for results in targets:
+				results.append((dn, attrs))
+
+
 class simpleLdap(object):
 	"""The base class for all UDM handler modules.
 
@@ -149,6 +192,10 @@ class simpleLdap(object):
 			Properties should be assigned in the following way: obj['name'] = 'value'
 	"""
 
+	_prefetched = None  # results of the searches done by open(), see open_many()
+	_partial = False  # only some LDAP attributes were loaded, see lookup(properties=...)
+	_partial_loading = True  # False if __init__() of the class takes more than the properties from the LDAP attributes
+
 	def __init__(self, co, lo, position, dn='', superordinate=None, attributes=None):
 		self._exists = False
 		self.exceptions = []
@@ -222,6 +269,13 @@ class simpleLdap(object):
 			except ldap.NO_SUCH_OBJECT:
 				raise univention.admin.uexceptions.noObject(self.dn)
 
+		self._unmap_oldattr()
+		self.save()
+
+		self._validate_superordinate()
+
+	def _unmap_oldattr(self):
+		"""Sets the properties, policies and options from the LDAP attributes in :attr:`oldattr`."""
 		if self.oldattr:
 			self._exists = True
 			if not univention.admin.modules.recognize(self.module, self.dn, self.oldattr):
@@ -234,9 +288,6 @@ class simpleLdap(object):
 
 		self.policies = self.oldattr.get('univentionPolicyReference', [])
 		self.__set_options()
-		self.save()
-
-		self._validate_superordinate()
 
 	def save(self):
 		"""Saves the current internal object state as old state for later comparision when e.g. modifying this object.
@@ -256,11 +307,12 @@ class simpleLdap(object):
 	def diff(self):
 		"""Returns the difference between old and current state as a UDM modlist."""
 		changes = []
+		options = set(self.options)
 
 		for key, prop in self.descriptions.items():
 			null = [] if prop.multivalue else None
 			# remove properties which are disabled by options
-			if prop.options and not set(prop.options) & set(self.options):
+			if prop.options and options.isdisjoint(prop.options):
 				if self.oldinfo.get(key, null) not in (null, None):
 					univention.debug.debug(univention.debug.ADMIN, univention.debug.INFO, "simpleLdap.diff: key %s not valid (option not set)" % key)
 					changes.append((key, self.oldinfo[key], null))
@@ -516,6 +568,9 @@ class simpleLdap(object):
 		if not self.exists():
 			raise univention.admin.uexceptions.noObject(self.dn)
 
+		if self._partial:
+			raise univention.admin.uexceptions.invalidOperation(_('The object %s was loaded partially and must be opened before it can be modified.') % (self.dn,))
+
 		if not isinstance(response, dict):
 			response = {}
 
@@ -736,10 +791,11 @@ class simpleLdap(object):
 	def get_gid_for_primary_group(self):
 		gidNum = '99999'
 		if self['primaryGroup']:
-			try:
-				gidNum = self.lo.getAttr(self['primaryGroup'], 'gidNumber', required=True)[0]
-			except ldap.NO_SUCH_OBJECT:
+			# the gidNumber of a group can not be changed, many objects share the same primary group
+			gidNum = cache_gidNumber.get_attrs(self.lo, self['primaryGroup'], ['gidNumber']).get('gidNumber')
+			if not gidNum:
 				raise univention.admin.uexceptions.primaryGroup(self['primaryGroup'])
+			gidNum = gidNum[0]
 		return gidNum
 
 	def get_sid_for_primary_group(self):
@@ -881,11 +937,58 @@ class simpleLdap(object):
 				If your are going to do any modifications (such as creating, modifying, moving, removing this object)
 				this method must be called directly after the constructor and before modifying any property.
 		"""
+		if self._partial:
+			self._load_all_attributes()
 		self._open = True
 		self.exceptions = []
 		self.call_udm_property_hook('hook_open', self)
 		self.save()
 
+	def _open_search(self, filter, base='', scope='sub', attr=[]):
+		"""Searches entries related to this object while opening it.
+
+			When the object is opened by :func:`univention.admin.handlers.simpleLdap.open_many` the results
+			have already been fetched together with the ones of the other objects.
+		"""
+		if self._prefetched is not None and filter in self._prefetched:
+			return self._prefetched[filter]
+		return self.lo.search(filter=filter, base=base, scope=scope, attr=attr, unique=False)
+
+	@classmethod
+	def open_many(cls, objects):
+		"""Opens all `objects`, which may be of different modules.
+
+			The searches for related entries :func:`univention.admin.handlers.simpleLdap.open` of the modules
+			does per object are done with a few combined searches for all objects instead,
+			see :func:`univention.admin.handlers.simpleLdap._prefetch_open`.
+
+			:returns: The list of objects.
+		"""
+		objects = list(objects)
+		classes = {}
+		for obj in objects:
+			classes.setdefault(type(obj), []).append(obj)
+		prefetched = {}
+		for klass, objs in classes.items():
+			prefetched.update(klass._prefetch_open(objs))
+		for obj in objects:
+			obj._prefetched = prefetched.get(obj.dn)
+			try:
+				obj.open()
+			finally:
+				del obj._prefetched
+		return objects
+
+	@classmethod
+	def _prefetch_open(cls, objects):
+		"""Fetches the entries :func:`univention.admin.handlers.simpleLdap.open` searches for the given `objects` of this class.
+			This method can be subclassed.
+
+			:returns: A dict mapping the DN of each object to a dict of the filters it passes to
+				:func:`univention.admin.handlers.simpleLdap._open_search` and their results.
+		"""
+		return {}
+
 	def _remove_option(self, name):
 		"""Removes the UDM option if it is set."""
 		if name in self.options:
@@ -1394,17 +1497,48 @@ class simpleLdap(object):
 		return 'synced' in flags and 'docker' not in flags
 
 	@classmethod
-	def lookup(cls, co, lo, filter_s, base='', superordinate=None, scope='sub', unique=False, required=False, timeout=-1, sizelimit=0):
+	def lookup(cls, co, lo, filter_s, base='', superordinate=None, scope='sub', unique=False, required=False, timeout=-1, sizelimit=0, properties=None):
+		"""Search for objects of this module.
+
+		:param properties: If given, only the LDAP attributes of these UDM properties are fetched, if possible.
+			The other properties of such objects are not valid and they must be opened before they can be modified.
+		"""
 		filter_str = unicode(cls.lookup_filter(filter_s, lo) or '')
-		attr = cls._ldap_attributes()
+		attr = cls._ldap_projection(properties)
+		partial = attr is not None
+		if not partial:
+			attr = cls._ldap_attributes()
 		result = []
 		for dn, attrs in lo.search(filter_str, base, scope, attr, unique, required, timeout, sizelimit):
 			try:
-				result.append(cls(co, lo, None, dn=dn, superordinate=superordinate, attributes=attrs))
+				obj = cls(co, lo, None, dn=dn, superordinate=superordinate, attributes=attrs)
 			except univention.admin.uexceptions.base as exc:
 				univention.debug.debug(univention.debug.ADMIN, univention.debug.ERROR, 'lookup() of object %r failed: %s' % (dn, exc))
+				continue
+			obj._partial = partial
+			result.append(obj)
 		return result
 
+	@classmethod
+	def lookup_iter(cls, co, lo, filter_s, base='', superordinate=None, scope='sub', unique=False, required=False, timeout=-1, sizelimit=0, properties=None, page_size=1000):
+		"""Like lookup(), but search paged and yield the objects as the results arrive.
+
+		:param page_size: The number of entries per page; 0 streams a single search without paging, see :func:`univention.uldap.access.search_iter`.
+		"""
+		filter_str = unicode(cls.lookup_filter(filter_s, lo) or '')
+		attr = cls._ldap_projection(properties)
+		partial = attr is not None
+		if not partial:
+			attr = cls._ldap_attributes()
+		for dn, attrs in lo.search_iter(filter_str, base, scope, attr, unique, required, timeout, sizelimit, page_size=page_size):
+			try:
+				obj = cls(co, lo, None, dn=dn, superordinate=superordinate, attributes=attrs)
+			except univention.admin.uexceptions.base as exc:
+				univention.debug.debug(univention.debug.ADMIN, univention.debug.ERROR, 'lookup() of object %r failed: %s' % (dn, exc))
+				continue
+			obj._partial = partial
+			yield obj
+
 	@classmethod
 	def lookup_filter(cls, filter_s=None, lo=None):
 		filter_p = cls.unmapped_lookup_filter()
@@ -1423,9 +1557,43 @@ class simpleLdap(object):
 	def _ldap_attributes(cls):
 		return []
 
+	@classmethod
+	def _ldap_projection(cls, properties):
+		"""Return the LDAP attributes needed to unmap the given UDM properties,
+		or None if all attributes are needed, e.g. for properties which are not a plain mapping of an attribute."""
+		if properties is None:
+			return None
+		if not cls._partial_loading or cls._post_unmap.im_func is not simpleLdap._post_unmap.im_func or cls.description.im_func is not simpleLdap.description.im_func:
+			return None
+		mapping = univention.admin.modules.get(cls.module).mapping
+		unmap_plan, unmap_functions = mapping._get_unmap_plan()
+		computed = set(key for key, func in unmap_functions)
+		attributes = set(['objectClass', 'univentionObjectFlag', 'univentionObjectType'])
+		attributes.update(attr for attr in cls._ldap_attributes() if attr not in ('*', '+'))
+		for name in properties:
+			attr = mapping.mapName(name)
+			if not attr or name in computed or unmap_plan.get(attr, (None,))[0] != name:
+				return None
+			attributes.add(attr)
+		return sorted(attributes)
+
+	def _load_all_attributes(self):
+		"""Load all LDAP attributes of a partially loaded object and set its properties from them again."""
+		univention.debug.debug(univention.debug.ADMIN, univention.debug.INFO, 'loading all attributes of partially loaded %s' % (self.dn,))
+		try:
+			self.oldattr = self.lo.get(self.dn, attr=self._ldap_attributes(), required=True)
+		except ldap.NO_SUCH_OBJECT:
+			raise univention.admin.uexceptions.noObject(self.dn)
+		self._partial = False
+		self.info = {}
+		self._unmap_oldattr()
+		self.save()
+
 
 class simpleComputer(simpleLdap):
 
+	_partial_loading = False  # the IP addresses are taken from the LDAP attributes in __init__()
+
 	def __init__(self, co, lo, position, dn='', superordinate=None, attributes=[]):
 		simpleLdap.__init__(self, co, lo, position, dn, superordinate, attributes)
 
@@ -1532,7 +1700,7 @@ class simpleComputer(simpleLdap):
 
 			searchFilter = filter_format('(&(objectClass=dNSZone)(relativeDomainName=%s)(!(cNAMERecord=*)))', [self['name']])
 			try:
-				result = self.lo.search(base=tmppos.getBase(), scope='domain', filter=searchFilter, attr=['zoneName', 'aRecord', 'aAAARecord'], unique=False)
+				result = self._open_search(base=tmppos.getBase(), scope='domain', filter=searchFilter, attr=['zoneName', 'aRecord', 'aAAARecord'])
 
 				zoneNames = []
 
@@ -1550,7 +1718,7 @@ class simpleComputer(simpleLdap):
 						searchFilter = filter_format('(&(objectClass=dNSZone)(zoneName=%s)(relativeDomainName=@))', [zoneName[0]])
 
 						try:
-							results = self.lo.searchDn(base=tmppos.getBase(), scope='domain', filter=searchFilter, unique=False)
+							results = [dn for dn, attr in self._open_search(base=tmppos.getBase(), scope='domain', filter=searchFilter, attr=['dn'])]
 						except univention.admin.uexceptions.insufficientInformation, msg:
 							raise univention.admin.uexceptions.insufficientInformation, msg
 
@@ -1569,7 +1737,7 @@ class simpleComputer(simpleLdap):
 				for zoneName in zoneNames:
 					searchFilter = filter_format('(&(objectClass=dNSZone)(|(PTRRecord=%s)(PTRRecord=%s.%s.)))', (self['name'], self['name'], zoneName[0]))
 					try:
-						results = self.lo.search(base=tmppos.getBase(), scope='domain', attr=['relativeDomainName', 'zoneName'], filter=searchFilter, unique=False)
+						results = self._open_search(base=tmppos.getBase(), scope='domain', attr=['relativeDomainName', 'zoneName'], filter=searchFilter)
 						for dn, attr in results:
 							ip = self.__ip_from_ptr(attr['zoneName'][0], attr['relativeDomainName'][0])
 							if not self.__is_ip(ip):
@@ -1587,7 +1755,7 @@ class simpleComputer(simpleLdap):
 				for zoneName in zoneNames:
 					searchFilter = filter_format('(&(objectClass=dNSZone)(|(cNAMERecord=%s)(cNAMERecord=%s.%s.)))', (self['name'], self['name'], zoneName[0]))
 					try:
-						results = self.lo.search(base=tmppos.getBase(), scope='domain', attr=['relativeDomainName', 'cNAMERecord', 'zoneName'], filter=searchFilter, unique=False)
+						results = self._open_search(base=tmppos.getBase(), scope='domain', attr=['relativeDomainName', 'cNAMERecord', 'zoneName'], filter=searchFilter)
 						for dn, attr in results:
 							dnsAlias = attr['relativeDomainName'][0]
 							self['dnsAlias'].append(dnsAlias)
@@ -1616,7 +1784,7 @@ class simpleComputer(simpleLdap):
 					searchFilter = filter_format('(&(dhcpHWAddress=%s)(objectClass=univentionDhcpHost))', (ethernet,))
 					univention.debug.debug(univention.debug.ADMIN, univention.debug.INFO, 'open: DHCP; we search for "%s"' % searchFilter)
 					try:
-						results = self.lo.search(base=tmppos.getBase(), scope='domain', attr=['univentionDhcpFixedAddress'], filter=searchFilter, unique=False)
+						results = self._open_search(base=tmppos.getBase(), scope='domain', attr=['univentionDhcpFixedAddress'], filter=searchFilter)
 						univention.debug.debug(univention.debug.ADMIN, univention.debug.INFO, 'open: DHCP; the result: "%s"' % results)
 						for dn, attr in results:
 							service = self.lo.parentDn(dn)
@@ -1640,12 +1808,65 @@ class simpleComputer(simpleLdap):
 				self.old_network = self['network']
 
 			# get groupmembership
-			result = self.lo.search(base=self.lo.base, filter=filter_format('(&(objectclass=univentionGroup)(uniqueMember=%s))', [self.dn]), attr=['dn'])
+			result = self._open_search(base=self.lo.base, filter=filter_format('(&(objectclass=univentionGroup)(uniqueMember=%s))', [self.dn]), attr=['dn'])
 			self['groups'] = [(x[0]) for x in result]
 
 		if 'name' in self.info and 'domain' in self.info:
 			self.info['fqdn'] = '%s.%s' % (self['name'], self['domain'])
 
+	@classmethod
+	def _prefetch_open(cls, objects):
+		prefetched = super(simpleComputer, cls)._prefetch_open(objects)
+		domains = {}
+		for obj in objects:
+			prefetched.setdefault(obj.dn, {})
+			domains.setdefault(obj.position.getDomain(), []).append(obj)
+
+		for base, objs in domains.items():
+			lo = objs[0].lo
+			named = [obj for obj in objs if obj['name']]
+
+			# DNS host records
+			wanted = []
+			for obj in named:
+				results = prefetched[obj.dn][filter_format('(&(objectClass=dNSZone)(relativeDomainName=%s)(!(cNAMERecord=*)))', [obj['name']])] = []
+				wanted.append((obj['name'], results))
+			prefetch_search(lo, base, 'domain', '(&(objectClass=dNSZone)%s(!(cNAMERecord=*)))', 'relativeDomainName', wanted, ['zoneName', 'aRecord', 'aAAARecord'])
+
+			# zones, pointer and alias records of the zones the hosts are in
+			zones, ptrs, aliases = {}, [], []
+			for obj, (name, records) in zip(named, wanted):
+				for zone in [attr['zoneName'][0] for dn, attr in records if 'aRecord' in attr or 'aAAARecord' in attr]:
+					searchFilter = filter_format('(&(objectClass=dNSZone)(zoneName=%s)(relativeDomainName=@))', [zone])
+					prefetched[obj.dn][searchFilter] = zones.setdefault(zone.lower(), (zone, []))[1]
+					results = prefetched[obj.dn][filter_format('(&(objectClass=dNSZone)(|(PTRRecord=%s)(PTRRecord=%s.%s.)))', (name, name, zone))] = []
+					ptrs.extend([(name, results), ('%s.%s.' % (name, zone), results)])
+					results = prefetched[obj.dn][filter_format('(&(objectClass=dNSZone)(|(cNAMERecord=%s)(cNAMERecord=%s.%s.)))', (name, name, zone))] = []
+					aliases.extend([(name, results), ('%s.%s.' % (name, zone), results)])
+			prefetch_search(lo, base, 'domain', '(&(objectClass=dNSZone)%s(relativeDomainName=@))', 'zoneName', zones.values(), ['dn'])
+			prefetch_search(lo, base, 'domain', '(&(objectClass=dNSZone)%s)', 'PTRRecord', ptrs, ['relativeDomainName', 'zoneName'])
+			prefetch_search(lo, base, 'domain', '(&(objectClass=dNSZone)%s)', 'cNAMERecord', aliases, ['relativeDomainName', 'zoneName'])
+
+			# DHCP hosts
+			wanted = []
+			for obj in named:
+				for macAddress in obj['mac']:
+					if macAddress:
+						ethernet = 'ethernet ' + macAddress
+						results = prefetched[obj.dn][filter_format('(&(dhcpHWAddress=%s)(objectClass=univentionDhcpHost))', (ethernet,))] = []
+						wanted.append((ethernet, results))
+			prefetch_search(lo, base, 'domain', '(&%s(objectClass=univentionDhcpHost))', 'dhcpHWAddress', wanted, ['univentionDhcpFixedAddress'])
+
+		# group memberships
+		existing = [obj for obj in objects if obj.exists()]
+		if existing:
+			wanted = []
+			for obj in existing:
+				results = prefetched[obj.dn][filter_format('(&(objectclass=univentionGroup)(uniqueMember=%s))', [obj.dn])] = []
+				wanted.append((obj.dn, results))
+			prefetch_search(existing[0].lo, existing[0].lo.base, 'sub', '(&(objectclass=univentionGroup)%s)', 'uniqueMember', wanted, ['dn'], normalize_dn, matched_values=True)
+		return prefetched
+
 	def __modify_dhcp_object(self, position, mac, ip=None):
 		# identify the dhcp object with the mac address
 
@@ -33,7 +33,8 @@
 import copy
 import time
 import ldap
-from ldap.filter import filter_format
+from ldap.filter import filter_format, escape_filter_chars
+from ldap.controls.libldap import MatchedValuesControl
 
 import univention.admin
 from univention.admin.layout import Tab, Group
@@ -41,10 +42,12 @@ import univention.admin.uldap
 import univention.admin.filter
 import univention.admin.handlers
 import univention.admin.allocators
+import univention.admin.cache
 import univention.admin.localization
 import univention.debug
 from univention.admin import configRegistry
 from univention.admin.uldap import DN
+from univention.admin.handlers import PREFETCH_CHUNK, normalize_dn, prefetch_search
 
 translation = univention.admin.localization.translation('univention.admin.handlers.groups')
 _ = translation.translate
@@ -318,49 +321,53 @@ def _case_insensitive_remove_from_list(dn, list):
 	return list
 
 
-class AgingCache(object):
-
-	def __new__(type, *args, **kwargs):
-		# Falls es noch keine Instanz dieser Klasse gibt, wird eine erstellt und in _the_instance abgelegt.
-		# Diese wird dann jedes mal zurückgegeben.
-		if '_the_instance' not in type.__dict__:
-			type._the_instance = object.__new__(type, *args, **kwargs)
-		return type._the_instance
-
-	def __init__(self):
-		if '_ready' not in dir(self):
-			self._ready = True
-			self.timeout = 300
-			self.data = {}
-			self.timer = {}
-
-	def is_valid(self, item):
-		if item in self.timer:
-			if self.timer.get(item, -1) > time.time():
-				return True
-			del self.timer[item]
-			del self.data[item]
-		return False
-
-	def get(self, item):
-		return self.data.get(item, {})
-
-	def set(self, item, data):
-		if not isinstance(data, dict):
-			raise Exception('AgingCache.set() requires a dict as data value')
-		self.data[item] = copy.deepcopy(data)
-		self.timer[item] = time.time() + self.timeout
-
-	def remove(self, item):
-		if item in self.timer:
-			del self.timer[item]
-			del self.data[item]
-
-	def set_timeout(self, timeout):
-		self.timer = timeout
-
-
-cache_uniqueMember = AgingCache()
+def _membership_delta(old, new):
+	"""Return the member DNs to be added and removed when changing the members from `old` to `new`.
+	Values are compared as strings first, only the differing ones are compared as DNs."""
+	old_lower = set(x.lower() for x in old)
+	new_lower = set(x.lower() for x in new)
+	# the same DN may be spelled differently, e.g. "cn=a, dc=b" and "cn=a,dc=b"
+	add = DN.set(x for x in new if x.lower() not in old_lower)
+	remove = DN.set(x for x in old if x.lower() not in new_lower)
+	return list(DN.values(add - remove)), list(DN.values(remove - add))
+
+
+def _get_uid_list(lo, uniqueMembers):
+	"""Return the uids of the given members. The uid is taken from the RDN if possible, the
+	uids of all other members are fetched with a few combined searches."""
+	result = []
+	wanted = []
+	for uniqueMember in uniqueMembers:
+		rdn = ldap.dn.str2dn(uniqueMember)[0]
+		try:
+			result.append([x[1] for x in rdn if x[0].lower() == 'uid'][0])
+		except IndexError:
+			# UID is not stored in DN --> fetch UID by DN
+			wanted.append((uniqueMember, []))
+	if wanted:
+		prefetch_search(lo, '', 'sub', '(&(uid=*)%s)', 'entryDN', wanted, ['uid'], normalize=normalize_dn)
+	for uniqueMember, results in wanted:
+		# a group have no uid attribute, see Bug #12644
+		for dn, attrs in results:
+			uid_list = attrs.get('uid', [])
+			result.append(uid_list[0])
+			if len(uid_list) > 1:
+				univention.debug.debug(univention.debug.ADMIN, univention.debug.WARN, 'groups/group: A groupmember has multiple UIDs (%s %r)' % (uniqueMember, uid_list))
+	return result
+
+
+def _ucr_int(key, default):
+	try:
+		return int(configRegistry.get(key, default))
+	except ValueError:
+		return default
+
+
+# type of the members which are not users by their DN
+cache_uniqueMember = univention.admin.cache.get_cache(
+	'groups/group uniqueMember',
+	maxsize=_ucr_int('directory/manager/web/modules/groups/group/caching/uniqueMember/size', 10000),
+	ttl=_ucr_int('directory/manager/web/modules/groups/group/caching/uniqueMember/timeout', 300))
 
 
 class object(univention.admin.handlers.simpleLdap):
@@ -369,12 +376,6 @@ class object(univention.admin.handlers.simpleLdap):
 	def open(self):
 		univention.admin.handlers.simpleLdap.open(self)
 
-		try:
-			caching_timeout = int(configRegistry.get('directory/manager/web/modules/groups/group/caching/uniqueMember/timeout', '300'))
-			self.cache_uniqueMember.set_timeout(caching_timeout)
-		except:
-			pass
-
 		if 'samba' in self.options:
 			sid = self.oldattr.get('sambaSID', [''])[0]
 			pos = sid.rfind('-')
@@ -389,28 +390,23 @@ class object(univention.admin.handlers.simpleLdap):
 			self['hosts'] = []
 			self['nestedGroup'] = []
 			for i in self.oldattr.get('uniqueMember', []):
-				if cache_uniqueMember.is_valid(i):
-					membertype = cache_uniqueMember.get(i).get('type')
-					if membertype == 'user':
-						self['users'].append(i)
-					elif membertype == 'group':
-						self['nestedGroup'].append(i)
-					elif membertype == 'host':
-						self['hosts'].append(i)
-				elif i.startswith('uid='):
+				if i.startswith('uid='):
+					# no need to cache these, keeps opening groups with many users fast
 					self['users'].append(i)
-					cache_uniqueMember.set(i, {'type': 'user'})
 				else:
-					result = self.lo.getAttr(i, 'objectClass')
-					if result:
+					membertype = cache_uniqueMember.get(i)
+					if membertype is None:
+						result = self.lo.getAttr(i, 'objectClass')
 						if 'univentionGroup' in result:
-							self['nestedGroup'].append(i)
-							cache_uniqueMember.set(i, {'type': 'group'})
+							membertype = 'group'
+							cache_uniqueMember.set(i, membertype)
 						elif 'univentionHost' in result:
-							self['hosts'].append(i)
-							cache_uniqueMember.set(i, {'type': 'host'})
-						else:
-							self['users'].append(i)
+							membertype = 'host'
+							cache_uniqueMember.set(i, membertype)
+					if membertype == 'group':
+						self['nestedGroup'].append(i)
+					elif membertype == 'host':
+						self['hosts'].append(i)
 					else:
 						# removing following line breaks deletion of computers from groups
 						self['users'].append(i)
@@ -423,77 +419,78 @@ class object(univention.admin.handlers.simpleLdap):
 
 			self.save()
 
+	def _get_member_values(self, memberdnlist, uidlist):
+		"""Return the values of uniqueMember and memberUid of this group matching the given DNs and uids,
+		as dicts from the normalized value to the stored value. Only the matching values are transferred."""
+		members = {}
+		uids = {}
+		assertions = ['(uniqueMember=%s)' % (escape_filter_chars(x),) for x in set(memberdnlist) if x]
+		assertions += ['(memberUid=%s)' % (escape_filter_chars(x),) for x in set(uidlist) if x]
+		for i in range(0, len(assertions), PREFETCH_CHUNK):
+			# servers without support for the matched values control return all values
+			ctrl = MatchedValuesControl(False, '(%s)' % (''.join(assertions[i:i + PREFETCH_CHUNK]),))
+			for dn, attrs in self.lo.search(base=self.dn, scope='base', attr=['uniqueMember', 'memberUid'], serverctrls=[ctrl]):
+				for value in attrs.get('uniqueMember', []):
+					members[normalize_dn(value)] = value
+				for value in attrs.get('memberUid', []):
+					uids[value.lower()] = value
+		return members, uids
+
+	def _modify_members(self, ml, ignore_license=0):
+		if ml:
+			try:
+				return self.lo.modify(self.dn, ml, ignore_license=ignore_license)
+			except ldap.NO_SUCH_OBJECT, msg:
+				raise univention.admin.uexceptions.noObject
+			except ldap.INSUFFICIENT_ACCESS, msg:
+				raise univention.admin.uexceptions.permissionDenied
+			except ldap.LDAPError, msg:
+				raise univention.admin.uexceptions.ldapError(msg[0]['desc'])
+
+		# return True if object has been modified
+		return bool(ml)
+
 	def fast_member_add(self, memberdnlist, uidlist):
 		ml = []
-		uids = []
-		members = []
-		searchResult = self.lo.get(self.dn, attr=['uniqueMember', 'memberUid'])
-		if searchResult:
-			uids = searchResult.get('memberUid', [])
-			members = searchResult.get('uniqueMember', [])
+		members, uids = self._get_member_values(memberdnlist, uidlist)
 
 		add_uidlist = []
 		for uid in uidlist:
-			if uid and not _case_insensitive_in_list(uid, uids):
+			if uid and uid.lower() not in uids:
+				uids[uid.lower()] = uid
 				add_uidlist.append(uid)
 		if add_uidlist:
 			ml.append(('memberUid', '', add_uidlist))
 
 		add_memberdnlist = []
 		for memberdn in memberdnlist:
-			if memberdn and not _case_insensitive_in_list(memberdn, members):
+			if memberdn and normalize_dn(memberdn) not in members:
+				members[normalize_dn(memberdn)] = memberdn
 				add_memberdnlist.append(memberdn)
 		if add_memberdnlist:
 			ml.append(('uniqueMember', '', add_memberdnlist))
 
-		if ml:
-			try:
-				return self.lo.modify(self.dn, ml)
-			except ldap.NO_SUCH_OBJECT, msg:
-				raise univention.admin.uexceptions.noObject
-			except ldap.INSUFFICIENT_ACCESS, msg:
-				raise univention.admin.uexceptions.permissionDenied
-			except ldap.LDAPError, msg:
-				raise univention.admin.uexceptions.ldapError(msg[0]['desc'])
-
-		# return True if object has been modified
-		return bool(ml)
+		return self._modify_members(ml)
 
 	def fast_member_remove(self, memberdnlist, uidlist, ignore_license=0):
 		ml = []
-		uids = []
-		members = []
-		searchResult = self.lo.get(self.dn, attr=['uniqueMember', 'memberUid'])
-		if searchResult:
-			uids = searchResult.get('memberUid', [])
-			members = searchResult.get('uniqueMember', [])
+		members, uids = self._get_member_values(memberdnlist, uidlist)
 
 		remove_uidlist = []
 		for uid in uidlist:
-			if uid and _case_insensitive_in_list(uid, uids):
-				remove_uidlist.append(_case_insensitive_get_item_in_list(uid, uids))
+			if uid and uid.lower() in uids:
+				remove_uidlist.append(uids.pop(uid.lower()))
 		if remove_uidlist:
 			ml.append(('memberUid', remove_uidlist, ''))
 
 		remove_memberdnlist = []
 		for memberdn in memberdnlist:
-			if memberdn and _case_insensitive_in_list(memberdn, members):
-				remove_memberdnlist.append(_case_insensitive_get_item_in_list(memberdn, members))
+			if memberdn and normalize_dn(memberdn) in members:
+				remove_memberdnlist.append(members.pop(normalize_dn(memberdn)))
 		if remove_memberdnlist:
 			ml.append(('uniqueMember', remove_memberdnlist, ''))
 
-		if ml:
-			try:
-				return self.lo.modify(self.dn, ml, ignore_license=ignore_license)
-			except ldap.NO_SUCH_OBJECT, msg:
-				raise univention.admin.uexceptions.noObject
-			except ldap.INSUFFICIENT_ACCESS, msg:
-				raise univention.admin.uexceptions.permissionDenied
-			except ldap.LDAPError, msg:
-				raise univention.admin.uexceptions.ldapError(msg[0]['desc'])
-
-		# return True if object has been modified
-		return bool(ml)
+		return self._modify_members(ml, ignore_license=ignore_license)
 
 	def _check_uid_gid_uniqueness(self):
 		if not configRegistry.is_true("directory/manager/uid_gid/uniqueness", True):
@@ -609,31 +606,10 @@ class object(univention.admin.handlers.simpleLdap):
 				except:
 					raise univention.admin.uexceptions.mailAddressUsed
 
-		old = DN.set(self.oldinfo.get('users', []) + self.oldinfo.get('hosts', []) + self.oldinfo.get('nestedGroup', []))
-		new = DN.set(self.info.get('users', []) + self.info.get('hosts', []) + self.info.get('nestedGroup', []))
-		if old != new:
-			# create lists for uniqueMember entries to be added or removed
-			uniqueMemberAdd = list(DN.values(new - old))
-			uniqueMemberRemove = list(DN.values(old - new))
-			old = list(DN.values(old))
-			new = list(DN.values(new))
-
-			def getUidList(uniqueMembers):
-				result = []
-				for uniqueMember in uniqueMembers:
-					dn = ldap.dn.str2dn(uniqueMember)[0]
-					try:
-						result.append([x[1] for x in dn if x[0].lower() == 'uid'][0])
-					except IndexError:
-						# UID is not stored in DN --> fetch UID by DN
-						uid_list = self.lo.getAttr(uniqueMember, 'uid')
-						# a group have no uid attribute, see Bug #12644
-						if uid_list:
-							result.append(uid_list[0])
-							if len(uid_list) > 1:
-								univention.debug.debug(univention.debug.ADMIN, univention.debug.WARN, 'groups/group: A groupmember has multiple UIDs (%s %r)' % (uniqueMember, uid_list))
-				return result
-
+		uniqueMemberAdd, uniqueMemberRemove = _membership_delta(
+			self.oldinfo.get('users', []) + self.oldinfo.get('hosts', []) + self.oldinfo.get('nestedGroup', []),
+			self.info.get('users', []) + self.info.get('hosts', []) + self.info.get('nestedGroup', []))
+		if uniqueMemberAdd or uniqueMemberRemove:
 			# calling keepCase is not necessary as the LDAP server already handles the case when removing elements
 			# TODO: removable?
 			def keepCase(members, oldMembers):
@@ -641,11 +617,11 @@ class object(univention.admin.handlers.simpleLdap):
 				return [mapping.get(member.lower(), member) for member in members]
 
 			# create lists for memberUid entries to be added or removed
-			memberUidAdd = getUidList(uniqueMemberAdd)
-			memberUidRemove = getUidList(uniqueMemberRemove)
+			memberUidAdd = _get_uid_list(self.lo, uniqueMemberAdd)
+			memberUidRemove = _get_uid_list(self.lo, uniqueMemberRemove)
 
 			if uniqueMemberRemove:
-				uniqueMemberRemove = keepCase(uniqueMemberRemove, old)
+				uniqueMemberRemove = keepCase(uniqueMemberRemove, self.oldattr.get('uniqueMember', []))
 				ml.append(('uniqueMember', uniqueMemberRemove, ''))
 
 			if uniqueMemberAdd:
@@ -674,6 +650,7 @@ class object(univention.admin.handlers.simpleLdap):
 
 	def _ldap_post_create(self):
 		univention.admin.allocators.release(self.lo, self.position, 'groupName', value=self['name'])
+		self._invalidate_caches(self.dn)
 		if 'posix' in self.options:
 			univention.admin.allocators.confirm(self.lo, self.position, 'gidNumber', self.gidNum)
 		if 'samba' in self.options:
@@ -683,12 +660,19 @@ class object(univention.admin.handlers.simpleLdap):
 		self.__update_membership()
 
 	def _ldap_post_modify(self):
+		self._invalidate_caches(self.dn)
 		if self.hasChanged('mailAddress') and self['mailAddress']:
 			univention.admin.allocators.confirm(self.lo, self.position, 'mailPrimaryAddress', self['mailAddress'])
 		self.__update_membership()
 		if hasattr(self, 'groupSid'):
 			self._update_sambaPrimaryGroupSID(self.oldattr.get('sambaSID', [])[0], self.groupSid)
 
+	@staticmethod
+	def _invalidate_caches(dn):
+		# a group may be created again with the same DN but another gidNumber
+		cache_uniqueMember.invalidate(dn)
+		univention.admin.handlers.cache_gidNumber.invalidate_attrs(dn, ['gidNumber'])
+
 	def _ldap_pre_remove(self):
 		if not hasattr(self, "options"):
 			self.open()
@@ -707,6 +691,7 @@ class object(univention.admin.handlers.simpleLdap):
 				raise univention.admin.uexceptions.primaryGroupUsed
 
 	def _ldap_post_remove(self):
+		self._invalidate_caches(self.dn)
 		if 'posix' in self.options:
 			univention.admin.allocators.release(self.lo, self.position, 'gidNumber', self.gidNum)
 		if 'samba' in self.options:
@@ -724,6 +709,7 @@ class object(univention.admin.handlers.simpleLdap):
 			self.__set_membership_attributes(group, members, newmembers)
 
 	def _ldap_post_move(self, olddn):
+		self._invalidate_caches(olddn)
 		settings_module = univention.admin.modules.get('settings/default')
 		settings_object = univention.admin.objects.get(settings_module, None, self.lo, position='', dn='cn=default,cn=univention,%s' % self.lo.base)
 		settings_object.open()
@@ -814,7 +800,15 @@ class object(univention.admin.handlers.simpleLdap):
 			self.__set_membership_attributes(group, members, newmembers)
 
 	def __set_membership_attributes(self, group, members, newmembers):
-		self.lo.modify(group, [('uniqueMember', members, newmembers)])
+		# only send the changed values, supergroups may have many members
+		uniqueMemberAdd, uniqueMemberRemove = _membership_delta(members, newmembers)
+		ml = []
+		if uniqueMemberRemove:
+			ml.append(('uniqueMember', uniqueMemberRemove, ''))
+		if uniqueMemberAdd:
+			ml.append(('uniqueMember', '', uniqueMemberAdd))
+		if ml:
+			self.lo.modify(group, ml)
 		# don't set the memberUid attribute for nested groups, see Bug #11868
 		# uids = self.lo.getAttr( group, 'memberUid' )
 		# newuids = map(lambda x: x[x.find('=') + 1: x.find(',')], newmembers)
@@ -842,9 +836,6 @@ class object(univention.admin.handlers.simpleLdap):
 		if configRegistry.get('directory/manager/web/modules/groups/group/checks/circular_dependency', 'yes').lower() in ('no', 'false', '0'):
 			return
 
-		grpdn2childgrpdns = {}
-		grp_module = univention.admin.modules.get('groups/group')
-
 		cn = self.info.get('name', 'UNKNOWN')
 
 		# test self dependency
@@ -853,6 +844,10 @@ class object(univention.admin.handlers.simpleLdap):
 			if self.dn.lower() in [x.lower() for x in self.info.get(field, [])]:
 				raise univention.admin.uexceptions.circularGroupDependency('%s ==> %s' % (cn, cn))
 
+		# a cycle through this group requires nested groups
+		if not self.info.get('nestedGroup'):
+			return
+
 		# test short dependencies: A -> B -> A
 		# ==> intersection of nestedGroup and memberOf is not empty
 		set_nestedGroup = set([x.lower() for x in self.info.get('nestedGroup', [])])
@@ -860,11 +855,12 @@ class object(univention.admin.handlers.simpleLdap):
 		set_intersection = set_nestedGroup & set_memberOf
 		if set_intersection:
 			childdn = list(set_intersection)[0]
-			# get cn for first detected object
-			childobj = univention.admin.objects.get(grp_module, self.co, self.lo, position='', dn=childdn)
-			childcn = childobj.info.get('name', 'UNKNOWN')
+			childcn = (self.lo.getAttr(childdn, 'cn') or ['UNKNOWN'])[0]
 			raise univention.admin.uexceptions.circularGroupDependency('%s ==> %s ==> %s' % (childcn, cn, childcn))
 
+		grpdn2cn, grpdn2childgrpdns = self._get_group_graph()
+		grpdn2cn[self.dn.lower()] = cn
+
 		# test long dependencies: A -> B -> C -> A
 		if self.info.get('memberOf'):   # TODO: FIXME:  perform extended check only if self.hasChanged('memberOf') is True
 			# if user added some groups to memberOf, the group objects specified in memberOf do not contain self als
@@ -872,35 +868,44 @@ class object(univention.admin.handlers.simpleLdap):
 			# with each member of memberOf as parent
 			for upgrp in self.info.get('memberOf', []):
 				for subgrp in self.info.get('nestedGroup', []):
-					self._check_group_childs_for_recursion(grp_module, grpdn2childgrpdns, subgrp.lower(), [upgrp.lower(), self.dn.lower()])
+					self._check_group_childs_for_recursion(grpdn2cn, grpdn2childgrpdns, subgrp.lower(), [upgrp.lower(), self.dn.lower()])
 		else:
 			for subgrp in self.info.get('nestedGroup', []):
-				self._check_group_childs_for_recursion(grp_module, grpdn2childgrpdns, subgrp.lower(), [self.dn.lower()])
-
-	def _check_group_childs_for_recursion(self, grp_module, grpdn2childgrpdns, dn, parents=[]):
-		if dn not in grpdn2childgrpdns:
-			grpobj = univention.admin.objects.get(grp_module, self.co, self.lo, position='', dn=dn)
-			grpobj.open()
-			childs = grpobj.info.get('nestedGroup', [])
-			grpdn2childgrpdns[dn] = childs
-		else:
-			childs = grpdn2childgrpdns[dn]
-
-		new_parents = parents + [dn]
-		for childgrp in childs:
-			if childgrp.lower() in new_parents:
-				dnCircle = new_parents[new_parents.index(childgrp.lower()):] + [childgrp.lower()]
-				cnCircle = []
-				# get missing cn's if required
-				grpdn2cn = {self.dn.lower(): self.info.get('name', 'UNKNOWN')}
-				for x in dnCircle:
-					if not x.lower() in grpdn2cn:
-						xobj = univention.admin.objects.get(grp_module, self.co, self.lo, position='', dn=x)
-						grpdn2cn[x.lower()] = xobj.info.get('name', 'UNKNOWN')
-					cnCircle.append(grpdn2cn[x.lower()])
-				raise univention.admin.uexceptions.circularGroupDependency(' ==> '.join(cnCircle))
-
-			self._check_group_childs_for_recursion(grp_module, grpdn2childgrpdns, childgrp.lower(), new_parents)
+				self._check_group_childs_for_recursion(grpdn2cn, grpdn2childgrpdns, subgrp.lower(), [self.dn.lower()])
+
+	def _get_group_graph(self):
+		"""Return the cn and the nested groups of all groups, read by a single
+		LDAP search. All DNs are lower case."""
+		grpdn2cn = {}
+		grpdn2members = {}
+		for dn, attrs in self.lo.search(filter='(objectClass=univentionGroup)', attr=['cn', 'uniqueMember']):
+			dn = dn.lower()
+			grpdn2cn[dn] = attrs.get('cn', ['UNKNOWN'])[0]
+			grpdn2members[dn] = attrs.get('uniqueMember', [])
+
+		grpdn2childgrpdns = {}
+		for dn, members in grpdn2members.iteritems():
+			grpdn2childgrpdns[dn] = [x.lower() for x in members if x.lower() in grpdn2cn]
+		return grpdn2cn, grpdn2childgrpdns
+
+	def _check_group_childs_for_recursion(self, grpdn2cn, grpdn2childgrpdns, dn, parents=[]):
+		# iterative depth first search, a group is only descended into once
+		visited = set()
+		stack = [(dn, parents)]
+		while stack:
+			dn, parents = stack.pop()
+			new_parents = parents + [dn]
+			childs = grpdn2childgrpdns.get(dn, [])
+			for childgrp in childs:
+				if childgrp in new_parents:
+					dnCircle = new_parents[new_parents.index(childgrp):] + [childgrp]
+					cnCircle = [grpdn2cn.get(x, 'UNKNOWN') for x in dnCircle]
+					raise univention.admin.uexceptions.circularGroupDependency(' ==> '.join(cnCircle))
+			if dn in visited:
+				continue
+			visited.add(dn)
+			for childgrp in reversed(childs):
+				stack.append((childgrp, new_parents))
 
 	def __is_groupType_universal(self, adGroupType):
 		try:
@@ -213,6 +213,7 @@ register_policy_mapping(mapping)
 
 class object(univention.admin.handlers.simplePolicy):
 	module = module
+	_partial_loading = False  # the cron properties are parsed in __init__()
 
 	def __init__(self, co, lo, position, dn='', superordinate=None, attributes=[]):
 		univention.admin.handlers.simplePolicy.__init__(self, co, lo, position, dn, superordinate, attributes)
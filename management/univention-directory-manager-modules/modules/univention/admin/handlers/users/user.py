@@ -1534,16 +1534,37 @@ class object(univention.admin.handlers.simpleLdap, mungeddial.Support):
 		self._load_groups(loadGroups)
 		self.save()
 
+	@classmethod
+	def _prefetch_open(cls, objects):
+		prefetched = super(object, cls)._prefetch_open(objects)
+		existing = [obj for obj in objects if obj.exists()]
+		if not existing:
+			return prefetched
+		lo = existing[0].lo
+
+		groups, primary = [], []
+		for obj in existing:
+			searches = prefetched.setdefault(obj.dn, {})
+			results = searches[filter_format('(&(cn=*)(|(objectClass=univentionGroup)(objectClass=sambaGroupMapping))(uniqueMember=%s))', [obj.dn])] = []
+			groups.append((obj.dn, results))
+			primaryGroupNumber = obj.oldattr.get('gidNumber', [''])[0]
+			if primaryGroupNumber:
+				results = searches[filter_format('(&(cn=*)(|(objectClass=posixGroup)(objectClass=sambaGroupMapping))(gidNumber=%s))', [primaryGroupNumber])] = []
+				primary.append((primaryGroupNumber, results))
+		univention.admin.handlers.prefetch_search(lo, '', 'sub', '(&(cn=*)(|(objectClass=univentionGroup)(objectClass=sambaGroupMapping))%s)', 'uniqueMember', groups, ['dn'], univention.admin.handlers.normalize_dn, matched_values=True)
+		univention.admin.handlers.prefetch_search(lo, '', 'sub', '(&(cn=*)(|(objectClass=posixGroup)(objectClass=sambaGroupMapping))%s)', 'gidNumber', primary, ['dn'])
+		return prefetched
+
 	def _load_groups(self, loadGroups):
 		if self.exists():
 			self.groupsLoaded = loadGroups
 			if loadGroups:  # this is optional because it can take much time on larger installations, default is true
-				self['groups'] = self.lo.searchDn(filter=filter_format('(&(cn=*)(|(objectClass=univentionGroup)(objectClass=sambaGroupMapping))(uniqueMember=%s))', [self.dn]))
+				self['groups'] = [dn for dn, attr in self._open_search(filter=filter_format('(&(cn=*)(|(objectClass=univentionGroup)(objectClass=sambaGroupMapping))(uniqueMember=%s))', [self.dn]), attr=['dn'])]
 			else:
 				univention.debug.debug(univention.debug.ADMIN, univention.debug.INFO, 'user: open with loadGroups=false for user %s' % self['username'])
 			primaryGroupNumber = self.oldattr.get('gidNumber', [''])[0]
 			if primaryGroupNumber:
-				primaryGroupResult = self.lo.searchDn(filter=filter_format('(&(cn=*)(|(objectClass=posixGroup)(objectClass=sambaGroupMapping))(gidNumber=%s))', [primaryGroupNumber]))
+				primaryGroupResult = [dn for dn, attr in self._open_search(filter=filter_format('(&(cn=*)(|(objectClass=posixGroup)(objectClass=sambaGroupMapping))(gidNumber=%s))', [primaryGroupNumber]), attr=['dn'])]
 				if primaryGroupResult:
 					self['primaryGroup'] = primaryGroupResult[0]
 				else:
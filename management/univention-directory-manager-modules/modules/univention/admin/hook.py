@@ -46,20 +46,33 @@ _ = translation.translate
 #
 
 
+_hook_files_stamp = None
+
+
 def import_hook_files():
+	global _hook_files_stamp
+	hook_files = []
 	for dir in sys.path:
 		if os.path.exists(os.path.join(dir, 'univention/admin/hook.py')):
 			if os.path.isdir(os.path.join(dir, 'univention/admin/hooks.d/')):
 				for f in os.listdir(os.path.join(dir, 'univention/admin/hooks.d/')):
 					if f.endswith('.py'):
-						fn = os.path.join(dir, 'univention/admin/hooks.d/', f)
-						try:
-							with open(fn, 'r') as fd:
-								exec fd in sys.modules[__name__].__dict__
-							univention.debug.debug(univention.debug.ADMIN, univention.debug.INFO, 'admin.syntax.import_hook_files: importing "%s"' % fn)
-						except:
-							univention.debug.debug(univention.debug.ADMIN, univention.debug.ERROR, 'admin.syntax.import_hook_files: loading %s failed' % fn)
-							univention.debug.debug(univention.debug.ADMIN, univention.debug.ERROR, 'admin.syntax.import_hook_files: TRACEBACK:\n%s' % traceback.format_exc())
+						hook_files.append(os.path.join(dir, 'univention/admin/hooks.d/', f))
+
+	# the files only need to be executed again if they changed
+	stamp = univention.admin.files_stamp(hook_files)
+	if stamp == _hook_files_stamp:
+		return
+	_hook_files_stamp = stamp
+
+	for fn in hook_files:
+		try:
+			with open(fn, 'r') as fd:
+				exec fd in sys.modules[__name__].__dict__
+			univention.debug.debug(univention.debug.ADMIN, univention.debug.INFO, 'admin.syntax.import_hook_files: importing "%s"' % fn)
+		except:
+			univention.debug.debug(univention.debug.ADMIN, univention.debug.ERROR, 'admin.syntax.import_hook_files: loading %s failed' % fn)
+			univention.debug.debug(univention.debug.ADMIN, univention.debug.ERROR, 'admin.syntax.import_hook_files: TRACEBACK:\n%s' % traceback.format_exc())
 
 
 class simpleHook(object):
@@ -209,6 +209,12 @@ class dontMap(object):
 	pass
 
 
+# kinds of value conversion in a compiled mapping plan
+_COPY = 0  # use the value as it is
+_FIRST = 1  # ListToString(), inlined
+_CALL = 2  # call the registered function
+
+
 class mapping(object):
 	"""
 	Map LDAP atribute names and values to UDM property names and values and back.
@@ -219,6 +225,8 @@ class mapping(object):
 		self._unmap = {}
 		self._map_func = {}
 		self._unmap_func = {}
+		self._map_plan = None
+		self._unmap_plan = None
 
 	def register(self, map_name, unmap_name, map_value=None, unmap_value=None):
 		"""
@@ -227,15 +235,62 @@ class mapping(object):
 		"""
 		self._map[map_name] = (unmap_name, map_value)
 		self._unmap[unmap_name] = (map_name, unmap_value)
+		self._map_plan = self._unmap_plan = None
 
 	def unregister(self, map_name):
 		self._map.pop(map_name, None)
+		self._map_plan = None
 		# unregister() is used by LDAP_Search syntax classes with viewonly=True.
 		# See SimpleLdap._init_ldap_search().
 		# So, don't remove the value from self._unmap.
 
 	def registerUnmapping(self, unmap_name, unmap_value):
 		self._unmap_func[unmap_name] = unmap_value
+		self._unmap_plan = None
+
+	def compile(self):
+		"""
+		Build the plans used by :func:`mapDict`, :func:`mapDiff` and :func:`unmapValues`,
+		so mapping an object does not need to look up each name several times.
+		The plans are rebuilt automatically after the mapping has been changed.
+
+		>>> map = mapping()
+		>>> map.register('udm', 'ldap', None, ListToString)
+		>>> map.register('nomap', 'nomap', dontMap(), dontMap())
+		>>> map.compile()
+		>>> map._unmap_plan[0]['ldap'][:2]
+		('udm', 1)
+		>>> sorted(map._map_plan)
+		['udm']
+		"""
+		unmap = {}
+		for unmap_name, (map_name, unmap_value) in self._unmap.items():
+			if isinstance(unmap_value, dontMap):
+				continue
+			if not unmap_value:
+				kind = _COPY
+			elif unmap_value is ListToString:
+				kind = _FIRST
+			else:
+				kind = _CALL
+			unmap[unmap_name] = (map_name, kind, unmap_value)
+		self._unmap_plan = (unmap, tuple(self._unmap_func.items()))
+
+		self._map_plan = dict(
+			(map_name, (unmap_name, map_value, map_name == 'sambaLogonHours'))
+			for map_name, (unmap_name, map_value) in self._map.items()
+			if not isinstance(map_value, dontMap)
+		)
+
+	def _get_unmap_plan(self):
+		if self._unmap_plan is None:
+			self.compile()
+		return self._unmap_plan
+
+	def _get_map_plan(self):
+		if self._map_plan is None:
+			self.compile()
+		return self._map_plan
 
 	def mapName(self, map_name):
 		"""
@@ -287,15 +342,8 @@ class mapping(object):
 		[0]
 		"""
 		map_value = self._map[map_name][1]
-
-		if not value:
-			return ''
-
-		if not any(value) and map_name != 'sambaLogonHours':
-			# sambaLogonHours might be [0], see Bug #33703
-			return ''
-
-		return map_value(value) if map_value else value
+		# sambaLogonHours might be [0], see Bug #33703
+		return _mapValue(map_value, map_name == 'sambaLogonHours', value)
 
 	def unmapValue(self, unmap_name, value):
 		"""
@@ -319,7 +367,7 @@ class mapping(object):
 	def unmapValues(self, oldattr):
 		"""Unmaps LDAP attribute values to UDM property values"""
 		info = mapDict(self, oldattr)
-		for key, func in self._unmap_func.items():
+		for key, func in self._get_unmap_plan()[1]:
 			info[key] = func(oldattr)
 		return info
 
@@ -369,15 +417,22 @@ def mapDict(mapping, old):
 	"""
 	new = {}
 	if old:
-		for key, value in old.items():
+		plan = mapping._get_unmap_plan()[0]
+		for key, value in old.iteritems():
 			try:
-				if not mapping.shouldUnmap(key):
-					continue
-				k = mapping.unmapName(key)
-				v = mapping.unmapValue(key, value)
+				k, kind, func = plan[key]
 			except KeyError:
 				continue
-			new[k] = v
+			if kind == _FIRST:
+				# fast path for single valued strings
+				new[k] = value[0] if value else ''
+			elif kind == _CALL:
+				try:
+					new[k] = func(value)
+				except KeyError:
+					continue
+			else:
+				new[k] = value
 	return new
 
 
@@ -423,13 +478,12 @@ def mapDiff(mapping, diff):
 	"""
 	ml = []
 	if diff:
+		plan = mapping._get_map_plan()
 		for key, oldvalue, newvalue in diff:
 			try:
-				if not mapping.shouldMap(key):
-					continue
-				k = mapping.mapName(key)
-				ov = mapping.mapValue(key, oldvalue)
-				nv = mapping.mapValue(key, newvalue)
+				k, func, keep_falsy = plan[key]
+				ov = _mapValue(func, keep_falsy, oldvalue)
+				nv = _mapValue(func, keep_falsy, newvalue)
 			except KeyError:
 				continue
 			if k and ov != nv:
@@ -437,6 +491,15 @@ def mapDiff(mapping, diff):
 	return ml
 
 
+def _mapValue(map_value, keep_falsy, value):
+	"""mapping.mapValue() for an entry of the compiled plan."""
+	if not value:
+		return ''
+	if not keep_falsy and not any(value):
+		return ''
+	return map_value(value) if map_value else value
+
+
 def mapDiffAl(mapping, diff):  # UNUSED
 	"""
 	Convert mod-list of UDM property names/values to add-list of LDAP attribute names/values.
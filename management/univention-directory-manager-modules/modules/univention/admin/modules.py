@@ -37,6 +37,7 @@ import types
 import copy
 import locale
 import imp
+import cPickle
 import ldap
 from ldap.filter import filter_format
 
@@ -45,54 +46,270 @@ import univention.admin
 import univention.admin.uldap
 import univention.admin.syntax
 import univention.admin.hook
+import univention.admin.cache
 from univention.admin import localization
 from univention.admin.layout import Tab, Group, ILayoutElement
 
 translation = localization.translation('univention/admin')
 _ = translation.translate
 
-modules = {}
+MANIFEST = '/var/cache/univention-directory-manager/modules.manifest'
+MANIFEST_VERSION = 2
+
+
+class _LazyModule(object):
+	"""Placeholder for a handler module which is not imported yet."""
+	__slots__ = ('mod',)
+
+	def __init__(self, mod):
+		self.mod = mod
+
+	def load(self):
+		ud.debug(ud.ADMIN, ud.INFO, 'admin.modules: importing "%s"' % self.mod)
+		__import__(self.mod)
+		m = sys.modules[self.mod]
+		m.initialized = 0
+		return m
+
+
+class _Modules(dict):
+	"""Maps the module names to the handler modules.
+	Modules known from the manifest are imported on their first access."""
+
+	def _load(self, name):
+		m = dict.__getitem__(self, name)
+		if isinstance(m, _LazyModule):
+			m = m.load()
+			dict.__setitem__(self, name, m)
+		return m
+
+	def __getitem__(self, name):
+		return self._load(name)
+
+	def get(self, name, default=None):
+		if name in self:
+			return self._load(name)
+		return default
+
+	def pop(self, name, *default):
+		if name in self:
+			m = self._load(name)
+			del self[name]
+			return m
+		return dict.pop(self, name, *default)
+
+	def values(self):
+		return [self._load(name) for name in self.keys()]
+
+	def items(self):
+		return [(name, self._load(name)) for name in self.keys()]
+
+	def itervalues(self):
+		return iter(self.values())
+
+	def iteritems(self):
+		return iter(self.items())
+
+	def copy(self):
+		return type(self)(dict.items(self))
+
+
+modules = _Modules()
 _superordinates = set()  # list of all module names (strings) that are _superordinates
+# module name: (childs, object classes of which identify() needs one or None), from the manifest
+_hints = {}
 containers = []
+# (objectClasses, module_base): ((module name, whether identify() looks at further attributes), ...)
+_identified = univention.admin.cache.get_cache('modules identify', maxsize=1000, ttl=None)
+
+
+class _AttributeRecorder(dict):
+	"""Records which attributes an identify() function looks at."""
+
+	def __init__(self, attr):
+		dict.__init__(self, attr)
+		self.accessed = set()
+
+	def __getitem__(self, key):
+		self.accessed.add(key)
+		return dict.__getitem__(self, key)
+
+	def get(self, key, default=None):
+		self.accessed.add(key)
+		return dict.get(self, key, default)
+
+	def __contains__(self, key):
+		self.accessed.add(key)
+		return dict.__contains__(self, key)
+
+	def has_key(self, key):
+		return key in self
+
+	def __iter__(self):
+		self.accessed.add(None)
+		return dict.__iter__(self)
+
+	def keys(self):
+		self.accessed.add(None)
+		return dict.keys(self)
+
+	def items(self):
+		self.accessed.add(None)
+		return dict.items(self)
+
+	def iteritems(self):
+		self.accessed.add(None)
+		return dict.iteritems(self)
+
+	def values(self):
+		self.accessed.add(None)
+		return dict.values(self)
+
+	def itervalues(self):
+		self.accessed.add(None)
+		return dict.itervalues(self)
+
+
+class _ProbeError(Exception):
+	pass
+
+
+class _Probe(object):
+	"""Stands for the DN or the object classes when probing an identify() function.
+	Only `in` tests are recorded, everything else aborts the probe."""
+
+	def __init__(self):
+		self.tested = set()
+		self.aborted = False
+
+	def _abort(self, operation):
+		self.aborted = True  # even if identify() catches the exception
+		raise _ProbeError(operation)
+
+	def __contains__(self, value):
+		self.tested.add(value)
+		return False
+
+	def __getattr__(self, name):
+		self._abort(name)
+
+	def __eq__(self, other):
+		self._abort('==')
+
+	def __ne__(self, other):
+		self._abort('!=')
+
+	def __nonzero__(self):
+		self._abort('bool')
+
+
+def _identify_hint(module):
+	"""Return the object classes of which an object needs at least one to be identified by the module,
+	or None if its identify() function looks at anything else than the object classes."""
+	identify = getattr(module, 'identify', None)
+	if identify is None:
+		return frozenset()
+	dn = _Probe()
+	object_classes = _Probe()
+	attr = _AttributeRecorder({'objectClass': object_classes})
+	try:
+		found = identify(dn, attr)
+	except Exception:  # anything else than testing the object classes
+		return None
+	if found or dn.tested or dn.aborted or object_classes.aborted or not attr.accessed <= set(['objectClass']):
+		return None
+	# an object without any of the tested object classes takes the same path
+	return frozenset(object_classes.tested)
+
+
+def _handler_files():
+	"""Return the handler files as list of (path, module, mtime, size) for all directories in sys.path."""
+	files = []
+	for root in sys.path:
+		handlers = os.path.join(root, 'univention/admin/handlers')
+		if not os.path.isdir(handlers):
+			continue
+		for dir, dirs, names in os.walk(handlers):
+			dirs.sort()
+			for file in sorted(names):
+				if not file.endswith('.py') or file.startswith('__'):
+					continue
+				path = os.path.join(dir, file)
+				try:
+					st = os.stat(path)
+				except OSError:
+					continue
+				mod = path[len(root):-len('.py')].strip(os.path.sep).replace(os.path.sep, '.')
+				files.append((path, mod, st.st_mtime, st.st_size))
+	return files
+
+
+def _load_manifest(stamp):
+	"""Return the cached {name: (import path, superordinate names, childs, identify hint)} if it matches the handler files."""
+	try:
+		with open(MANIFEST, 'rb') as fd:
+			version, cached, manifest = cPickle.load(fd)
+	except (IOError, OSError, EOFError, ValueError, TypeError, cPickle.UnpicklingError):
+		return None
+	if version != MANIFEST_VERSION or cached != stamp:
+		return None
+	return manifest
+
+
+def _save_manifest(stamp, manifest):
+	tmp = '%s.%d' % (MANIFEST, os.getpid())
+	try:
+		with open(tmp, 'wb') as fd:
+			cPickle.dump((MANIFEST_VERSION, stamp, manifest), fd, cPickle.HIGHEST_PROTOCOL)
+		os.rename(tmp, MANIFEST)
+	except (IOError, OSError) as exc:
+		ud.debug(ud.ADMIN, ud.INFO, 'admin.modules.update: could not write manifest: %s' % (exc,))
+		try:
+			os.unlink(tmp)
+		except OSError:
+			pass
 
 
 def update():
 	'''scan handler modules'''
-	global modules, _superordinates
-	_modules = {}
+	global modules, _superordinates, _hints
+	_modules = _Modules()
 	superordinates = set()
+	hints = {}
 
 	# since last update(), syntax.d and hooks.d may have changed (Bug #31154)
 	univention.admin.syntax.import_syntax_files()
 	univention.admin.hook.import_hook_files()
 
-	def _walk(root, dir, files):
-		for file in files:
-			if not file.endswith('.py') or file.startswith('__'):
-				continue
-			p = os.path.join(dir, file).replace(root, '').replace('.py', '')
-			p = p[1:]
-			ud.debug(ud.ADMIN, ud.INFO, 'admin.modules.update: importing "%s"' % p)
-			parts = p.split(os.path.sep)
-			mod, name = '.'.join(parts), '/'.join(parts)
-			m = __import__(mod, globals(), locals(), name)
-			m.initialized = 0
+	stamp = _handler_files()
+	manifest = _load_manifest(stamp)
+	if manifest is None:
+		manifest = {}
+		for path, mod, mtime, size in stamp:
+			ud.debug(ud.ADMIN, ud.INFO, 'admin.modules.update: importing "%s"' % mod)
+			__import__(mod)
+			m = sys.modules[mod]
 			if not hasattr(m, 'module'):
 				ud.debug(ud.ADMIN, ud.ERROR, 'admin.modules.update: attribute "module" is missing in module %r' % (mod,))
 				continue
-			_modules[m.module] = m
-			if isContainer(m):
-				containers.append(m)
+			manifest[m.module] = (mod, superordinate_names(m), getattr(m, 'childs', 0), _identify_hint(m))
+		_save_manifest(stamp, manifest)
 
-			superordinates.update(superordinate_names(m))
+	for name, (mod, supers, childs, identify_hint) in manifest.items():
+		m = sys.modules.get(mod)
+		if m is None:  # import on first use
+			_modules[name] = _LazyModule(mod)
+		else:
+			m.initialized = 0
+			_modules[name] = m
+		superordinates.update(supers)
+		hints[name] = (childs, identify_hint)
 
-	for p in sys.path:
-		dir = os.path.join(p, 'univention/admin/handlers')
-		if not os.path.isdir(dir):
-			continue
-		os.path.walk(dir, _walk, p)
 	modules = _modules
 	_superordinates = superordinates
+	_hints = hints
+	_identified.clear()
+	containers[:] = [modules[name] for name in sorted(modules) if name.startswith('container/')]
 
 
 def get(module):
@@ -184,6 +401,10 @@ def init(lo, position, module, template_object=None, force_reload=False):
 	# re-build layout if there any overwrites defined
 	univention.admin.ucr_overwrite_module_layout(module)
 
+	# the mapping is complete now, including extended attributes
+	if hasattr(module, 'mapping'):
+		module.mapping.compile()
+
 	module.initialized = 1
 
 
@@ -529,20 +750,18 @@ def update_extended_attributes(lo, module, position):
 
 
 def identify(dn, attr, module_name='', canonical=0, module_base=None):
+	"""Return the modules which handle the LDAP object `dn` with the attributes `attr`.
 
+	The result of the identify() functions of the modules which only look at
+	the objectClass is remembered for each combination of object classes."""
 	global modules
 	res = []
 	if 'univentionObjectType' in attr and attr['univentionObjectType'] and attr['univentionObjectType'][0] in modules:
 		res.append(modules.get(attr['univentionObjectType'][0]))
 	else:
-		for name, module in modules.items():
-			if module_base is not None and not name.startswith(module_base):
-				continue
-			if not hasattr(module, 'identify'):
-				ud.debug(ud.ADMIN, ud.INFO, 'module %s does not provide identify' % module)
-				continue
-
-			if (not module_name or module_name == module.module) and module.identify(dn, attr):
+		for name, dependent in _identify_object_classes(dn, attr, module_base):
+			module = modules[name]
+			if (not module_name or module_name == module.module) and (not dependent or module.identify(dn, attr)):
 				res.append(module)
 	if not res:
 		ud.debug(ud.ADMIN, ud.INFO, 'object could not be identified')
@@ -551,6 +770,35 @@ def identify(dn, attr, module_name='', canonical=0, module_base=None):
 	return res
 
 
+def _identify_object_classes(dn, attr, module_base):
+	"""Return the names of the modules which may handle objects with the object classes of `attr`,
+	together with a flag whether their identify() function has to be asked for every object."""
+	object_classes = frozenset(attr.get('objectClass', []))
+	key = (object_classes, module_base)
+	result = _identified.get(key)
+	if result is not None:
+		return result
+	result = []
+	for name in modules.keys():
+		if module_base is not None and not name.startswith(module_base):
+			continue
+		identify_hint = _hints.get(name, (None, None))[1]
+		if identify_hint is not None and identify_hint.isdisjoint(object_classes):
+			continue  # without importing the module
+		module = modules[name]
+		if not hasattr(module, 'identify'):
+			ud.debug(ud.ADMIN, ud.INFO, 'module %s does not provide identify' % module)
+			continue
+		recorder = _AttributeRecorder(attr)
+		found = module.identify(dn, recorder)
+		dependent = not recorder.accessed <= set(['objectClass'])
+		if found or dependent:
+			result.append((name, dependent))
+	result = tuple(result)
+	_identified.set(key, result)
+	return result
+
+
 def identifyOne(dn, attr, type=''):
 
 	res = identify(dn, attr, type)
@@ -713,6 +961,8 @@ def long_description(module_name):
 
 def childs(module_name):
 	'''return whether module may have subordinate modules'''
+	if isinstance(module_name, types.StringTypes) and module_name in _hints:
+		return _hints[module_name][0]
 	module = get(module_name)
 	return getattr(module, 'childs', 0)
 
@@ -723,18 +973,31 @@ def virtual(module_name):
 	return getattr(module, 'virtual', False)
 
 
-def lookup(module_name, co, lo, filter='', base='', superordinate=None, scope='base+one', unique=False, required=False, timeout=-1, sizelimit=0):
-	'''return objects of module that match the given criteria'''
+def lookup(module_name, co, lo, filter='', base='', superordinate=None, scope='base+one', unique=False, required=False, timeout=-1, sizelimit=0, properties=None):
+	'''return objects of module that match the given criteria
+
+	If the list of UDM `properties` is given and the module uses the generic lookup,
+	only the LDAP attributes of these properties are fetched, see :func:`univention.admin.handlers.simpleLdap.lookup`.'''
 	module = get(module_name)
 	tmpres = []
 
 	if hasattr(module, 'lookup'):
-		tmpres = module.lookup(co, lo, filter, base=base, superordinate=superordinate, scope=scope, unique=unique, required=required, timeout=timeout, sizelimit=sizelimit)
+		kwargs = {}
+		if properties is not None and supports_projection(module):
+			kwargs['properties'] = properties
+		tmpres = module.lookup(co, lo, filter, base=base, superordinate=superordinate, scope=scope, unique=unique, required=required, timeout=timeout, sizelimit=sizelimit, **kwargs)
 
 	# check for 'None' items just in case...
 	return [item for item in tmpres if item]
 
 
+def supports_projection(module_name):
+	"""Check if the module uses the generic lookup, which can fetch only the attributes of some properties."""
+	module = get(module_name)
+	obj = getattr(module, 'object', None)
+	return hasattr(obj, '_ldap_projection') and getattr(module, 'lookup', None) == obj.lookup
+
+
 def quickDescription(module_name, dn):
 	module = get(module_name)
 	rdn = univention.admin.uldap.explodeDn(dn, 1)[0]
@@ -834,9 +1097,7 @@ def policiesGroup(module_name):
 def policies():
 	global modules
 	res = {}
-	for mod in modules.values():
-		if not isPolicy(mod):
-			continue
+	for mod in [modules[name] for name in modules.keys() if name.startswith('policies/')]:
 		if not name(mod) == 'policies/policy':
 			res.setdefault(policiesGroup(mod), []).append(name(mod))
 	if not res:
@@ -857,8 +1118,11 @@ def policyTypes(module_name):
 
 	if not module_name or module_name not in modules:
 		return res
-	for name, module in modules.items():
-		if not name.startswith('policies/') or not hasattr(module, 'policy_apply_to'):
+	for name in modules.keys():
+		if not name.startswith('policies/'):
+			continue
+		module = modules[name]
+		if not hasattr(module, 'policy_apply_to'):
 			continue
 		if module_name in module.policy_apply_to:
 			res.append(name)
@@ -64,26 +64,37 @@ _ = translation.translate
 #
 
 
+_syntax_files_stamp = None
+
+
 def import_syntax_files():
 	global _  # don't allow syntax to overwrite our global _ function.
+	global _syntax_files_stamp
 	gettext = _
+	syntax_files = []
 	for dir_ in sys.path:
 		syntax_py = os.path.join(dir_, 'univention/admin/syntax.py')
 		syntax_d = os.path.join(dir_, 'univention/admin/syntax.d/')
 
 		if os.path.exists(syntax_py) and os.path.isdir(syntax_d):
-			syntax_files = (os.path.join(syntax_d, f) for f in os.listdir(syntax_d) if f.endswith('.py'))
+			syntax_files.extend(os.path.join(syntax_d, f) for f in os.listdir(syntax_d) if f.endswith('.py'))
 
-			for fn in syntax_files:
-				try:
-					with open(fn, 'r') as fd:
-						exec fd in sys.modules[__name__].__dict__
-					univention.debug.debug(univention.debug.ADMIN, univention.debug.INFO, 'admin.syntax.import_syntax_files: importing "%s"' % fn)
-				except:
-					univention.debug.debug(univention.debug.ADMIN, univention.debug.ERROR, 'admin.syntax.import_syntax_files: loading %s failed' % fn)
-					univention.debug.debug(univention.debug.ADMIN, univention.debug.ERROR, 'admin.syntax.import_syntax_files: TRACEBACK:\n%s' % traceback.format_exc())
-				finally:
-					_ = gettext
+	# the files only need to be executed again if they changed
+	stamp = univention.admin.files_stamp(syntax_files)
+	if stamp == _syntax_files_stamp:
+		return
+	_syntax_files_stamp = stamp
+
+	for fn in syntax_files:
+		try:
+			with open(fn, 'r') as fd:
+				exec fd in sys.modules[__name__].__dict__
+			univention.debug.debug(univention.debug.ADMIN, univention.debug.INFO, 'admin.syntax.import_syntax_files: importing "%s"' % fn)
+		except:
+			univention.debug.debug(univention.debug.ADMIN, univention.debug.ERROR, 'admin.syntax.import_syntax_files: loading %s failed' % fn)
+			univention.debug.debug(univention.debug.ADMIN, univention.debug.ERROR, 'admin.syntax.import_syntax_files: TRACEBACK:\n%s' % traceback.format_exc())
+		finally:
+			_ = gettext
 
 
 choice_update_functions = []
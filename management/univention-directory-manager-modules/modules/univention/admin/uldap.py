@@ -418,9 +418,9 @@ class access:
 	def getAttr(self, dn, attr, required=False, exceptions=False):
 		return self.lo.getAttr(dn, attr, required)
 
-	def search(self, filter='(objectClass=*)', base='', scope='sub', attr=[], unique=False, required=False, timeout=-1, sizelimit=0):
+	def search(self, filter='(objectClass=*)', base='', scope='sub', attr=[], unique=False, required=False, timeout=-1, sizelimit=0, serverctrls=None):
 		try:
-			return self.lo.search(filter, base, scope, attr, unique, required, timeout, sizelimit)
+			return self.lo.search(filter, base, scope, attr, unique, required, timeout, sizelimit, serverctrls)
 		except ldap.NO_SUCH_OBJECT as msg:
 			raise univention.admin.uexceptions.noObject(_err2str(msg))
 		except ldap.INAPPROPRIATE_MATCHING as msg:
@@ -454,10 +454,41 @@ class access:
 		except ldap.LDAPError as msg:
 			raise univention.admin.uexceptions.ldapError(_err2str(msg), original_exception=msg)
 
+	def search_iter(self, filter='(objectClass=*)', base='', scope='sub', attr=[], unique=False, required=False, timeout=-1, sizelimit=0, page_size=1000):
+		"""Do paged search, yielding (dn, attrs) as the pages arrive."""
+		return self.__iter(self.lo.search_iter(filter, base, scope, attr, unique, required, timeout, sizelimit, page_size=page_size), filter, base)
+
+	def searchDn_iter(self, filter='(objectClass=*)', base='', scope='sub', unique=False, required=False, timeout=-1, sizelimit=0, page_size=1000):
+		"""Do paged search, yielding the dn of each object as the pages arrive."""
+		return self.__iter(self.lo.searchDn_iter(filter, base, scope, unique, required, timeout, sizelimit, page_size=page_size), filter, base)
+
+	def __iter(self, results, filter, base):
+		try:
+			for result in results:
+				yield result
+		except ldap.NO_SUCH_OBJECT as msg:
+			raise univention.admin.uexceptions.noObject(_err2str(msg))
+		except ldap.INAPPROPRIATE_MATCHING as msg:
+			raise univention.admin.uexceptions.insufficientInformation(_err2str(msg))
+		except (ldap.TIMEOUT, ldap.TIMELIMIT_EXCEEDED) as msg:
+			raise univention.admin.uexceptions.ldapTimeout(_err2str(msg))
+		except (ldap.SIZELIMIT_EXCEEDED, ldap.ADMINLIMIT_EXCEEDED) as msg:
+			raise univention.admin.uexceptions.ldapSizelimitExceeded(_err2str(msg))
+		except ldap.FILTER_ERROR as msg:
+			raise univention.admin.uexceptions.ldapError('%s: %s' % (_err2str(msg), filter))
+		except ldap.INVALID_DN_SYNTAX as msg:
+			raise univention.admin.uexceptions.ldapError('%s: %s' % (_err2str(msg), base), original_exception=msg)
+		except ldap.LDAPError as msg:
+			raise univention.admin.uexceptions.ldapError(_err2str(msg), original_exception=msg)
+
 	def getPolicies(self, dn, policies=None, attrs=None, result=None, fixedattrs=None):
 		univention.debug.debug(univention.debug.ADMIN, univention.debug.INFO, 'getPolicies modules dn %s result' % dn)
 		return self.lo.getPolicies(dn, policies, attrs, result, fixedattrs)
 
+	def getPoliciesMany(self, dns):
+		univention.debug.debug(univention.debug.ADMIN, univention.debug.INFO, 'getPoliciesMany modules %d objects' % len(dns))
+		return self.lo.getPoliciesMany(dns)
+
 	def add(self, dn, al, exceptions=False, serverctrls=None, response=None):
 		self._validateLicense()
 		if not self.allow_modify:
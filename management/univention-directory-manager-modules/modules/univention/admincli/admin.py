@@ -46,7 +46,9 @@ import univention.debug
 
 import univention.admin.uexceptions
 import univention.admin.uldap
+import univention.admin.allocators
 import univention.admin.modules
+import univention.admin.handlers
 import univention.admin.objects
 from univention.admin.layout import Group
 from univention.admin.syntax import ldapFilter
@@ -69,6 +71,7 @@ def usage():
 	out.append('Syntax:')
 	out.append('  univention-directory-manager module action [options]')
 	out.append('  univention-directory-manager [--help] [--version]')
+	out.append('  univention-directory-manager --batch [--jobs N] < commands')
 	out.append('')
 	out.append('actions:')
 	out.append('  %-32s %s' % ('create:', 'Create a new object'))
@@ -117,11 +120,18 @@ def usage():
 	out.append('  --%-30s %s' % ('position', 'Search underneath of position in tree'))
 	out.append('  --%-30s %s' % ('policies', 'List policy-based settings:'))
 	out.append('    %-30s %s' % ('', '0:short, 1:long (with policy-DN)'))
+	out.append('  --%-30s %s' % ('properties', 'Only show the given comma separated properties'))
 	out.append('')
 	out.append('move options:')
 	out.append('  --%-30s %s' % ('dn', 'Move object with DN'))
 	out.append('  --%-30s %s' % ('position', 'Move to position in tree'))
 	out.append('')
+	out.append('batch options:')
+	out.append('  --%-30s %s' % ('batch', 'Read one "module action [options]" per line from stdin'))
+	out.append('    %-30s %s' % ('', 'and run them using the same LDAP connection'))
+	out.append('  --%-30s %s' % ('jobs', 'Number of commands run in parallel; they must not'))
+	out.append('    %-30s %s' % ('', 'depend on each other'))
+	out.append('')
 	out.append('Description:')
 	out.append('  univention-directory-manager is a tool to handle the configuration for UCS')
 	out.append('  on command line level.')
@@ -392,10 +402,44 @@ def list_available_modules(o=[]):
 	return o
 
 
-def doit(arglist):
+class Session(object):
+	"""State kept between the requests of an univention-cli-server session:
+	the bound LDAP connections and the modules initialized for them.
+	uidNumber and gidNumber values are allocated in blocks for each connection,
+	call :func:`close` to give the unused IDs back."""
+
+	def __init__(self, range_size=100):
+		self.connections = {}
+		self.initialized = set()
+		self.range_size = range_size
+		self.allocators = []
+
+	def connect(self, **kwargs):
+		key = tuple(sorted(kwargs.items()))
+		try:
+			return self.connections[key]
+		except KeyError:
+			lo = self.connections[key] = univention.admin.uldap.access(**kwargs)
+			if self.range_size:
+				allocator = univention.admin.allocators.RangeAllocator(lo, univention.admin.uldap.position(lo.base), self.range_size)
+				self.allocators.append(allocator.register())
+			return lo
+
+	def close(self):
+		while self.allocators:
+			self.allocators.pop().close()
+
+	def init(self, lo, position, module):
+		key = (id(lo), univention.admin.modules.name(module))
+		if key not in self.initialized:
+			univention.admin.modules.init(lo, position, module)
+			self.initialized.add(key)
+
+
+def doit(arglist, session=None):
 	out = []
 	try:
-		out = _doit(arglist)
+		out = _doit(arglist, session)
 	except ldap.SERVER_DOWN:
 		return out + ["E: The LDAP Server is currently not available.", "OPERATION FAILED"]
 	except univention.admin.uexceptions.base, e:
@@ -423,7 +467,7 @@ def doit(arglist):
 	return out
 
 
-def _doit(arglist):
+def _doit(arglist, session=None):
 
 	out = []
 	# parse module and action
@@ -443,7 +487,7 @@ def _doit(arglist):
 	remove_referring = 0
 	recursive = 1
 	# parse options
-	longopts = ['position=', 'dn=', 'set=', 'append=', 'remove=', 'superordinate=', 'option=', 'append-option=', 'filter=', 'tls=', 'ignore_exists', 'ignore_not_exists', 'logfile=', 'policies=', 'binddn=', 'bindpwd=', 'bindpwdfile=', 'policy-reference=', 'policy-dereference=', 'remove_referring', 'recursive']
+	longopts = ['position=', 'dn=', 'set=', 'append=', 'remove=', 'superordinate=', 'option=', 'append-option=', 'filter=', 'tls=', 'ignore_exists', 'ignore_not_exists', 'logfile=', 'policies=', 'binddn=', 'bindpwd=', 'bindpwdfile=', 'policy-reference=', 'policy-dereference=', 'remove_referring', 'recursive', 'properties=']
 	try:
 		opts, args = getopt.getopt(arglist[3:], '', longopts)
 	except getopt.error, msg:
@@ -476,6 +520,7 @@ def _doit(arglist):
 	remove = {}
 	policy_reference = []
 	policy_dereference = []
+	properties = []
 	for opt, val in opts:
 		if opt == '--position':
 			position_dn = _2utf8(val)
@@ -519,13 +564,15 @@ def _doit(arglist):
 			policy_reference.append(val)
 		elif opt == '--policy-dereference':
 			policy_dereference.append(val)
+		elif opt == '--properties':
+			properties.extend(prop.strip() for prop in val.split(',') if prop.strip())
 
 	if logfile:
 		univention.debug.init(logfile, 1, 0)
 	else:
 		out.append("WARNING: no logfile specified")
 
-	configRegistry = univention.config_registry.ConfigRegistry()
+	configRegistry = univention.config_registry.ConfigRegistry(read_only=True)
 	configRegistry.load()
 
 	if configRegistry.get('ldap/master'):
@@ -546,7 +593,7 @@ def _doit(arglist):
 	if binddn and bindpwd:
 		univention.debug.debug(univention.debug.ADMIN, univention.debug.INFO, "using %s account" % binddn)
 		try:
-			lo = univention.admin.uldap.access(host=configRegistry['ldap/master'], port=int(configRegistry.get('ldap/master/port', '7389')), base=baseDN, binddn=binddn, start_tls=tls, bindpw=bindpwd)
+			lo = (session.connect if session else univention.admin.uldap.access)(host=configRegistry['ldap/master'], port=int(configRegistry.get('ldap/master/port', '7389')), base=baseDN, binddn=binddn, start_tls=tls, bindpw=bindpwd)
 		except Exception, e:
 			univention.debug.debug(univention.debug.ADMIN, univention.debug.WARN, 'authentication error: %s' % str(e))
 			out.append('authentication error: %s' % str(e))
@@ -574,7 +621,7 @@ def _doit(arglist):
 		pwd = re.sub('\n', '', pwdLine)
 
 		try:
-			lo = univention.admin.uldap.access(host=configRegistry['ldap/master'], port=int(configRegistry.get('ldap/master/port', '7389')), base=baseDN, binddn=binddn, bindpw=pwd, start_tls=tls)
+			lo = (session.connect if session else univention.admin.uldap.access)(host=configRegistry['ldap/master'], port=int(configRegistry.get('ldap/master/port', '7389')), base=baseDN, binddn=binddn, bindpw=pwd, start_tls=tls)
 		except Exception, e:
 			univention.debug.debug(univention.debug.ADMIN, univention.debug.WARN, 'authentication error: %s' % str(e))
 			out.append('authentication error: %s' % str(e))
@@ -605,7 +652,10 @@ def _doit(arglist):
 		return list_available_modules(out) + ["OPERATION FAILED"]
 
 	# initialise modules
-	univention.admin.modules.init(lo, position, module)
+	if session:
+		session.init(lo, position, module)
+	else:
+		univention.admin.modules.init(lo, position, module)
 
 	information = module_information(module)
 
@@ -984,12 +1034,17 @@ def _doit(arglist):
 		out.append(_2utf8(filter))
 
 		try:
-			for object in univention.admin.modules.lookup(module, co, lo, scope='sub', superordinate=superordinate, base=position.getDn(), filter=filter):
+			objects = univention.admin.modules.lookup(module, co, lo, scope='sub', superordinate=superordinate, base=position.getDn(), filter=filter, properties=properties or None)
+			if (hasattr(module, 'virtual') and not module.virtual) or not hasattr(module, 'virtual'):
+				# objects which only have the requested properties loaded need not be opened
+				univention.admin.handlers.simpleLdap.open_many([object for object in objects if not getattr(object, '_partial', False)])
+			for object in objects:
 				out.append('DN: %s' % _2utf8(univention.admin.objects.dn(object)))
 
 				if (hasattr(module, 'virtual') and not module.virtual) or not hasattr(module, 'virtual'):
-					object.open()
 					for key, value in sorted(object.items()):
+						if properties and key not in properties:
+							continue
 						if key == 'sambaLogonHours':
 							# returns a list, which breaks things here
 							# better show the bit string. See Bug #33703
@@ -1007,7 +1062,7 @@ def _doit(arglist):
 							else:
 								out.append('  %s: %s' % (_2utf8(key), None))
 
-					if 'univentionPolicyReference' in lo.get(univention.admin.objects.dn(object), ['objectClass'])['objectClass']:
+					if not properties and 'univentionPolicyReference' in lo.get(univention.admin.objects.dn(object), ['objectClass'])['objectClass']:
 						references = lo.get(_2utf8(univention.admin.objects.dn(object)), ['univentionPolicyReference'])
 						if references:
 							for el in references['univentionPolicyReference']:
@@ -798,6 +798,7 @@ define([
 				columns: this._default_columns,
 				moduleStore: _store,
 				footerFormatter: _footerFormatter,
+				pageSize: 100,
 				additionalViews: additionalGridViews,
 				defaultAction: lang.hitch(this, function(keys, items) {
 					if ('navigation' == this.moduleFlavor && (this._searchForm._widgets.objectType.get('value') == '$containers$' || items[0].$childs$ === true)) {
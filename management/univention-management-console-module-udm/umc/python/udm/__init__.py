@@ -52,12 +52,13 @@ from univention.management.console.modules.decorators import simple_response, sa
 from univention.management.console.modules.sanitizers import (
 	Sanitizer, LDAPSearchSanitizer, EmailSanitizer, ChoicesSanitizer,
 	ListSanitizer, StringSanitizer, DictSanitizer, BooleanSanitizer,
-	DNSanitizer
+	DNSanitizer, IntegerSanitizer
 )
 from univention.management.console.modules.mixins import ProgressMixin
 from univention.management.console.log import MODULE
 from univention.management.console.protocol.session import TEMPUPLOADDIR
 
+import univention.admin.cache as udm_cache
 import univention.admin.modules as udm_modules
 import univention.admin.objects as udm_objects
 import univention.admin.uexceptions as udm_errors
@@ -68,7 +69,8 @@ import univention.directory.reports as udr
 
 from .udm_ldap import (
 	UDM_Error, UDM_Module, UDM_Settings,
-	ldap_dn2path, get_module, read_syntax_choices, list_objects, _get_syntax,
+	ldap_dn2path, get_module, read_syntax_choices, list_objects, list_object_dns, _get_syntax,
+	open_cursor, read_cursor,
 	LDAP_Connection, set_bind_function, container_modules,
 	info_syntax_choices, search_syntax_choices_by_key,
 	UserWithoutDN, ObjectDoesNotExist, SuperordinateDoesNotExist, NoIpLeft,
@@ -81,6 +83,9 @@ ADD_ASTERISKS = USE_ASTERISKS and ucr.is_true('directory/manager/web/auto_substr
 
 _ = Translation('univention-management-console-module-udm').translate
 
+# milliseconds between two log messages with the statistics of the caches
+CACHE_STATISTICS_INTERVAL = 3600 * 1000
+
 
 def sanitize_func(sanitizer_func):
 	from univention.management.console.modules.decorators import copy_function_meta_data, sanitize
@@ -157,6 +162,17 @@ class Instance(Base, ProgressMixin):
 		self.settings.user(self.user_dn)
 		self.reports_cfg = udr.Config()
 		self.modules_with_childs = container_modules()
+		notifier.timer_add(CACHE_STATISTICS_INTERVAL, self._log_cache_statistics)
+
+	def destroy(self):
+		for line in udm_cache.format_statistics():
+			MODULE.process(line)
+		super(Instance, self).destroy()
+
+	def _log_cache_statistics(self):
+		for line in udm_cache.format_statistics():
+			MODULE.info(line)
+		notifier.timer_add(CACHE_STATISTICS_INTERVAL, self._log_cache_statistics)
 
 	def set_locale(self, _locale):
 		super(Instance, self).set_locale(_locale)
@@ -518,6 +534,9 @@ class Instance(Base, ProgressMixin):
 		),
 		objectProperty=ObjectPropertySanitizer(required=True),
 		fields=ListSanitizer(),
+		limit=IntegerSanitizer(minimum=1, maximum=1000),
+		start=IntegerSanitizer(minimum=0, default=0),
+		cursor=StringSanitizer(),
 	)
 	def query(self, request):
 		"""Searches for LDAP objects and returns a few properties of the found objects
@@ -530,8 +549,16 @@ class Instance(Base, ProgressMixin):
 			'container' -- the base container where the search should be started (default: LDAP base)
 			'superordinate' -- the superordinate object for the search (default: None)
 			'scope' -- the search scope (default: sub)
+			'limit' -- return only a page of this many results (optional, see below)
+			'start' -- the index of the first result of the page (default: 0)
+			'cursor' -- the cursor of a previous paged query whose results should be returned (optional)
 
 		return: [ { '$dn$' : <LDAP DN>, 'objectType' : <UDM module name>, 'path' : <location of object> }, ... ]
+
+		If a limit is given, the DNs of all matching objects are remembered as
+		cursor and only the objects of the requested page are loaded:
+
+		return: { 'entries' : [ ... ], 'cursor' : <cursor>, 'start' : <index of the first entry>, 'total' : <number of results> }
 		"""
 
 		def _thread(request):
@@ -558,41 +585,67 @@ class Instance(Base, ProgressMixin):
 			scope = request.options.get('scope', 'sub')
 			hidden = request.options.get('hidden')
 			fields = (set(request.options.get('fields', []) or []) | set([objectProperty])) - set(['name', 'None'])
-			result = module.search(container, objectProperty, objectPropertyValue, superordinate, scope=scope, hidden=hidden)
-			if result is None:
-				return []
-
-			entries = []
+			properties = self._query_properties(module, fields)
 			object_type = request.options.get('objectType', request.flavor)
-
-			for obj in result:
-				if obj is None:
-					continue
-				module = get_module(object_type, obj.dn)
-				if module is None:
-					# This happens when concurrent a object is removed between the module.search() and get_module() call
-					MODULE.warn('LDAP object does not exists %s (flavor: %s). The object is ignored.' % (obj.dn, request.flavor))
-					continue
-				entry = {
-					'$dn$': obj.dn,
-					'$childs$': module.childs,
-					'$flags$': obj.oldattr.get('univentionObjectFlag', []),
-					'$operations$': module.operations,
-					'objectType': module.name,
-					'labelObjectType': module.subtitle,
-					'name': module.obj_description(obj),
-					'path': ldap_dn2path(obj.dn, include_rdn=False)
+			limit = request.options.get('limit')
+			if limit is not None:
+				cursor = request.options.get('cursor')
+				if not cursor:
+					cursor = open_cursor(module.search_dns(container, objectProperty, objectPropertyValue, superordinate, scope=scope, hidden=hidden))
+				start = request.options.get('start') or 0
+				total, ldap_dns = read_cursor(cursor, start, limit)
+				result = module.search_window(ldap_dns, container, superordinate, scope=scope, properties=properties)
+				return {
+					'entries': self._query_entries(result, object_type, fields, request.flavor),
+					'cursor': cursor,
+					'start': start,
+					'total': total,
 				}
-				if '$value$' in fields:
-					entry['$value$'] = [module.property_description(obj, column['name']) for column in module.columns]
-				for field in fields - set(module.password_properties) - set(entry.keys()):
-					entry[field] = module.property_description(obj, field)
-				entries.append(entry)
-			return entries
+
+			result = module.search(container, objectProperty, objectPropertyValue, superordinate, scope=scope, hidden=hidden, lazy=True, properties=properties)
+			if result is None:
+				return []
+			return self._query_entries(result, object_type, fields, request.flavor)
 
 		thread = notifier.threads.Simple('Query', notifier.Callback(_thread, request), notifier.Callback(self.thread_finished_callback, request))
 		thread.run()
 
+	def _query_entries(self, result, object_type, fields, flavor):
+		entries = []
+		for obj in result:
+			if obj is None:
+				continue
+			module = get_module(object_type, obj.dn, obj.oldattr)
+			if module is None:
+				# This happens when concurrent a object is removed between the module.search() and get_module() call
+				MODULE.warn('LDAP object does not exists %s (flavor: %s). The object is ignored.' % (obj.dn, flavor))
+				continue
+			entry = {
+				'$dn$': obj.dn,
+				'$childs$': module.childs,
+				'$flags$': obj.oldattr.get('univentionObjectFlag', []),
+				'$operations$': module.operations,
+				'objectType': module.name,
+				'labelObjectType': module.subtitle,
+				'name': module.obj_description(obj),
+				'path': ldap_dn2path(obj.dn, include_rdn=False)
+			}
+			if '$value$' in fields:
+				entry['$value$'] = [module.property_description(obj, column['name']) for column in module.columns]
+			for field in fields - set(module.password_properties) - set(entry.keys()):
+				entry[field] = module.property_description(obj, field)
+			entries.append(entry)
+		return entries
+
+	def _query_properties(self, module, fields):
+		"""The properties of the objects needed to answer a query for `fields`."""
+		properties = set(fields)
+		if '$value$' in fields:
+			properties.update(column['name'] for column in module.columns)
+		properties.add(module.identifies)
+		properties.add(ucr.get('directory/manager/web/modules/%s/display' % (module.name,)))
+		return [prop for prop in properties if prop in getattr(module.module, 'property_descriptions', {})]
+
 	def reports_query(self, request):
 		"""Returns a list of reports for the given object type"""
 		# i18n: translattion for univention-directory-reports
@@ -1029,7 +1082,10 @@ class Instance(Base, ProgressMixin):
 		return result
 
 	@sanitize(
-		container=StringSanitizer(required=True)
+		container=StringSanitizer(required=True),
+		limit=IntegerSanitizer(minimum=1, maximum=1000),
+		start=IntegerSanitizer(minimum=0, default=0),
+		cursor=StringSanitizer(),
 	)
 	@LDAP_Connection
 	def nav_object_query(self, request, ldap_connection=None, ldap_position=None):
@@ -1040,6 +1096,7 @@ class Instance(Base, ProgressMixin):
 			'objectType' -- the object type that should be displayed (optional)
 			'objectProperty' -- the object property that should be scaned (optional)
 			'objectPropertyValue' -- the filter that should b found in the property (optional)
+			'limit', 'start', 'cursor' -- return only a page of the results, see :func:`query`
 
 		return: [ { '$dn$' : <LDAP DN>, 'objectType' : <UDM module name>, 'path' : <location of object> }, ... ]
 		"""
@@ -1058,31 +1115,46 @@ class Instance(Base, ProgressMixin):
 			self.query(request)
 			return
 
-		def _thread(container):
-			entries = []
-			for module, obj in list_objects(container, object_type=object_type):
-				if obj is None:
-					continue
-				if object_type != '$containers$' and module.childs:
-					continue
-				if object_type == '$containers$' and not module.childs:
-					continue
-				entries.append({
-					'$dn$': obj.dn,
-					'$childs$': module.childs,
-					'objectType': module.name,
-					'labelObjectType': module.subtitle,
-					'name': udm_objects.description(obj),
-					'path': ldap_dn2path(obj.dn, include_rdn=False),
-					'$flags$': obj.oldattr.get('univentionObjectFlag', []),
-					'$operations$': module.operations,
-				})
-
-			return entries
+		def _thread(container, options):
+			limit = options.get('limit')
+			if limit is None:
+				return self._nav_object_entries(list_objects(container, object_type=object_type), object_type)
+			cursor = options.get('cursor')
+			if not cursor:
+				cursor = open_cursor(list_object_dns(container, object_type=object_type))
+			start = options.get('start') or 0
+			total, ldap_dns = read_cursor(cursor, start, limit)
+			return {
+				'entries': self._nav_object_entries(list_objects(container, object_type=object_type, ldap_dns=ldap_dns), object_type),
+				'cursor': cursor,
+				'start': start,
+				'total': total,
+			}
 
-		thread = notifier.threads.Simple('NavObjectQuery', notifier.Callback(_thread, request.options['container']), notifier.Callback(self.thread_finished_callback, request))
+		thread = notifier.threads.Simple('NavObjectQuery', notifier.Callback(_thread, request.options['container'], request.options), notifier.Callback(self.thread_finished_callback, request))
 		thread.run()
 
+	def _nav_object_entries(self, objects, object_type):
+		entries = []
+		for module, obj in objects:
+			if obj is None:
+				continue
+			if object_type != '$containers$' and module.childs:
+				continue
+			if object_type == '$containers$' and not module.childs:
+				continue
+			entries.append({
+				'$dn$': obj.dn,
+				'$childs$': module.childs,
+				'objectType': module.name,
+				'labelObjectType': module.subtitle,
+				'name': udm_objects.description(obj),
+				'path': ldap_dn2path(obj.dn, include_rdn=False),
+				'$flags$': obj.oldattr.get('univentionObjectFlag', []),
+				'$operations$': module.operations,
+			})
+		return entries
+
 	@sanitize(DictSanitizer(dict(
 		objectType=StringSanitizer(required=True),
 		policies=ListSanitizer(),
@@ -37,6 +37,7 @@ import re
 import threading
 import traceback
 import gc
+import uuid
 import functools
 
 from univention.management.console import Translation
@@ -53,6 +54,7 @@ import univention.admin.objects as udm_objects
 import univention.admin.syntax as udm_syntax
 import univention.admin.uexceptions as udm_errors
 import univention.admin.mapping as udm_mapping
+import univention.admin.cache as udm_cache
 
 from univention.management.console.modules.udm.syntax import widget, default_value
 
@@ -66,6 +68,9 @@ _ = Translation('univention-management-console-module-udm').translate
 
 udm_modules.update()
 
+# the DNs found by paged queries, see open_cursor()
+_cursors = udm_cache.get_cache('UMC query cursors', maxsize=int(ucr.get('directory/manager/web/cursors/size', '50') or 50), ttl=int(ucr.get('directory/manager/web/cursors/timeout', '900') or 900))
+
 __bind_function = None
 _licenseCheck = 0
 
@@ -192,6 +197,12 @@ class SearchLimitReached(UMC_Error):
 		super(SearchLimitReached, self).__init__(_('The query you have entered yields too many matching entries. Please narrow down your search by specifying more query parameters. The current size limit of %s can be configured with the UCR variable directory/manager/web/sizelimit.') % ucr.get('directory/manager/web/sizelimit', '2000'))
 
 
+class SearchCursorExpired(UMC_Error):
+
+	def __init__(self):
+		super(SearchCursorExpired, self).__init__(_('The search results have expired. Please repeat the search.'), status=410)
+
+
 class UDM_Error(Exception):
 
 	def __init__(self, exc, dn=None):
@@ -272,6 +283,11 @@ class UDM_Module(object):
 	def allows_simple_lookup(self):
 		return hasattr(self.module, 'lookup_filter')
 
+	def allows_lazy_lookup(self):
+		"""Check if the module uses the generic lookup, which can also be consumed lazily."""
+		obj = getattr(self.module, 'object', None)
+		return hasattr(obj, 'lookup_iter') and getattr(self.module, 'lookup', None) == obj.lookup
+
 	def lookup_filter(self, filter_s=None, lo=None):
 		return getattr(self.module, 'lookup_filter')(filter_s, lo)
 
@@ -457,8 +473,14 @@ class UDM_Module(object):
 			UDM_Error(e).reraise()
 
 	@LDAP_Connection
-	def search(self, container=None, attribute=None, value=None, superordinate=None, scope='sub', filter='', simple=False, simple_attrs=None, ldap_connection=None, ldap_position=None, hidden=True):
-		"""Searches for LDAP objects based on a search pattern"""
+	def search(self, container=None, attribute=None, value=None, superordinate=None, scope='sub', filter='', simple=False, simple_attrs=None, ldap_connection=None, ldap_position=None, hidden=True, lazy=False, properties=None):
+		"""Searches for LDAP objects based on a search pattern.
+		With lazy=True an iterator is returned, which creates the objects as
+		the results arrive, if the module supports it. As the LDAP connection
+		is shared by the request threads, this is a single streamed search
+		without paged results and without the size limit.
+		If the list of `properties` is given, only these are loaded if the
+		module supports it; such objects must be opened before modifying them."""
 		if container == 'all':
 			container = ldap_position.getBase()
 		elif container is None:
@@ -481,8 +503,10 @@ class UDM_Module(object):
 					else:
 						result = ldap_connection.searchDn(filter=unicode(lookup_filter), base=container, scope=scope, sizelimit=sizelimit)
 			else:
-				if self.module:
-					result = self.module.lookup(None, ldap_connection, filter_s, base=container, superordinate=superordinate, scope=scope, sizelimit=sizelimit)
+				if self.module and lazy and self.allows_lazy_lookup():
+					return self._search_lazy(self.module.object.lookup_iter(None, ldap_connection, filter_s, base=container, superordinate=superordinate, scope=scope, properties=properties, page_size=0))
+				elif self.module:
+					result = udm_modules.lookup(self.module, None, ldap_connection, filter_s, base=container, superordinate=superordinate, scope=scope, sizelimit=sizelimit, properties=properties)
 				else:
 					result = None
 		except udm_errors.insufficientInformation:
@@ -508,6 +532,59 @@ class UDM_Module(object):
 
 		return result
 
+	@LDAP_Connection
+	def search_dns(self, container=None, attribute=None, value=None, superordinate=None, scope='sub', hidden=True, ldap_connection=None, ldap_position=None):
+		"""Returns the LDAP DNs of the objects :func:`search` finds.
+		Modules supporting lazy searches only search for the DNs, without the size limit.
+		No paged search is used, as the LDAP connection is shared by the request threads."""
+		if not (self.module and self.allows_lazy_lookup()):
+			return [obj.dn for obj in self.search(container, attribute, value, superordinate, scope=scope, hidden=hidden, lazy=True) or []]
+		if container == 'all':
+			container = ldap_position.getBase()
+		elif container is None:
+			container = ''
+		filter_s = _object_property_filter(self, attribute, value, hidden)
+		MODULE.info('Searching for LDAP DNs: container = %s, filter = %s, superordinate = %s' % (container, filter_s, superordinate))
+		try:
+			filter_s = unicode(self.module.object.lookup_filter(filter_s, ldap_connection) or '')
+		except udm_errors.insufficientInformation:
+			return []
+		try:
+			return ldap_connection.searchDn(filter_s, container, scope)
+		except udm_errors.ldapTimeout:
+			raise SearchTimeoutError()
+		except udm_errors.ldapSizelimitExceeded:
+			raise SearchLimitReached()
+		except udm_errors.ldapError:
+			raise
+		except udm_errors.base as e:
+			UDM_Error(e).reraise()
+
+	def search_window(self, ldap_dns, container=None, superordinate=None, scope='sub', properties=None):
+		"""Returns the objects of the given LDAP DNs in this order, e.g. a page of the DNs of :func:`search_dns`.
+		Objects which have been removed in the meantime are left out."""
+		if not ldap_dns:
+			return []
+		filter_s = '(|%s)' % ''.join(filter_format('(entryDN=%s)', [ldap_dn]) for ldap_dn in ldap_dns)
+		objects = dict((obj.dn.lower(), obj) for obj in self.search(container, superordinate=superordinate, scope=scope, filter=filter_s, lazy=True, properties=properties) or [] if obj is not None)
+		return [objects[ldap_dn.lower()] for ldap_dn in ldap_dns if ldap_dn.lower() in objects]
+
+	def _search_lazy(self, result):
+		"""Iterate over lazy search result, translating the search errors."""
+		try:
+			for obj in result:
+				yield obj
+		except udm_errors.insufficientInformation:
+			return
+		except udm_errors.ldapTimeout:
+			raise SearchTimeoutError()
+		except udm_errors.ldapSizelimitExceeded:
+			raise SearchLimitReached()
+		except udm_errors.ldapError:
+			raise
+		except udm_errors.base as e:
+			UDM_Error(e).reraise()
+
 	@LDAP_Connection
 	def get(self, ldap_dn=None, superordinate=None, attributes=[], ldap_connection=None, ldap_position=None):
 		"""Retrieves details for a given LDAP object"""
@@ -949,8 +1026,8 @@ class UDM_Settings(object):
 
 def container_modules():
 	containers = []
-	for name, mod in udm_modules.modules.items():
-		if getattr(mod, 'childs', None):
+	for name in udm_modules.modules.keys():
+		if udm_modules.childs(name):  # known from the manifest without importing the module
 			containers.append(name)
 
 	return containers
@@ -981,13 +1058,14 @@ def ldap_dn2path(ldap_dn, include_rdn=True):
 
 
 @LDAP_Connection
-def get_module(flavor, ldap_dn, ldap_connection=None, ldap_position=None):
-	"""Determines an UDM module handling the LDAP object identified by the given LDAP DN"""
+def get_module(flavor, ldap_dn, attributes=None, ldap_connection=None, ldap_position=None):
+	"""Determines an UDM module handling the LDAP object identified by the given LDAP DN.
+	The LDAP attributes of the object are only fetched if they are not given as `attributes`."""
 	if flavor is None or flavor == 'navigation':
 		base = None
 	else:
 		base, name = split_module_name(flavor)
-	modules = udm_modules.objectType(None, ldap_connection, ldap_dn, module_base=base)
+	modules = udm_modules.objectType(None, ldap_connection, ldap_dn, attr=attributes or None, module_base=base)
 
 	if not modules:
 		return None
@@ -999,11 +1077,73 @@ def get_module(flavor, ldap_dn, ldap_connection=None, ldap_position=None):
 	return module
 
 
+def open_cursor(ldap_dns):
+	"""Remembers the LDAP DNs found by a query, so that its results can be fetched in pages.
+	Returns the ID of the cursor for :func:`read_cursor`."""
+	cursor = uuid.uuid4().hex
+	_cursors.set(cursor, list(ldap_dns))
+	return cursor
+
+
+def read_cursor(cursor, start, limit):
+	"""Returns the number of all LDAP DNs of the cursor and the DNs of the page beginning at `start`."""
+	ldap_dns = _cursors.get(cursor)
+	if ldap_dns is None:
+		raise SearchCursorExpired()
+	return len(ldap_dns), ldap_dns[start:start + limit]
+
+
+def _identify_object_module(ldap_connection, dn, attrs):
+	"""Returns the UDM module :func:`list_objects` loads the LDAP object with, or None"""
+	modules = udm_modules.objectType(None, ldap_connection, dn, attrs)
+	if not modules:
+		MODULE.warn('Could not identify LDAP object %r' % (dn,))
+		return None
+	if len(modules) > 1:
+		MODULE.warn('Found multiple object types for %r: %r' % (dn, modules))
+		MODULE.info('dn: %r, attrs: %r' % (dn, attrs))
+	for mod in modules:
+		module = UDM_Module(mod)
+		if module.module:
+			return module
+	MODULE.process('The UDM module %r could not be found. Ignoring LDAP object %r' % (modules[0], dn))
+	return None
+
+
 @LDAP_Connection
-def list_objects(container, object_type=None, ldap_connection=None, ldap_position=None):
-	"""Yields UDM objects"""
+def list_object_dns(container, object_type=None, ldap_connection=None, ldap_position=None):
+	"""Returns the DNs of the objects :func:`list_objects` lists which are shown in the navigation:
+	only containers if `object_type` is `$containers$`, otherwise no containers"""
+	ldap_dns = []
 	try:
-		result = ldap_connection.search(base=container, scope='one')
+		for dn, attrs in ldap_connection.search(base=container, scope='one'):
+			module = _identify_object_module(ldap_connection, dn, attrs)
+			if module is not None and module.childs == (object_type == '$containers$'):
+				ldap_dns.append(dn)
+	except (LDAPError, udm_errors.ldapError):
+		raise
+	except udm_errors.noObject:
+		raise ObjectDoesNotExist(container)
+	except udm_errors.ldapTimeout:
+		raise SearchTimeoutError()
+	except udm_errors.base as exc:
+		UDM_Error(exc).reraise()
+	return ldap_dns
+
+
+@LDAP_Connection
+def list_objects(container, object_type=None, ldap_dns=None, ldap_connection=None, ldap_position=None):
+	"""Yields UDM objects, optionally only those of the given LDAP DNs"""
+	filter_s = '(objectClass=*)'
+	if ldap_dns is not None:
+		if not ldap_dns:
+			return
+		filter_s = '(|%s)' % ''.join(filter_format('(entryDN=%s)', [ldap_dn]) for ldap_dn in ldap_dns)
+	try:
+		result = ldap_connection.search(filter=filter_s, base=container, scope='one')
+		if ldap_dns is not None:
+			result = dict((dn.lower(), (dn, attrs)) for dn, attrs in result)
+			result = [result[ldap_dn.lower()] for ldap_dn in ldap_dns if ldap_dn.lower() in result]
 	except (LDAPError, udm_errors.ldapError):
 		raise
 	except udm_errors.noObject:
@@ -1015,22 +1155,10 @@ def list_objects(container, object_type=None, ldap_connection=None, ldap_positio
 	except udm_errors.base as exc:
 		UDM_Error(exc).reraise()
 	for dn, attrs in result:
-		modules = udm_modules.objectType(None, ldap_connection, dn, attrs)
-		if not modules:
-			MODULE.warn('Could not identify LDAP object %r' % (dn,))
-			continue
-		if object_type == '$containers$' and not udm_modules.childs(modules[0]):
+		module = _identify_object_module(ldap_connection, dn, attrs)
+		if module is None:
 			continue
-		if len(modules) > 1:
-			MODULE.warn('Found multiple object types for %r: %r' % (dn, modules))
-			MODULE.info('dn: %r, attrs: %r' % (dn, attrs))
-		for mod in modules:
-			module = UDM_Module(mod)
-			if module.module:
-				break
-
-		if not module.module:
-			MODULE.process('The UDM module %r could not be found. Ignoring LDAP object %r' % (modules[0], dn))
+		if object_type == '$containers$' and not module.childs:
 			continue
 		if module.superordinate_names:
 			for superordinate in module.superordinate_names:
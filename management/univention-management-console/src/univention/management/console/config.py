@@ -42,7 +42,7 @@ some constants that are used internally.
 """
 import univention.config_registry
 
-ucr = univention.config_registry.ConfigRegistry()
+ucr = univention.config_registry.ConfigRegistry(read_only=True)
 ucr.load()
 
 
@@ -186,8 +186,13 @@ define([
 			//		The query to use for retrieving objects from the store.
 			// options:
 			//		Query options, such as 'sort' (see also tools.cmpObjects()).
+			//		If 'count' is given, only the range of 'count' objects beginning
+			//		at 'start' is requested from the server. A 'cursor' returned by a
+			//		previous range query continues the same search on the server.
 			// returns: dojo/store/api/QueryResults
 			//		The results of the query, extended with iterative methods.
+			//		For range queries, 'total' resolves to the number of objects
+			//		matching the whole query and 'cursor' to the cursor of the search.
 
 			// if called via dojo/data/ObjectStore, queries can be translated to regexps
 			var query = {};
@@ -196,12 +201,28 @@ define([
 				query[ikey] = (typeof ival == "string" || ival instanceof Array || typeof ival == 'boolean' || null === ival) ? ival : String(ival);
 				++nQueryEl;
 			}, this, true);
+			var count = lang.getObject('count', false, options);
+			if (count) {
+				query.limit = count;
+				query.start = options.start || 0;
+				if (options.cursor) {
+					query.cursor = options.cursor;
+				}
+			}
+			var total = null;
+			var cursor = null;
 			var deferred = new Deferred();
 			if (nQueryEl) {
 				// non-empty query
 				deferred = this.umcpCommand(this.storePath + '/query', query);
 				deferred = deferred.then(function(data) {
 					var result = data.result;
+					if (count) {
+						// range queries answer with the requested entries and the total number
+						total = result.total;
+						cursor = result.cursor || null;
+						result = result.entries;
+					}
 					// if requested, sort the list
 					var sort = lang.getObject('sort', false, options);
 					if (sort) {
@@ -215,7 +236,16 @@ define([
 				// this is the query the grid will send automatically at the beginning
 				deferred.resolve([]);
 			}
-			return new QueryResults(deferred);
+			var results = new QueryResults(deferred);
+			if (count) {
+				results.total = deferred.then(function(result) {
+					return total === null ? result.length : total;
+				});
+				results.cursor = deferred.then(function() {
+					return cursor;
+				});
+			}
+			return results;
 		},
 
 		// _doingTransaction: Boolean
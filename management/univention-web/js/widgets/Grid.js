@@ -43,6 +43,7 @@ define([
 	"dojo/aspect",
 	"dojo/on",
 	"dojo/window",
+	"dojo/promise/all",
 	"dijit/Destroyable",
 	"dijit/Menu",
 	"dijit/MenuItem",
@@ -64,7 +65,7 @@ define([
 	"../render",
 	"../i18n!"
 ], function(declare, lang, array, kernel, win, construct, attr, geometry, style, domClass,
-		topic, aspect, on, dojoWindow, Destroyable, Menu, MenuItem, DropDownButton, entities,
+		topic, aspect, on, dojoWindow, all, Destroyable, Menu, MenuItem, DropDownButton, entities,
 		OnDemandGrid, Selection, DijitRegistry, Selector, StoreAdapter, Memory, Button, Text, ContainerWidget,
 		StandbyMixin, Tooltip, _RegisterOnShowMixin, tools, render, _) {
 
@@ -159,6 +160,12 @@ define([
 		//		will be displayed in the grid footer.
 		footerFormatter: null,
 
+		// pageSize: Number?
+		//		If specified, the results of a UMCP module store are requested in pages
+		//		of this many entries. Further pages are loaded on demand via the button
+		//		below the grid, the footer shows the total number reported by the server.
+		pageSize: null,
+
 		// sortIndex: Number
 		//		Controls which column is used for default sorting (values < 0 indicated
 		//		sorting in descending order)
@@ -455,6 +462,13 @@ define([
 
 			this.addChild(this._grid);
 
+			this._moreButton = new Button({
+				label: _('Load more entries'),
+				visible: false,
+				onClick: lang.hitch(this, 'loadMore')
+			});
+			this.addChild(this._moreButton);
+
 			//
 			// register event handler
 			//
@@ -944,6 +958,10 @@ define([
 		_updateFooterContent: function() {
 			var nItems = this.getSelectedIDs().length;
 			this._grid.collection.fetch().totalLength.then(lang.hitch(this, function(nItemsTotal) {
+				if (this._page) {
+					// only a part of the results has been loaded yet
+					nItemsTotal = this._page.total;
+				}
 				var msg = '';
 				var showCounter = !this.gridOptions || !this.gridOptions.selectionMode || this.gridOptions.selectionMode !== 'none';
 				if (typeof this.footerFormatter === "function") {
@@ -1058,11 +1076,63 @@ define([
 			});
 			// store the last query
 			this.query = query;
+			this._page = null;
+			this._moreButton.set('visible', false);
+			if (this.pageSize && this._store.isUmcpCommandStore) {
+				return this._fetchPage(addedFieldsQuery, 0, null).then(onSuccess, onError);
+			}
 			// umcpCommand doesn't know a range option -> need to cache
 			// StoreAdapter doesn't work with fetchSync -> need to cache
 			return this._store.filter(addedFieldsQuery, options).fetch().then(onSuccess, onError);
 		},
 
+		_fetchPage: function(query, start, cursor) {
+			// summary:
+			//		Requests the page of results beginning at the given index.
+			//		The server side cursor continues the search of the first page.
+			var results = this.moduleStore.query(query, {
+				start: start,
+				count: this.pageSize,
+				cursor: cursor
+			});
+			return all({
+				items: results,
+				total: results.total,
+				cursor: results.cursor
+			}).then(lang.hitch(this, function(page) {
+				this._page = {
+					query: query,
+					start: start + page.items.length,
+					total: page.total,
+					cursor: page.cursor
+				};
+				this._moreButton.set('visible', this._page.start < this._page.total);
+				return page.items;
+			}));
+		},
+
+		loadMore: function() {
+			// summary:
+			//		Loads the next page of a paged query (see pageSize) and
+			//		appends its entries to the grid.
+			var page = this._page;
+			if (!page || page.start >= page.total) {
+				return;
+			}
+			this.standby(true);
+			return this._fetchPage(page.query, page.start, page.cursor).then(lang.hitch(this, function(result) {
+				array.forEach(result, function(item) {
+					this.collection.putSync(item);
+				}, this);
+				this._grid.refresh({keepScrollPosition: true});
+				this._updateFooterContent();
+				this.standby(false);
+				this._setInitialGridHeight();
+			}), lang.hitch(this, function() {
+				this.standby(false);
+			}));
+		},
+
 		getAllItems: function() {
 			// summary:
 			//		Returns a list of all items
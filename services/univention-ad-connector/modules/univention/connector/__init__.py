@@ -32,7 +32,6 @@
 # <http://www.gnu.org/licenses/>.
 
 import sys
-import string
 import os
 import cPickle
 import types
@@ -42,6 +41,7 @@ import copy
 import time
 import ldap
 import univention.uldap
+import univention.admin.cache
 import univention.admin.uldap
 import univention.admin.modules
 import univention.admin.objects
@@ -412,6 +412,7 @@ class ucs:
 		self.property = _property
 
 		self.init_debug()
+		self._compile_filters()
 
 		self.co = univention.admin.config.config()
 		self.listener_dir = listener_dir
@@ -502,8 +503,14 @@ class ucs:
 
 	def close_debug(self):
 		_d = ud.function('ldap.close_debug')
+		self.log_cache_statistics(ud.PROCESS)
 		ud.debug(ud.LDAP, ud.INFO, "close debug")
 
+	def log_cache_statistics(self, level=ud.INFO):
+		"""Log how well the caches of the UDM modules worked."""
+		for line in univention.admin.cache.format_statistics():
+			ud.debug(ud.LDAP, level, line)
+
 	def _get_config_option(self, section, option):
 		_d = ud.function('ldap._get_config_option')
 		return self.config.get(section, option)
@@ -1420,129 +1427,25 @@ class ucs:
 		- immer case-sensitive
 		- nur * als Wildcard
 		- geht "lachser" mit Verschachtelten Klammern um
+		Der Filter wird nur beim ersten Aufruf geparst, `attributes` kann auch ein
+		bereits normalisiertes ldapfilter.Attributes Objekt sein.
 		'''
 		_d = ud.function('ldap._filter_match')
+		return compile_filter(filter).match(attributes)
 
-		filter_connectors = ['!', '&', '|']
-
-		def list_lower(elements):
-			if isinstance(elements, type([])):
-				retlist = []
-				for l in elements:
-					retlist.append(l.lower())
-				return retlist
-			else:
-				return elements
-
-		def dict_lower(dict):
-			if isinstance(dict, type({})):
-				retdict = {}
-				for key in dict:
-					retdict[key.lower()] = dict[key]
-				return retdict
-			else:
-				return dict
-
-		def attribute_filter(filter, attributes):
-			attributes = dict_lower(attributes)
-
-			pos = string.find(filter, '=')
-			if pos < 0:
-				raise ValueError('missing "=" in filter: %s' % filter)
-			attribute = filter[:pos].lower()
-			if not attribute:
-				raise ValueError('missing attribute in filter: %s' % filter)
-			value = filter[pos + 1:]
-
-			if attribute.endswith(':1.2.840.113556.1.4.803:'):
-				# bitwise filter
-				attribute_name = attribute.replace(':1.2.840.113556.1.4.803:', '')
-				attribute_value = attributes.get(attribute_name)
-				if attribute_value:
-					try:
-						if isinstance(attribute_value, type([])):
-							attribute_value = int(attribute_value[0])
-						int_value = int(value)
-						if ((attribute_value & int_value) == int_value):
-							return True
-						else:
-							return False
-					except (ldap.SERVER_DOWN, SystemExit):
-						raise
-					except:
-						ud.debug(ud.LDAP, ud.WARN, "attribute_filter: Failed to convert attributes for bitwise filter")
-						return False
-
-			if value == '*':
-				return attribute in list_lower(attributes.keys())
-			elif attribute in attributes:
-				return value.lower() in list_lower(attributes[attribute])
-			else:
-				return False
-
-		def connecting_filter(filter, attributes):
-
-			def walk(filter, attributes):
-
-				def split(filter):
-					opened = []
-					closed = []
-					pos = 0
-					level = 0
-					for char in filter:
-						if char == '(':
-							if level == 0:
-								opened.append(pos)
-							level += 1
-						elif char == ')':
-							if level == 1:
-								closed.append(pos)
-							level -= 1
-						if level < 0:
-							raise ValueError("too many ')' in filter: %s" % filter)
-						pos += 1
-
-					if len(opened) != len(closed):
-						raise ValueError("'(' and ')' don't match in filter: %s" % filter)
-					filters = []
-					for i in range(len(opened)):
-						filters.append(filter[opened[i] + 1:closed[i]])
-					return filters
-
-				if filter[0] == '(':
-					if not filter[-1] == ')':
-						raise ValueError("matching ) missing in filter: %s" % filter)
-					else:
-						filters = split(filter)
-						results = []
-						for filter in filters:
-							results.append(subfilter(filter, attributes))
-						return results
-				else:
-					return [subfilter(filter, attributes)]
-
-			if filter[0] == '!':
-				return not subfilter(filter[1:], attributes)
-			elif filter[0] == '|':
-				return 1 in walk(filter[1:], attributes)
-			elif filter[0] == '&':
-				return 0 not in walk(filter[1:], attributes)
-
-		def subfilter(filter, attributes):
-
-			if filter[0] == '(':
-				if not filter[-1] == ')':
-					raise ValueError("matching ) missing in filter: %s" % filter)
-				else:
-					return subfilter(filter[1:-1], attributes)
-
-			elif filter[0] in filter_connectors:
-				return connecting_filter(filter, attributes)
-
-			else:
-				return attribute_filter(filter, attributes)
-
-		return subfilter(filter, attributes)
+	def _compile_filters(self):
+		'''
+		compile the LDAP filters of the mapping once at startup
+		'''
+		for key, prop in self.property.items():
+			for name in ('con_search_filter', 'ignore_filter', 'match_filter'):
+				filter = getattr(prop, name, None)
+				if not filter:
+					continue
+				try:
+					compile_filter(filter)
+				except ValueError as exc:
+					ud.debug(ud.LDAP, ud.ERROR, "_compile_filters: invalid %s of %s: %s" % (name, key, exc))
 
 	def _ignore_object(self, key, object):
 		'''
@@ -1557,11 +1460,12 @@ class ucs:
 				ud.debug(ud.LDAP, ud.INFO, "_ignore_object: ignore object because of subtree match: [%s] (key: %s)" % (object['dn'], key))
 				return True
 
-		if self.property[key].ignore_filter and self._filter_match(self.property[key].ignore_filter, object['attributes']):
+		attributes = Attributes(object['attributes'])
+		if self.property[key].ignore_filter and self._filter_match(self.property[key].ignore_filter, attributes):
 			ud.debug(ud.LDAP, ud.INFO, "_ignore_object: ignore object because of ignore_filter (key: {})".format(key))
 			return True
 
-		if self.property[key].match_filter and not self._filter_match(self.property[key].match_filter, object['attributes']):
+		if self.property[key].match_filter and not self._filter_match(self.property[key].match_filter, attributes):
 			ud.debug(ud.LDAP, ud.INFO, "_ignore_object: ignore object because of match_filter (key: {})".format(key))
 			return True
 
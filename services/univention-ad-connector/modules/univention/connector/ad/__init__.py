@@ -47,6 +47,7 @@ import subprocess
 import univention.uldap
 import univention.connector
 import univention.debug2 as ud
+from univention.connector.ldapfilter import Attributes
 from ldap.controls import LDAPControl
 from ldap.controls import SimplePagedResultsControl
 from ldap.filter import escape_filter_chars
@@ -70,6 +71,7 @@ class netbiosDomainnameNotFound(Exception):
 
 
 PAGE_SIZE = 1000
+MEMBER_BATCH_SIZE = 100  # group members resolved with one search
 
 
 def activate_user(connector, key, object):
@@ -140,6 +142,15 @@ def encode_attrib(attrib):
 	return unicode(attrib, 'utf8')
 
 
+def normalise_dn(dn):
+	'''Return the lower case DN in a canonical form, so that e.g. "CN=a, DC=b" and "cn=a,dc=b" compare equal'''
+	dn = encode_attrib(dn).lower().encode('utf8')
+	try:
+		return ldap.dn.dn2str(ldap.dn.str2dn(dn))
+	except ldap.DECODING_ERROR:
+		return dn
+
+
 def encode_attriblist(attriblist):
 	if not isinstance(attriblist, type([])):
 		return encode_attrib(attriblist)
@@ -1272,8 +1283,9 @@ class ad(univention.connector.ucs):
 		_d = ud.function('ldap.__identify')
 		if not object or 'attributes' not in object:
 			return None
+		attributes = Attributes(object['attributes'])
 		for key in self.property.keys():
-			if self._filter_match(self.property[key].con_search_filter, object['attributes']):
+			if self._filter_match(self.property[key].con_search_filter, attributes):
 				return key
 
 	def __update_lastUSN(self, object):
@@ -1497,6 +1509,33 @@ class ad(univention.connector.ucs):
 		ud.debug(ud.LDAP, ud.INFO, "__group_cache_ucs_append_member: Append user %s to group ucs cache of %s" % (member.lower(), group.lower()))
 		self.group_members_cache_ucs[group.lower()].append(member.lower())
 
+	def __get_ucs_members(self, member_dns):
+		"""
+		read the UCS objects of group members with one search per MEMBER_BATCH_SIZE
+		members, returns a dict of the normalised DNs and the attributes of the found objects
+		"""
+		_d = ud.function('ldap.__get_ucs_members')
+		members = {}
+		for i in range(0, len(member_dns), MEMBER_BATCH_SIZE):
+			member_filter = '(|%s)' % ''.join(format_escaped('(entryDN={0!e})', member_dn) for member_dn in member_dns[i:i + MEMBER_BATCH_SIZE])
+			for member_dn, attributes in self.lo.search(filter=member_filter):
+				members[normalise_dn(member_dn)] = attributes
+		return members
+
+	def __get_existing_ad_dns(self, ad_dns):
+		"""
+		check with one search per MEMBER_BATCH_SIZE objects which of the DNs exist
+		in AD, returns the normalised DNs of the found objects
+		"""
+		_d = ud.function('ldap.__get_existing_ad_dns')
+		existing = set()
+		for i in range(0, len(ad_dns), MEMBER_BATCH_SIZE):
+			ad_filter = '(|%s)' % ''.join(format_escaped('(distinguishedName={0!e})', ad_dn) for ad_dn in ad_dns[i:i + MEMBER_BATCH_SIZE])
+			for ad_dn, attributes in self.__search_ad(filter=compatible_modstring(ad_filter), attrlist=['cn']):
+				if ad_dn not in ['None', '', None]:  # filter referrals
+					existing.add(normalise_dn(ad_dn))
+		return existing
+
 	def group_members_sync_from_ucs(self, key, object):  # object mit ad-dn
 		"""
 		sync groupmembers in AD if changend in UCS
@@ -1544,18 +1583,21 @@ class ad(univention.connector.ucs):
 		ad_members = self.get_ad_members(object['dn'], ldap_object_ad)
 		ud.debug(ud.LDAP, ud.INFO, "group_members_sync_from_ucs: ad_members %s" % ad_members)
 
-		ad_members_from_ucs = []
+		ad_members_from_ucs = set()
 
 		# map members from UCS to AD and check if they exist
-		for member_dn in ucs_members:
-			ad_dn = self.group_mapping_cache_ucs.get(member_dn.lower())
-			if ad_dn and self.lo_ad.get(ad_dn, attr=['cn']):
+		cached_ad_dns = [self.group_mapping_cache_ucs.get(member_dn.lower()) for member_dn in ucs_members]
+		existing_ad_dns = self.__get_existing_ad_dns([ad_dn for ad_dn in cached_ad_dns if ad_dn])
+		ucs_members_attributes = self.__get_ucs_members([member_dn for member_dn, ad_dn in zip(ucs_members, cached_ad_dns) if not ad_dn or normalise_dn(ad_dn) not in existing_ad_dns])
+		mapped_members = []
+		for member_dn, ad_dn in zip(ucs_members, cached_ad_dns):
+			if ad_dn and normalise_dn(ad_dn) in existing_ad_dns:
 				ud.debug(ud.LDAP, ud.INFO, "Found %s in group cache ucs" % member_dn)
-				ad_members_from_ucs.append(ad_dn.lower())
+				ad_members_from_ucs.add(ad_dn.lower())
 				self.__group_cache_ucs_append_member(object_ucs['dn'], member_dn)
 			else:
 				ud.debug(ud.LDAP, ud.INFO, "Did not find %s in group cache ucs" % member_dn)
-				member_object = {'dn': member_dn, 'modtype': 'modify', 'attributes': self.lo.get(member_dn)}
+				member_object = {'dn': member_dn, 'modtype': 'modify', 'attributes': ucs_members_attributes.get(normalise_dn(member_dn), {})}
 
 				# can't sync them if users have no posix-account
 				if 'gidNumber' not in member_object['attributes']:
@@ -1574,16 +1616,17 @@ class ad(univention.connector.ucs):
 						break
 				# print 'object key: %s' % key
 				ad_dn = self._object_mapping(key, member_object, 'ucs')['dn']
-				# check if dn exists in ad
-				try:
-					if self.lo_ad.get(ad_dn, attr=['cn']):  # search only for cn to suppress coding errors
-						ad_members_from_ucs.append(ad_dn.lower())
-						self.group_mapping_cache_ucs[member_dn.lower()] = ad_dn
-						self.__group_cache_ucs_append_member(object_ucs['dn'], member_dn)
-				except (ldap.SERVER_DOWN, SystemExit):
-					raise
-				except:  # FIXME: which exception is to be caught?
-					ud.debug(ud.LDAP, ud.INFO, "group_members_sync_from_ucs: failed to get dn from ad, assume object doesn't exist")
+				mapped_members.append((member_dn, ad_dn))
+
+		existing_ad_dns = self.__get_existing_ad_dns([ad_dn for member_dn, ad_dn in mapped_members])
+		for member_dn, ad_dn in mapped_members:
+			# check if dn exists in ad
+			if normalise_dn(ad_dn) in existing_ad_dns:
+				ad_members_from_ucs.add(ad_dn.lower())
+				self.group_mapping_cache_ucs[member_dn.lower()] = ad_dn
+				self.__group_cache_ucs_append_member(object_ucs['dn'], member_dn)
+			else:
+				ud.debug(ud.LDAP, ud.INFO, "group_members_sync_from_ucs: %s does not exist in ad" % ad_dn)
 
 		ud.debug(ud.LDAP, ud.INFO, "group_members_sync_from_ucs: UCS-members in ad_members_from_ucs %s" % ad_members_from_ucs)
 
@@ -1599,7 +1642,7 @@ class ad(univention.connector.ucs):
 						# ad_members_from_ucs.append(member_dn.lower())
 						ud.debug(ud.LDAP, ud.INFO, "group_members_sync_from_ucs: Object exists only in AD [%s]" % ucs_dn)
 					elif self._ignore_object(key, {'dn': member_dn, 'attributes': ad_object}):
-						ad_members_from_ucs.append(member_dn.lower())
+						ad_members_from_ucs.add(member_dn.lower())
 						ud.debug(ud.LDAP, ud.INFO, "group_members_sync_from_ucs: Object ignored in AD [%s], key = [%s]" % (ucs_dn, key))
 				except (ldap.SERVER_DOWN, SystemExit):
 					raise
@@ -1660,7 +1703,7 @@ class ad(univention.connector.ucs):
 		ud.debug(ud.LDAP, ud.INFO, "group_members_sync_from_ucs: members to del: %s" % del_members)
 
 		if add_members or del_members:
-			ad_members = ad_members + add_members
+			ad_members = ad_members + list(add_members)
 			for member in del_members:
 				ad_members.remove(member)
 			ud.debug(ud.LDAP, ud.INFO, "group_members_sync_from_ucs: members result: %s" % ad_members)
@@ -265,6 +265,7 @@ def connect():
 			if str(retry_rejected) == baseconfig_retry_rejected:
 				ad.resync_rejected_ucs()
 				ad.resync_rejected()
+				ad.log_cache_statistics()
 				retry_rejected = 0
 			else:
 				retry_rejected += 1
@@ -33,16 +33,17 @@
 
 import cPickle
 import copy
+import itertools
 import os
 import re
 import random
-import string
 import sys
 import time
 import traceback
 import types
 import ldap
 import univention.uldap
+import univention.admin.cache
 import univention.admin.uldap
 import univention.admin.modules
 import univention.admin.objects
@@ -54,6 +55,8 @@ from ldap.controls.readentry import PostReadControl
 
 from univention.s4connector.s4cache import S4Cache
 from univention.s4connector.lockingdb import LockingDB
+from univention.s4connector.journal import Journal, JOURNAL_DIR, coalesce
+from univention.s4connector.ldapfilter import Attributes, compile_filter
 import sqlite3 as lite
 
 term_signal_caught = False
@@ -458,9 +461,11 @@ class ucs:
 		self.property = _property
 
 		self.init_debug()
+		self._compile_filters()
 
 		self.co = univention.admin.config.config()
 		self.listener_dir = listener_dir
+		self.journal = Journal(listener_dir)
 
 		configdbfile = '/etc/univention/%s/s4internal.sqlite' % self.CONFIGBASENAME
 		self.config = configdb(configdbfile)
@@ -557,8 +562,14 @@ class ucs:
 
 	def close_debug(self):
 		_d = ud.function('ldap.close_debug')
+		self.log_cache_statistics(ud.PROCESS)
 		ud.debug(ud.LDAP, ud.INFO, "close debug")
 
+	def log_cache_statistics(self, level=ud.INFO):
+		"""Log how well the caches of the UDM modules worked."""
+		for line in univention.admin.cache.format_statistics():
+			ud.debug(ud.LDAP, level, line)
+
 	def _get_config_option(self, section, option):
 		_d = ud.function('ldap._get_config_option')
 		return self.config.get(section, option)
@@ -764,6 +775,13 @@ class ucs:
 			self._save_rejected_ucs(filename, 'unknown', resync=False, reason='broken file')
 			return False
 
+		return self.__sync_change_from_ucs(filename, (dn, new, old, old_dn), traceback_level)
+
+	def __sync_change_from_ucs(self, filename, change, traceback_level=ud.WARN):
+		'''
+		sync a change from UCS, `filename` is used to save it as rejected
+		'''
+		(dn, new, old, old_dn) = change
 		if dn == 'cn=Subschema':
 			return True
 
@@ -1072,67 +1090,85 @@ class ucs:
 
 	def poll_ucs(self):
 		'''
-		poll changes from UCS: iterates over files exported by directory-listener module
+		poll changes from UCS: iterates over the changes in the journal written by the
+		directory-listener module and over the files of rejected changes
 		'''
 		_d = ud.function('ldap.poll_ucs')
 		# check for changes from ucs ldap directory
 
 		change_counter = 0
 		MAX_SYNC_IN_ONE_INTERVAL = 50000
+		COALESCE_WINDOW = 1000
 
 		self.rejected_files = self._list_rejected_filenames_ucs()
 
-		print "--------------------------------------"
-		print "try to sync %s changes from UCS" % (min(len(os.listdir(self.listener_dir)) - 1, MAX_SYNC_IN_ONE_INTERVAL))
-		print "done:",
-		sys.stdout.flush()
-		done_counter = 0
-		files = sorted(os.listdir(self.listener_dir))
+		# files of rejected changes and of changes written by older versions of the listener module
+		files = sorted(listener_file for listener_file in os.listdir(self.listener_dir) if listener_file not in ('tmp', JOURNAL_DIR))
 
 		# Only synchronize the first MAX_SYNC_IN_ONE_INTERVAL changes otherwise
 		# the change list is too long and it took too much time
 		files = files[:MAX_SYNC_IN_ONE_INTERVAL]
 
+		print "--------------------------------------"
+		print "try to sync %s changes and %d KiB of the journal from UCS" % (len(files), (self.journal.backlog() + 1023) // 1024)
+		print "done:",
+		sys.stdout.flush()
+		done_counter = 0
+
 		# We may dropped the parent object, so don't show the traceback in any case
 		traceback_level = ud.WARN
 
 		for listener_file in files:
 			sync_successfull = False
 			filename = os.path.join(self.listener_dir, listener_file)
-			if not filename == "%s/tmp" % self.baseConfig['%s/s4/listener/dir' % self.CONFIGBASENAME]:
-				if filename not in self.rejected_files:
+			if filename not in self.rejected_files:
+				try:
+					with open(filename) as fob:
+						(dn, new, old, old_dn) = cPickle.load(fob)
+				except IOError:
+					continue  # file not found so there's nothing to sync
+				except (cPickle.UnpicklingError, EOFError) as e:
+					message = 'file emtpy' if isinstance(e, EOFError) else e.message
+					ud.debug(ud.LDAP, ud.ERROR,
+						'poll_ucs: invalid pickle file {}: {}'.format(filename, message))
+					# ignore corrupted pickle file, but save as rejected to not try again
+					self._save_rejected_ucs(filename, 'unknown', resync=False, reason='broken file')
+					continue
+
+				for i in [0, 1]:  # do it twice if the LDAP connection was closed
 					try:
-						with open(filename) as fob:
-							(dn, new, old, old_dn) = cPickle.load(fob)
-					except IOError:
-						continue  # file not found so there's nothing to sync
-					except (cPickle.UnpicklingError, EOFError) as e:
-						message = 'file emtpy' if isinstance(e, EOFError) else e.message
-						ud.debug(ud.LDAP, ud.ERROR,
-							'poll_ucs: invalid pickle file {}: {}'.format(filename, message))
-						# ignore corrupted pickle file, but save as rejected to not try again
-						self._save_rejected_ucs(filename, 'unknown', resync=False, reason='broken file')
-						continue
-
-					for i in [0, 1]:  # do it twice if the LDAP connection was closed
-						try:
-							sync_successfull = self.__sync_file_from_ucs(filename, traceback_level=traceback_level)
-						except (ldap.SERVER_DOWN, SystemExit):
-							# once again, ldap idletimeout ...
-							if i == 0:
-								self.open_ucs()
-								continue
-							raise
-						except:
-							self._save_rejected_ucs(filename, dn)
-							# We may dropped the parent object, so don't show this warning
-							self._debug_traceback(traceback_level, "sync failed, saved as rejected \n\t%s" % filename)
-						if sync_successfull:
-							os.remove(os.path.join(self.listener_dir, listener_file))
-							change_counter += 1
-						break
-
-				done_counter += 1
+						sync_successfull = self.__sync_file_from_ucs(filename, traceback_level=traceback_level)
+					except (ldap.SERVER_DOWN, SystemExit):
+						# once again, ldap idletimeout ...
+						if i == 0:
+							self.open_ucs()
+							continue
+						raise
+					except:
+						self._save_rejected_ucs(filename, dn)
+						# We may dropped the parent object, so don't show this warning
+						self._debug_traceback(traceback_level, "sync failed, saved as rejected \n\t%s" % filename)
+					if sync_successfull:
+						os.remove(os.path.join(self.listener_dir, listener_file))
+						change_counter += 1
+					break
+
+			done_counter += 1
+			print "%s" % done_counter,
+			sys.stdout.flush()
+
+		# repeated modifications of an object are synchronized once per window of the journal
+		coalesced_counter = 0
+		reader = self.journal.read(MAX_SYNC_IN_ONE_INTERVAL - len(files))
+		while True:
+			records = list(itertools.islice(reader, COALESCE_WINDOW))
+			if not records:
+				break
+			for sync_successfull, collapsed in self.__sync_journal_records(records, traceback_level):
+				if sync_successfull:
+					change_counter += 1
+				coalesced_counter += collapsed - 1
+				done_counter += collapsed
 				print "%s" % done_counter,
 				sys.stdout.flush()
 
@@ -1141,13 +1177,68 @@ class ucs:
 		self.rejected_files = self._list_rejected_filenames_ucs()
 
 		if self.rejected_files:
-			print "Changes from UCS: %s (%s saved rejected)" % (change_counter, len(self.rejected_files))
+			print "Changes from UCS: %s (%s saved rejected, %s coalesced)" % (change_counter, len(self.rejected_files), coalesced_counter)
 		else:
-			print "Changes from UCS: %s (%s saved rejected)" % (change_counter, '0')
+			print "Changes from UCS: %s (%s saved rejected, %s coalesced)" % (change_counter, '0', coalesced_counter)
 		print "--------------------------------------"
 		sys.stdout.flush()
 		return change_counter
 
+	def __sync_journal_records(self, records, traceback_level=ud.WARN):
+		'''
+		sync the `(segment, position, change)` records read from the journal, consecutive
+		modifications of an object are collapsed into one change; yields for every synced
+		change whether it was successful and how many changes have been collapsed into it.
+		The read offset is committed as far as all changes before it have been synced.
+		'''
+		items = coalesce([change for segment, position, change in records])
+		# index of the first record of a change which has not been synced yet
+		pending = [len(records)] * (len(items) + 1)
+		for index in range(len(items) - 1, -1, -1):
+			pending[index] = min(items[index][0], pending[index + 1])
+		for index, (first, last, collapsed, change) in enumerate(items):
+			if collapsed > 1:
+				ud.debug(ud.LDAP, ud.INFO, "__sync_journal_records: %d modifications of %s collapsed" % (collapsed, change[0]))
+			sync_successfull = self.__sync_change_from_journal(change, traceback_level)
+			if pending[index + 1] > 0 and not self.journal.commit(*records[pending[index + 1] - 1][:2]):
+				# the journal has been removed by the listener module
+				return
+			yield sync_successfull, collapsed
+		if not items:
+			self.journal.commit(*records[-1][:2])
+
+	def __sync_change_from_journal(self, change, traceback_level=ud.WARN):
+		'''
+		sync a change from the journal; if it is not successful, the change is
+		written to a file in the listener directory like the listener module did
+		before, so that it is retried or resynced as rejected change
+		'''
+		filename = os.path.join(self.listener_dir, '%f' % (time.time(),))
+		while os.path.exists(filename):
+			filename = os.path.join(self.listener_dir, '%f' % (time.time(),))
+		sync_successfull = False
+		for i in [0, 1]:  # do it twice if the LDAP connection was closed
+			try:
+				sync_successfull = self.__sync_change_from_ucs(filename, change, traceback_level=traceback_level)
+			except (ldap.SERVER_DOWN, SystemExit):
+				# once again, ldap idletimeout ...
+				if i == 0:
+					self.open_ucs()
+					continue
+				raise
+			except:
+				self._save_rejected_ucs(filename, change[0])
+				# We may dropped the parent object, so don't show this warning
+				self._debug_traceback(traceback_level, "sync failed, saved as rejected \n\t%s" % filename)
+			break
+		if not sync_successfull:
+			tmpfile = os.path.join(self.listener_dir, 'tmp', os.path.basename(filename))
+			with open(tmpfile, 'w+') as fd:
+				os.chmod(tmpfile, 0600)
+				cPickle.dump(change, fd)
+			os.rename(tmpfile, filename)
+		return sync_successfull
+
 	def poll(self, show_deleted=True):
 		# dummy
 		pass
@@ -1658,129 +1749,25 @@ class ucs:
 		- immer case-sensitive
 		- nur * als Wildcard
 		- geht "lachser" mit Verschachtelten Klammern um
+		Der Filter wird nur beim ersten Aufruf geparst, `attributes` kann auch ein
+		bereits normalisiertes ldapfilter.Attributes Objekt sein.
 		'''
 		_d = ud.function('ldap._filter_match')
+		return compile_filter(filter).match(attributes)
 
-		filter_connectors = ['!', '&', '|']
-
-		def list_lower(elements):
-			if isinstance(elements, type([])):
-				retlist = []
-				for l in elements:
-					retlist.append(l.lower())
-				return retlist
-			else:
-				return elements
-
-		def dict_lower(dict):
-			if isinstance(dict, type({})):
-				retdict = {}
-				for key in dict:
-					retdict[key.lower()] = dict[key]
-				return retdict
-			else:
-				return dict
-
-		def attribute_filter(filter, attributes):
-			attributes = dict_lower(attributes)
-
-			pos = string.find(filter, '=')
-			if pos < 0:
-				raise ValueError('missing "=" in filter: %s' % filter)
-			attribute = filter[:pos].lower()
-			if not attribute:
-				raise ValueError('missing attribute in filter: %s' % filter)
-			value = filter[pos + 1:]
-
-			if attribute.endswith(':1.2.840.113556.1.4.803:'):
-				# bitwise filter
-				attribute_name = attribute.replace(':1.2.840.113556.1.4.803:', '')
-				attribute_value = attributes.get(attribute_name)
-				if attribute_value:
-					try:
-						if isinstance(attribute_value, type([])):
-							attribute_value = int(attribute_value[0])
-						int_value = int(value)
-						if ((attribute_value & int_value) == int_value):
-							return True
-						else:
-							return False
-					except (ldap.SERVER_DOWN, SystemExit):
-						raise
-					except:
-						ud.debug(ud.LDAP, ud.WARN, "attribute_filter: Failed to convert attributes for bitwise filter")
-						return False
-
-			if value == '*':
-				return attribute in list_lower(attributes.keys())
-			elif attribute in attributes:
-				return value.lower() in list_lower(attributes[attribute])
-			else:
-				return False
-
-		def connecting_filter(filter, attributes):
-
-			def walk(filter, attributes):
-
-				def split(filter):
-					opened = []
-					closed = []
-					pos = 0
-					level = 0
-					for char in filter:
-						if char == '(':
-							if level == 0:
-								opened.append(pos)
-							level += 1
-						elif char == ')':
-							if level == 1:
-								closed.append(pos)
-							level -= 1
-						if level < 0:
-							raise ValueError("too many ')' in filter: %s" % filter)
-						pos += 1
-
-					if len(opened) != len(closed):
-						raise ValueError("'(' and ')' don't match in filter: %s" % filter)
-					filters = []
-					for i in range(len(opened)):
-						filters.append(filter[opened[i] + 1:closed[i]])
-					return filters
-
-				if filter[0] == '(':
-					if not filter[-1] == ')':
-						raise ValueError("matching ) missing in filter: %s" % filter)
-					else:
-						filters = split(filter)
-						results = []
-						for filter in filters:
-							results.append(subfilter(filter, attributes))
-						return results
-				else:
-					return [subfilter(filter, attributes)]
-
-			if filter[0] == '!':
-				return not subfilter(filter[1:], attributes)
-			elif filter[0] == '|':
-				return 1 in walk(filter[1:], attributes)
-			elif filter[0] == '&':
-				return 0 not in walk(filter[1:], attributes)
-
-		def subfilter(filter, attributes):
-
-			if filter[0] == '(':
-				if not filter[-1] == ')':
-					raise ValueError("matching ) missing in filter: %s" % filter)
-				else:
-					return subfilter(filter[1:-1], attributes)
-
-			elif filter[0] in filter_connectors:
-				return connecting_filter(filter, attributes)
-
-			else:
-				return attribute_filter(filter, attributes)
-
-		return subfilter(filter, attributes)
+	def _compile_filters(self):
+		'''
+		compile the LDAP filters of the mapping once at startup
+		'''
+		for key, prop in self.property.items():
+			for name in ('con_search_filter', 'ignore_filter', 'match_filter'):
+				filter = getattr(prop, name, None)
+				if not filter:
+					continue
+				try:
+					compile_filter(filter)
+				except ValueError as exc:
+					ud.debug(ud.LDAP, ud.ERROR, "_compile_filters: invalid %s of %s: %s" % (name, key, exc))
 
 	def _ignore_object(self, key, object):
 		'''
@@ -1797,11 +1784,12 @@ class ucs:
 					ud.debug(ud.LDAP, ud.INFO, "_ignore_object: ignore object because of subtree match: [%s]" % object['dn'])
 					return True
 
-			if self.property[key].ignore_filter and self._filter_match(self.property[key].ignore_filter, object['attributes']):
+			attributes = Attributes(object['attributes'])
+			if self.property[key].ignore_filter and self._filter_match(self.property[key].ignore_filter, attributes):
 				ud.debug(ud.LDAP, ud.INFO, "_ignore_object: ignore object because of ignore_filter")
 				return True
 
-			if self.property[key].match_filter and not self._filter_match(self.property[key].match_filter, object['attributes']):
+			if self.property[key].match_filter and not self._filter_match(self.property[key].match_filter, attributes):
 				ud.debug(ud.LDAP, ud.INFO, "_ignore_object: ignore object because of match_filter")
 				return True
 
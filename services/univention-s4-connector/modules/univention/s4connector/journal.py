@@ -0,0 +1,263 @@
+#!/usr/bin/python2.7
+# -*- coding: utf-8 -*-
+#
+# Univention S4 Connector
+#  journal of the UCS changes written by the listener module
+#
+# Copyright 2018 Univention GmbH
+#
+# http://www.univention.de/
+#
+# All rights reserved.
+#
+# The source code of this program is made available
+# under the terms of the GNU Affero General Public License version 3
+# (GNU AGPL V3) as published by the Free Software Foundation.
+#
+# Binary versions of this program provided by Univention to you as
+# well as other copyrighted, protected or trademarked materials like
+# Logos, graphics, fonts, specific documentations and configurations,
+# cryptographic keys etc. are subject to a license agreement between
+# you and Univention and not subject to the GNU AGPL V3.
+#
+# In the case you use this program under the terms of the GNU AGPL V3,
+# the program is provided in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License with the Debian GNU/Linux or Univention distribution in file
+# /usr/share/common-licenses/AGPL-3; if not, see
+# <http://www.gnu.org/licenses/>.
+
+import os
+import re
+import time
+import struct
+import zlib
+import cPickle
+
+import univention.debug2 as ud
+
+JOURNAL_DIR = 'journal'
+SEGMENT_SIZE = 16 * 1024 * 1024
+
+_HEADER = struct.Struct('!II')  # length and CRC32 of the record
+_SEGMENT = re.compile(r'^(\d{20})\.seg$')
+
+
+class Journal(object):
+
+	"""
+			Append-only journal of the changes the listener module passes
+			to the connector, stored as segment files in the directory
+			`journal` below the listener directory.
+
+			Each record is the pickled change, prefixed with its length and
+			CRC32. The listener appends to the newest segment and starts a
+			new one when it is full or when it is restarted. The segments are
+			numbered by the time they are started, so the numbers do not start
+			again when the listener module removes the journal in clean().
+			The connector reads the records and remembers with commit() how
+			far it got; segments which have been read completely are removed.
+	"""
+
+	def __init__(self, listener_dir, segment_size=SEGMENT_SIZE):
+		self.directory = os.path.join(listener_dir, JOURNAL_DIR)
+		self.segment_size = segment_size
+		self._offset_file = os.path.join(self.directory, 'offset')
+		self._writer = None
+		self._committed_segment = None
+		self._offset_fd = None
+		self._directory_id = None  # the journal directory read() started with
+
+	def _segments(self):
+		try:
+			names = os.listdir(self.directory)
+		except OSError:
+			return []
+		return sorted(int(match.group(1)) for match in (_SEGMENT.match(name) for name in names) if match)
+
+	def _segment_path(self, segment):
+		return os.path.join(self.directory, '%020d.seg' % (segment,))
+
+	def append(self, change):
+		"""Appends a change to the journal."""
+		payload = cPickle.dumps(change, cPickle.HIGHEST_PROTOCOL)
+		if self._writer is None or self._writer.tell() >= self.segment_size:
+			self._open_segment()
+		self._writer.write(_HEADER.pack(len(payload), zlib.crc32(payload) & 0xffffffff) + payload)
+		self._writer.flush()
+
+	def _open_segment(self):
+		# a new segment is started by every process, so a record which was
+		# partly written before a crash is only at the end of an old segment
+		if self._writer is not None:
+			self._writer.close()
+			self._writer = None
+		if not os.path.isdir(self.directory):
+			os.makedirs(self.directory, 0700)
+		segments = self._segments()
+		segment = int(time.time() * 1000000)
+		if segments and segments[-1] >= segment:
+			segment = segments[-1] + 1
+		path = self._segment_path(segment)
+		fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT | os.O_EXCL, 0600)
+		self._writer = os.fdopen(fd, 'ab')
+
+	def close(self):
+		if self._writer is not None:
+			self._writer.close()
+			self._writer = None
+		if self._offset_fd is not None:
+			os.close(self._offset_fd)
+			self._offset_fd = None
+
+	def _load_offset(self):
+		try:
+			with open(self._offset_file) as fd:
+				segment, position = fd.read().split()
+			return int(segment), int(position)
+		except (IOError, ValueError):
+			return 0, 0
+
+	def _stat_directory(self):
+		try:
+			stat = os.stat(self.directory)
+		except OSError:
+			return None
+		return (stat.st_dev, stat.st_ino)
+
+	def commit(self, segment, position):
+		"""Remembers that all records before `position` of `segment` have been read and removes the older segments.
+		Returns False without doing so if the journal has been removed since read() started."""
+		if self._directory_id is None or self._directory_id != self._stat_directory():
+			# the listener module removed the journal in clean(): the records read
+			# before belong to the old journal and must not change the new one
+			ud.debug(ud.LDAP, ud.PROCESS, 'journal: %s has been removed while reading, stop reading' % (self.directory,))
+			self._directory_id = None
+			if self._offset_fd is not None:
+				os.close(self._offset_fd)
+				self._offset_fd = None
+			self._committed_segment = None
+			return False
+		# the offset has a fixed width, so it is overwritten with a single small write
+		if self._offset_fd is None:
+			self._offset_fd = os.open(self._offset_file, os.O_WRONLY | os.O_CREAT, 0600)
+		os.lseek(self._offset_fd, 0, os.SEEK_SET)
+		os.write(self._offset_fd, '%020d %020d\n' % (segment, position))
+		if segment == self._committed_segment:
+			return True
+		self._committed_segment = segment
+		for old in self._segments():
+			if old >= segment:
+				break
+			try:
+				os.remove(self._segment_path(old))
+			except OSError:
+				pass
+		return True
+
+	def read(self, limit=None):
+		"""Yields `(segment, position, change)` for at most `limit` records after the last commit(),
+		`position` being the end of the record. `change` is None if only the position advanced,
+		e.g. to the next segment or over a broken record."""
+		self._directory_id = self._stat_directory()
+		offset_segment, offset_position = self._load_offset()
+		segments = [segment for segment in self._segments() if segment >= offset_segment]
+		count = 0
+		for index, segment in enumerate(segments):
+			last = index == len(segments) - 1
+			position = offset_position if segment == offset_segment else 0
+			try:
+				fd = open(self._segment_path(segment), 'rb')
+			except IOError:
+				continue
+			with fd:
+				fd.seek(position)
+				while True:
+					if (limit is not None and count >= limit) or self._directory_id is None:
+						return
+					header = fd.read(_HEADER.size)
+					if not header:
+						break
+					payload = ''
+					if len(header) == _HEADER.size:
+						length, crc = _HEADER.unpack(header)
+						payload = fd.read(length)
+					if len(header) < _HEADER.size or len(payload) < length:
+						if last:
+							# the listener may still be writing the record
+							return
+						ud.debug(ud.LDAP, ud.ERROR, 'journal: incomplete record at %d in segment %d, skipping it' % (position, segment))
+						break
+					if zlib.crc32(payload) & 0xffffffff != crc:
+						ud.debug(ud.LDAP, ud.ERROR, 'journal: broken record at %d in segment %d, skipping the rest of the segment' % (position, segment))
+						if last:
+							fd.seek(0, os.SEEK_END)
+							yield segment, fd.tell(), None
+							return
+						break
+					position = fd.tell()
+					count += 1
+					yield segment, position, cPickle.loads(payload)
+			if not last:
+				yield segments[index + 1], 0, None
+
+	def backlog(self):
+		"""Returns the number of bytes which have not been read yet, without reading the records."""
+		offset_segment, offset_position = self._load_offset()
+		size = 0
+		for segment in self._segments():
+			if segment < offset_segment:
+				continue
+			try:
+				size += os.path.getsize(self._segment_path(segment))
+			except OSError:
+				continue
+			if segment == offset_segment:
+				size -= offset_position
+		return max(size, 0)
+
+
+def _is_modification(change):
+	dn, new, old, old_dn = change
+	if not (new and old) or (old_dn and old_dn != dn):
+		return False
+	if not new.get('entryUUID') or 'msGPO' in new.get('objectClass', []):
+		# the entryCSN of every modification of a GPO is checked by the connector
+		return False
+	return True
+
+
+def coalesce(changes):
+	"""Collapses consecutive modifications of the same object in `changes`, a list of
+	`(dn, new, old, old_dn)` tuples; entries which are None are left out.
+
+	Returns a list of `(first, last, count, change)`, ordered by `last`: the indices of
+	the first and the last of the `count` collapsed changes and the change itself with
+	the `old` of the first and the `new` of the last modification. Adds, deletes and
+	moves are never collapsed and end the modifications of an object which can be
+	collapsed."""
+	result = []
+	runs = {}  # entryUUID: index in result of the last modification of the object
+	for index, change in enumerate(changes):
+		if change is None:
+			continue
+		dn, new, old, old_dn = change
+		entryUUID = (new or old).get('entryUUID', [None])[0]
+		if not _is_modification(change):
+			runs.pop(entryUUID, None)
+			result.append((index, index, 1, change))
+			continue
+		first, count = index, 1
+		run = runs.get(entryUUID)
+		if run is not None and result[run][3][0] == dn:
+			first, last, count, previous = result[run]
+			result[run] = None
+			change = (dn, new, previous[2], previous[3])
+			count += 1
+		runs[entryUUID] = len(result)
+		result.append((first, index, count, change))
+	return [item for item in result if item is not None]
@@ -0,0 +1,226 @@
+#!/usr/bin/python2.7
+# -*- coding: utf-8 -*-
+#
+# Univention S4 Connector
+#  LDAP filters matched against the attributes of an object
+#
+# Copyright 2018 Univention GmbH
+#
+# http://www.univention.de/
+#
+# All rights reserved.
+#
+# The source code of this program is made available
+# under the terms of the GNU Affero General Public License version 3
+# (GNU AGPL V3) as published by the Free Software Foundation.
+#
+# Binary versions of this program provided by Univention to you as
+# well as other copyrighted, protected or trademarked materials like
+# Logos, graphics, fonts, specific documentations and configurations,
+# cryptographic keys etc. are subject to a license agreement between
+# you and Univention and not subject to the GNU AGPL V3.
+#
+# In the case you use this program under the terms of the GNU AGPL V3,
+# the program is provided in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License with the Debian GNU/Linux or Univention distribution in file
+# /usr/share/common-licenses/AGPL-3; if not, see
+# <http://www.gnu.org/licenses/>.
+
+import univention.debug2 as ud
+
+BITWISE_AND = ':1.2.840.113556.1.4.803:'
+
+_compiled = {}
+
+
+class Attributes(object):
+
+	"""
+		The attributes of an object, case folded once for all filters
+		which are matched against the object.
+	"""
+
+	__slots__ = ('values', '_lowered')
+
+	def __init__(self, attributes):
+		self.values = dict((key.lower(), value) for key, value in attributes.iteritems())
+		self._lowered = {}
+
+	def lowered(self, attribute):
+		try:
+			return self._lowered[attribute]
+		except KeyError:
+			value = self.values[attribute]
+			if isinstance(value, list):
+				value = [element.lower() for element in value]
+			self._lowered[attribute] = value
+			return value
+
+
+class _Not(object):
+	__slots__ = ('filter',)
+
+	def __init__(self, filter):
+		self.filter = filter
+
+	def match(self, attributes):
+		return not self.filter.match(attributes)
+
+
+class _And(object):
+	__slots__ = ('filters',)
+
+	def __init__(self, filters):
+		self.filters = filters
+
+	def match(self, attributes):
+		for filter in self.filters:
+			if not filter.match(attributes):
+				return False
+		return True
+
+
+class _Or(_And):
+	__slots__ = ()
+
+	def match(self, attributes):
+		for filter in self.filters:
+			if filter.match(attributes):
+				return True
+		return False
+
+
+class _Present(object):
+	__slots__ = ('attribute',)
+
+	def __init__(self, attribute):
+		self.attribute = attribute
+
+	def match(self, attributes):
+		return self.attribute in attributes.values
+
+
+class _Equal(object):
+	__slots__ = ('attribute', 'value')
+
+	def __init__(self, attribute, value):
+		self.attribute = attribute
+		self.value = value.lower()
+
+	def match(self, attributes):
+		return self.attribute in attributes.values and self.value in attributes.lowered(self.attribute)
+
+
+class _BitwiseAnd(object):
+	__slots__ = ('attribute', 'value')
+
+	def __init__(self, attribute, value):
+		self.attribute = attribute
+		try:
+			self.value = int(value)
+		except ValueError:
+			self.value = None
+
+	def match(self, attributes):
+		value = attributes.values.get(self.attribute)
+		if not value:
+			return False
+		try:
+			if isinstance(value, list):
+				value = int(value[0])
+			return (value & self.value) == self.value
+		except (TypeError, ValueError):
+			ud.debug(ud.LDAP, ud.WARN, "attribute_filter: Failed to convert attributes for bitwise filter")
+			return False
+
+
+def _split(filter):
+	opened = []
+	closed = []
+	level = 0
+	for pos, char in enumerate(filter):
+		if char == '(':
+			if level == 0:
+				opened.append(pos)
+			level += 1
+		elif char == ')':
+			if level == 1:
+				closed.append(pos)
+			level -= 1
+		if level < 0:
+			raise ValueError("too many ')' in filter: %s" % filter)
+
+	if len(opened) != len(closed):
+		raise ValueError("'(' and ')' don't match in filter: %s" % filter)
+	return [filter[start + 1:end] for start, end in zip(opened, closed)]
+
+
+def _parse(filter):
+	if not filter:
+		raise ValueError('empty filter')
+	if filter[0] == '(':
+		if not filter[-1] == ')':
+			raise ValueError("matching ) missing in filter: %s" % filter)
+		return _parse(filter[1:-1])
+	elif filter[0] == '!':
+		return _Not(_parse(filter[1:]))
+	elif filter[0] in ('&', '|'):
+		filters = filter[1:]
+		if filters and filters[0] == '(':
+			if not filters[-1] == ')':
+				raise ValueError("matching ) missing in filter: %s" % filters)
+			filters = [_parse(subfilter) for subfilter in _split(filters)]
+		else:
+			filters = [_parse(filters)]
+		return _And(filters) if filter[0] == '&' else _Or(filters)
+
+	pos = filter.find('=')
+	if pos < 0:
+		raise ValueError('missing "=" in filter: %s' % filter)
+	attribute = filter[:pos].lower()
+	if not attribute:
+		raise ValueError('missing attribute in filter: %s' % filter)
+	value = filter[pos + 1:]
+	if attribute.endswith(BITWISE_AND):
+		return _BitwiseAnd(attribute[:-len(BITWISE_AND)], value)
+	if value == '*':
+		return _Present(attribute)
+	return _Equal(attribute, value)
+
+
+class Filter(object):
+
+	"""
+		A LDAP filter compiled into a tree of matchers. The filter is
+		matched like the connector always did:
+		- attribute names and values are compared case-insensitive
+		- only * as value matches the presence of the attribute
+		- the bitwise AND matching rule 1.2.840.113556.1.4.803 is supported
+	"""
+
+	def __init__(self, filter):
+		self.filter = filter
+		self._root = _parse(filter)
+
+	def match(self, attributes):
+		"""Returns whether `attributes`, a dict or :class:`Attributes`, match the filter."""
+		if not isinstance(attributes, Attributes):
+			attributes = Attributes(attributes)
+		return self._root.match(attributes)
+
+	def __repr__(self):
+		return '%s(%r)' % (type(self).__name__, self.filter)
+
+
+def compile_filter(filter):
+	"""Returns the :class:`Filter` for the LDAP filter string `filter`, which is compiled only once."""
+	try:
+		return _compiled[filter]
+	except KeyError:
+		compiled = _compiled[filter] = Filter(filter)
+		return compiled
@@ -44,6 +44,7 @@ import array
 import univention.uldap
 import univention.s4connector
 import univention.debug2 as ud
+from univention.s4connector.ldapfilter import Attributes
 from ldap.controls import LDAPControl
 from ldap.controls import SimplePagedResultsControl
 from ldap.filter import escape_filter_chars
@@ -60,6 +61,7 @@ LDB_CONTROL_PROVISION_OID = '1.3.6.1.4.1.7165.4.3.16'
 
 # page results
 PAGE_SIZE = 1000
+MEMBER_BATCH_SIZE = 100  # group members resolved with one search
 
 
 def normalise_userAccountControl(s4connector, key, object):
@@ -171,6 +173,15 @@ def encode_attrib(attrib):
 	return unicode(attrib, 'utf8')
 
 
+def normalise_dn(dn):
+	'''Return the lower case DN in a canonical form, so that e.g. "CN=a, DC=b" and "cn=a,dc=b" compare equal'''
+	dn = encode_attrib(dn).lower().encode('utf8')
+	try:
+		return ldap.dn.dn2str(ldap.dn.str2dn(dn))
+	except ldap.DECODING_ERROR:
+		return dn
+
+
 def encode_attriblist(attriblist):
 	if not isinstance(attriblist, type([])):
 		return encode_attrib(attriblist)
@@ -1417,8 +1428,9 @@ class s4(univention.s4connector.ucs):
 		_d = ud.function('ldap.__identify')
 		if not object or 'attributes' not in object:
 			return None
+		attributes = Attributes(object['attributes'])
 		for key in self.property.keys():
-			if self._filter_match(self.property[key].con_search_filter, object['attributes']):
+			if self._filter_match(self.property[key].con_search_filter, attributes):
 				return key
 
 	def __update_lastUSN(self, object):
@@ -1635,6 +1647,33 @@ class s4(univention.s4connector.ucs):
 		ud.debug(ud.LDAP, ud.INFO, "__group_cache_ucs_append_member: Append user %s to group ucs cache of %s" % (member.lower(), group.lower()))
 		self.group_members_cache_ucs[group.lower()].append(member.lower())
 
+	def __get_ucs_members(self, member_dns):
+		"""
+		read the UCS objects of group members with one search per MEMBER_BATCH_SIZE
+		members, returns a dict of the normalised DNs and the attributes of the found objects
+		"""
+		_d = ud.function('ldap.__get_ucs_members')
+		members = {}
+		for i in range(0, len(member_dns), MEMBER_BATCH_SIZE):
+			member_filter = '(|%s)' % ''.join(format_escaped('(entryDN={0!e})', member_dn) for member_dn in member_dns[i:i + MEMBER_BATCH_SIZE])
+			for member_dn, attributes in self.lo.search(filter=member_filter):
+				members[normalise_dn(member_dn)] = attributes
+		return members
+
+	def __get_existing_s4_dns(self, s4_dns):
+		"""
+		check with one search per MEMBER_BATCH_SIZE objects which of the DNs exist
+		in S4, returns the normalised DNs of the found objects
+		"""
+		_d = ud.function('ldap.__get_existing_s4_dns')
+		existing = set()
+		for i in range(0, len(s4_dns), MEMBER_BATCH_SIZE):
+			s4_filter = '(|%s)' % ''.join(format_escaped('(distinguishedName={0!e})', s4_dn) for s4_dn in s4_dns[i:i + MEMBER_BATCH_SIZE])
+			for s4_dn, attributes in self.__search_s4(filter=compatible_modstring(s4_filter), attrlist=['cn']):
+				if s4_dn not in ['None', '', None]:  # filter referrals
+					existing.add(normalise_dn(s4_dn))
+		return existing
+
 	def group_members_sync_from_ucs(self, key, object):  # object mit s4-dn
 		"""
 		sync groupmembers in S4 if changend in UCS
@@ -1686,6 +1725,8 @@ class s4(univention.s4connector.ucs):
 		s4_members_from_ucs = set()
 
 		# map members from UCS to S4 and check if they exist
+		ucs_members_attributes = self.__get_ucs_members([member_dn for member_dn in ucs_members if not self.group_mapping_cache_ucs.get(member_dn.lower())])
+		mapped_members = []
 		for member_dn in ucs_members:
 			s4_dn = self.group_mapping_cache_ucs.get(member_dn.lower())
 			if s4_dn:
@@ -1694,7 +1735,7 @@ class s4(univention.s4connector.ucs):
 				self.__group_cache_ucs_append_member(object_ucs['dn'], member_dn)
 			else:
 				ud.debug(ud.LDAP, ud.INFO, "Did not find %s in group cache ucs" % member_dn)
-				member_object = {'dn': member_dn, 'modtype': 'modify', 'attributes': self.lo.get(member_dn)}
+				member_object = {'dn': member_dn, 'modtype': 'modify', 'attributes': ucs_members_attributes.get(normalise_dn(member_dn), {})}
 
 				# can't sync them if users have no posix-account
 				if not member_object['attributes'].get('gidNumber'):
@@ -1712,16 +1753,17 @@ class s4(univention.s4connector.ucs):
 						break
 				# print 'object key: %s' % key
 				s4_dn = self._object_mapping(key, member_object, 'ucs')['dn']
-				# check if dn exists in s4
-				try:
-					if self.lo_s4.get(s4_dn, attr=['cn']):  # search only for cn to suppress coding errors
-						s4_members_from_ucs.add(s4_dn.lower())
-						self.group_mapping_cache_ucs[member_dn.lower()] = s4_dn
-						self.__group_cache_ucs_append_member(object_ucs['dn'], member_dn)
-				except (ldap.SERVER_DOWN, SystemExit):
-					raise
-				except:  # FIXME: which exception is to be caught?
-					ud.debug(ud.LDAP, ud.INFO, "group_members_sync_from_ucs: failed to get dn from s4, assume object doesn't exist")
+				mapped_members.append((member_dn, s4_dn))
+
+		existing_s4_dns = self.__get_existing_s4_dns([s4_dn for member_dn, s4_dn in mapped_members])
+		for member_dn, s4_dn in mapped_members:
+			# check if dn exists in s4
+			if normalise_dn(s4_dn) in existing_s4_dns:
+				s4_members_from_ucs.add(s4_dn.lower())
+				self.group_mapping_cache_ucs[member_dn.lower()] = s4_dn
+				self.__group_cache_ucs_append_member(object_ucs['dn'], member_dn)
+			else:
+				ud.debug(ud.LDAP, ud.INFO, "group_members_sync_from_ucs: %s does not exist in s4" % s4_dn)
 
 		ud.debug(ud.LDAP, ud.INFO, "group_members_sync_from_ucs: UCS-members in s4_members_from_ucs %s" % s4_members_from_ucs)
 
@@ -2252,6 +2294,7 @@ class s4(univention.s4connector.ucs):
 					raise
 				except Exception, msg:
 					self._debug_traceback(ud.ERROR, "unexpected Error during s4.resync_rejected")
+		self.s4cache.commit()
 		print "restored %s rejected changes" % change_count
 		print "--------------------------------------"
 		sys.stdout.flush()
@@ -2382,6 +2425,9 @@ class s4(univention.s4connector.ucs):
 
 		print ""
 
+		# write the S4 cache before the USN, so no change is lost if the connector is stopped in between
+		self.s4cache.commit()
+
 		if newUSN != lastUSN:
 			self._set_lastUSN(newUSN)
 			self._commit_lastUSN()
@@ -240,6 +240,7 @@ def connect():
 			if str(retry_rejected) == baseconfig_retry_rejected:
 				s4.resync_rejected_ucs()
 				s4.resync_rejected()
+				s4.log_cache_statistics()
 				retry_rejected = 0
 			else:
 				retry_rejected += 1
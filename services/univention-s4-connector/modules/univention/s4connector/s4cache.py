@@ -43,10 +43,13 @@ def func_name():
 
 
 def _decode_base64(val):
-	return base64.decodestring(val)
+	return binascii.a2b_base64(val)
 
 
 def _encode_base64(val):
+	# same as base64.encodestring(), which encodes lines of 57 bytes
+	if 0 < len(val) <= 57:
+		return binascii.b2a_base64(val)
 	return base64.encodestring(val)
 
 
@@ -80,28 +83,36 @@ class S4Cache:
 			With this cache the connector has the possibility to create
 			a diff between the new Samba 4 object and the old one from
 			cache.
+
+			Changed entries are kept in memory and written to the
+			database in one transaction by commit(), which the connector
+			calls after each poll cycle.
 	"""
 
+	# number of changed entries after which they are written even without commit()
+	COMMIT_INTERVAL = 1000
+	# number of GUIDs read by one SELECT
+	CHUNK_SIZE = 500
+
 	def __init__(self, filename):
 		_d = ud.function('S4Cache.%s' % func_name())
 		self.filename = filename
-		self._dbcon = sqlite3.connect(self.filename)
-		self.s4cache = {}
+		self._dbcon = None
+		self._attr_ids = {}  # attribute: id
+		self._attr_names = {}  # id: attribute
+		self._guid_ids = {}  # guid: id
+		self.s4cache = {}  # guid: entry changed since the last commit(), None if removed
 
+		self.__connect()
 		self.__create_tables()
 
 	def add_entry(self, guid, entry):
-		_d = ud.function('S4Cache.%s' % func_name())
-
-		if not self._guid_exists(guid):
-			self._add_entry(guid, entry)
-		else:
-			self._update_entry(guid, entry)
-		self.s4cache[guid] = entry
+		guid = guid.strip()
+		self.s4cache[guid] = dict((attr, list(values)) for attr, values in entry.items())
+		if len(self.s4cache) >= self.COMMIT_INTERVAL:
+			self.commit()
 
 	def diff_entry(self, old_entry, new_entry):
-		_d = ud.function('S4Cache.%s' % func_name())
-
 		result = {'added': None, 'removed': None, 'changed': None}
 
 		diff = EntryDiff(old_entry, new_entry)
@@ -113,51 +124,142 @@ class S4Cache:
 		return result
 
 	def get_entry(self, guid):
-		_d = ud.function('S4Cache.%s' % func_name())
-
-		entry = {}
-
-		guid_id = self._get_guid_id(guid)
-
-		if not guid_id:
-			return None
-
-		# The SQLite python module should do the escaping, that's
-		# the reason why we use the tuple ? syntax.
-		# I've choosen the str call because I want to make sure
-		# that we use the same SQL value as before switching
-		# to the tuple ? syntax
-		sql_commands = [
-			("SELECT ATTRIBUTES.attribute,data.value from data \
-				inner join ATTRIBUTES ON data.attribute_id=attributes.id where guid_id = ?;", (str(guid_id),))
-		]
-
-		rows = self.__execute_sql_commands(sql_commands, fetch_result=True)
-
-		if not rows:
-			return None
-
-		for line in rows:
-			if not entry.get(line[0]):
-				entry[str(line[0])] = []
-			entry[line[0]].append(_decode_base64(line[1]))
-
-		return entry
+		return self.get_entries([guid]).get(guid.strip())
+
+	def get_entries(self, guids):
+		"""Returns a dictionary with the entries of the given GUIDs; GUIDs which are not cached are left out."""
+		result = {}
+		missing = []
+		for guid in guids:
+			guid = guid.strip()
+			if guid in self.s4cache:
+				if self.s4cache[guid] is not None:
+					result[guid] = dict((attr, list(values)) for attr, values in self.s4cache[guid].items())
+			else:
+				missing.append(guid)
+		for i in [1, 2]:
+			try:
+				result.update(self._read_entries(missing))
+				break
+			except sqlite3.Error, exp:
+				ud.debug(ud.LDAP, ud.WARN, "S4Cache: sqlite: %s. Reading %d entries failed." % (exp, len(missing)))
+				self.__reconnect()
+		return result
 
 	def remove_entry(self, guid):
+		guid = guid.strip()
+		self.s4cache[guid] = None
+		if len(self.s4cache) >= self.COMMIT_INTERVAL:
+			self.commit()
+
+	def commit(self):
+		"""Write all changed entries to the database in one transaction."""
+		if not self.s4cache:
+			return
 		_d = ud.function('S4Cache.%s' % func_name())
+		for i in [1, 2]:
+			try:
+				self._write_entries(self.s4cache)
+				self._dbcon.commit()
+				self.s4cache.clear()
+				return
+			except sqlite3.Error, exp:
+				ud.debug(ud.LDAP, ud.WARN, "S4Cache: sqlite: %s. Writing %d entries failed." % (exp, len(self.s4cache)))
+				self.__reconnect()
+		ud.debug(ud.LDAP, ud.ERROR, "S4Cache: %d changed entries could not be written, trying again with the next commit." % (len(self.s4cache),))
+
+	def _read_entries(self, guids):
+		"""Reads the given GUIDs from the database, ignoring the entries changed in memory."""
+		result = {}
+		guids = list(set(guids))
+		for i in range(0, len(guids), self.CHUNK_SIZE):
+			chunk = guids[i:i + self.CHUNK_SIZE]
+			# The SQLite python module should do the escaping, that's
+			# the reason why we use the tuple ? syntax.
+			rows = self._dbcon.execute(
+				"SELECT GUIDS.guid, GUIDS.id, DATA.attribute_id, DATA.value FROM GUIDS \
+					LEFT JOIN DATA ON DATA.guid_id=GUIDS.id WHERE GUIDS.guid IN (%s);" % (','.join('?' * len(chunk)),), tuple(str(guid) for guid in chunk)
+			).fetchall()
+			for guid, guid_id, attr_id, value in rows:
+				self._guid_ids[guid] = guid_id
+				if attr_id is None:
+					continue
+				entry = result.setdefault(guid, {})
+				entry.setdefault(self._get_attr_name(attr_id), []).append(_decode_base64(value))
+		return result
 
-		guid_id = self._get_guid_id(guid)
-
-		if not guid_id:
-			return None
+	def _write_entries(self, entries):
+		cur = self._dbcon.cursor()
+		old_entries = self._read_entries(entries.keys())
+		delete_guids = []
+		delete_attributes = []
+		delete_values = []
+		insert_values = []
+		for guid, entry in entries.items():
+			old_entry = old_entries.get(guid, {})
+			guid_id = self._guid_ids.get(guid)
+			if entry is None:
+				if guid_id is not None:
+					delete_guids.append((guid_id,))
+					del self._guid_ids[guid]
+				continue
+			if guid_id is None:
+				cur.execute("INSERT INTO GUIDS(guid) VALUES(?);", (str(guid),))
+				guid_id = self._guid_ids[guid] = cur.lastrowid
+
+			diff = EntryDiff(old_entry, entry)
+			for attribute in diff.removed():
+				delete_attributes.append((guid_id, self._get_attr_id(cur, attribute)))
+			for attribute in diff.added():
+				attr_id = self._get_attr_id(cur, attribute)
+				insert_values.extend((guid_id, attr_id, _encode_base64(value)) for value in entry[attribute])
+			for attribute in diff.changed():
+				attr_id = self._get_attr_id(cur, attribute)
+				old_values, new_values = set(old_entry[attribute]), set(entry[attribute])
+				delete_values.extend((guid_id, attr_id, _encode_base64(value)) for value in old_values - new_values)
+				insert_values.extend((guid_id, attr_id, _encode_base64(value)) for value in new_values - old_values)
+
+		ud.debug(ud.LDAP, ud.INFO, "S4Cache: writing %d entries: %d removed, %d values removed, %d values added" % (len(entries), len(delete_guids), len(delete_values), len(insert_values)))
+		cur.executemany("DELETE FROM DATA WHERE guid_id=?;", delete_guids)
+		cur.executemany("DELETE FROM GUIDS WHERE id=?;", delete_guids)
+		cur.executemany("DELETE FROM DATA WHERE guid_id=? AND attribute_id=?;", delete_attributes)
+		cur.executemany("DELETE FROM DATA WHERE guid_id=? AND attribute_id=? AND value=?;", delete_values)
+		cur.executemany("INSERT INTO DATA(guid_id,attribute_id,value) VALUES(?,?,?);", insert_values)
+		cur.close()
+
+	def _get_attr_id(self, cur, attr):
+		attr_id = self._attr_ids.get(attr)
+		if attr_id is None:
+			cur.execute("INSERT INTO ATTRIBUTES(attribute) VALUES(?);", (str(attr),))
+			attr_id = cur.lastrowid
+			self._attr_ids[attr] = attr_id
+			self._attr_names[attr_id] = attr
+		return attr_id
 
-		sql_commands = [
-			("DELETE FROM data WHERE guid_id=?;", (str(guid_id),)),
-			("DELETE FROM guids WHERE id=?;", (str(guid_id),))
-		]
+	def _get_attr_name(self, attr_id):
+		if attr_id not in self._attr_names:
+			self.__load_attributes()
+		return self._attr_names[attr_id]
 
-		self.__execute_sql_commands(sql_commands, fetch_result=False)
+	def __connect(self):
+		if self._dbcon:
+			self._dbcon.close()
+		self._dbcon = sqlite3.connect(self.filename)
+		self._dbcon.text_factory = str
+		# the cache is rebuilt from Samba 4 if it gets lost, so a commit must not wait for the disk
+		self._dbcon.execute("PRAGMA journal_mode=WAL;")
+		self._dbcon.execute("PRAGMA synchronous=NORMAL;")
+
+	def __reconnect(self):
+		# forget the IDs of a failed transaction
+		self.__connect()
+		self._guid_ids.clear()
+		self.__load_attributes()
+
+	def __load_attributes(self):
+		rows = self.__execute_sql_commands(["SELECT id, attribute FROM ATTRIBUTES;"], fetch_result=True)
+		self._attr_names = dict(rows or [])
+		self._attr_ids = dict((attr, attr_id) for attr_id, attr in self._attr_names.items())
 
 	def __execute_sql_commands(self, sql_commands, fetch_result=False):
 		for i in [1, 2]:
@@ -165,24 +267,19 @@ class S4Cache:
 				cur = self._dbcon.cursor()
 				for sql_command in sql_commands:
 					if isinstance(sql_command, tuple):
-						ud.debug(ud.LDAP, ud.INFO, "S4Cache: Execute SQL command: '%s', '%s'" % (sql_command[0], sql_command[1]))
 						cur.execute(sql_command[0], sql_command[1])
 					else:
-						ud.debug(ud.LDAP, ud.INFO, "S4Cache: Execute SQL command: '%s'" % sql_command)
 						cur.execute(sql_command)
-				self._dbcon.commit()
 				if fetch_result:
 					rows = cur.fetchall()
 				cur.close()
 				if fetch_result:
-					ud.debug(ud.LDAP, ud.INFO, "S4Cache: Return SQL result: '%s'" % rows)
 					return rows
 				return None
 			except sqlite3.Error, exp:
 				ud.debug(ud.LDAP, ud.WARN, "S4Cache: sqlite: %s. SQL command was: %s" % (exp, sql_commands))
-				if self._dbcon:
-					self._dbcon.close()
-				self._dbcon = sqlite3.connect(self.filename)
+				self.__connect()
+				self._guid_ids.clear()
 
 	def __create_tables(self):
 		_d = ud.function('S4Cache.%s' % func_name())
@@ -197,139 +294,8 @@ class S4Cache:
 		]
 
 		self.__execute_sql_commands(sql_commands, fetch_result=False)
-
-	def _guid_exists(self, guid):
-		_d = ud.function('S4Cache.%s' % func_name())
-
-		return self._get_guid_id(guid.strip()) is not None
-
-	def _get_guid_id(self, guid):
-		_d = ud.function('S4Cache.%s' % func_name())
-
-		sql_commands = [
-			("SELECT id FROM GUIDS WHERE guid=?;", (str(guid),))
-		]
-
-		rows = self.__execute_sql_commands(sql_commands, fetch_result=True)
-
-		if rows:
-			return rows[0][0]
-
-		return None
-
-	def _append_guid(self, guid):
-		_d = ud.function('S4Cache.%s' % func_name())
-
-		sql_commands = [
-			("INSERT INTO GUIDS(guid) VALUES(?);", (str(guid),))
-		]
-
-		rows = self.__execute_sql_commands(sql_commands, fetch_result=False)
-
-	def _get_attr_id(self, attr):
-		_d = ud.function('S4Cache.%s' % func_name())
-
-		sql_commands = [
-			("SELECT id FROM ATTRIBUTES WHERE attribute=?;", (str(attr),))
-		]
-
-		rows = self.__execute_sql_commands(sql_commands, fetch_result=True)
-
-		if rows:
-			return rows[0][0]
-
-		return None
-
-	def _attr_exists(self, guid):
-		_d = ud.function('S4Cache.%s' % func_name())
-
-		return self._get_attr_id(guid) is not None
-
-	def _create_attr(self, attr):
-		_d = ud.function('S4Cache.%s' % func_name())
-
-		sql_commands = [
-			("INSERT INTO ATTRIBUTES(attribute) VALUES(?);", (str(attr),))
-		]
-
-		self.__execute_sql_commands(sql_commands, fetch_result=False)
-
-	def _get_attr_id_and_create_if_not_exists(self, attr):
-		_d = ud.function('S4Cache.%s' % func_name())
-		attr_id = self._get_attr_id(attr)
-		if not attr_id:
-			self._create_attr(attr)
-			attr_id = self._get_attr_id(attr)
-
-		return attr_id
-
-	def _add_entry(self, guid, entry):
-		_d = ud.function('S4Cache.%s' % func_name())
-
-		guid = guid.strip()
-
-		self._append_guid(guid)
-		guid_id = self._get_guid_id(guid)
-
-		sql_commands = []
-		for attr in entry.keys():
-			attr_id = self._get_attr_id_and_create_if_not_exists(attr)
-			for value in entry[attr]:
-				sql_commands.append(
-					(
-						"INSERT INTO DATA(guid_id,attribute_id,value) VALUES(?,?,?);", (str(guid_id), str(attr_id), _encode_base64(value))
-					)
-				)
-
-		if sql_commands:
-			self.__execute_sql_commands(sql_commands, fetch_result=False)
-
-	def _update_entry(self, guid, entry):
-		_d = ud.function('S4Cache.%s' % func_name())
-
-		guid = guid.strip()
-		guid_id = self._get_guid_id(guid)
-		old_entry = self.get_entry(guid)
-		diff = self.diff_entry(old_entry, entry)
-
-		sql_commands = []
-		for attribute in diff['removed']:
-			sql_commands.append(
-				(
-					"DELETE FROM data WHERE data.id IN (\
-				SELECT data.id FROM DATA INNER JOIN ATTRIBUTES ON data.attribute_id=attributes.id \
-					where attributes.attribute=? and guid_id=? \
-				);", (str(attribute), str(guid_id))
-				)
-			)
-		for attribute in diff['added']:
-			attr_id = self._get_attr_id_and_create_if_not_exists(attribute)
-			for value in entry[attribute]:
-				sql_commands.append(
-					(
-						"INSERT INTO DATA(guid_id,attribute_id,value) VALUES(?,?,?);", (str(guid_id), str(attr_id), _encode_base64(value))
-					)
-				)
-		for attribute in diff['changed']:
-			attr_id = self._get_attr_id_and_create_if_not_exists(attribute)
-			for value in set(old_entry.get(attribute)) - set(entry.get(attribute)):
-				sql_commands.append(
-					(
-						"DELETE FROM data WHERE data.id IN (\
-							SELECT data.id FROM DATA INNER JOIN ATTRIBUTES ON data.attribute_id=attributes.id \
-							where attributes.id=? and guid_id = ? and value = ? \
-						);", (str(attr_id), str(guid_id), _encode_base64(value))
-					)
-				)
-			for value in set(entry.get(attribute)) - set(old_entry.get(attribute)):
-				sql_commands.append(
-					(
-						"INSERT INTO DATA(guid_id,attribute_id,value) VALUES(?,?,?);", (str(guid_id), str(attr_id), _encode_base64(value))
-					)
-				)
-
-		if sql_commands:
-			self.__execute_sql_commands(sql_commands, fetch_result=False)
+		self._dbcon.commit()
+		self.__load_attributes()
 
 
 if __name__ == '__main__':
@@ -367,4 +333,20 @@ if __name__ == '__main__':
 		raise Exception('Test 3 failed: %s' % diff_entry)
 	print '.',
 
+	s4cache.commit()
+	s4cache = S4Cache('cache.sqlite')
+	entry_old = s4cache.get_entry(guid)
+	diff_entry = s4cache.diff_entry(entry_old, entry)
+	if diff_entry.get('changed') or diff_entry.get('removed') or diff_entry.get('added'):
+		raise Exception('Test 4 failed: %s' % diff_entry)
+	print '.',
+
+	s4cache.add_entry('5678', {'attr1': ['foobar']})
+	s4cache.remove_entry(guid)
+	s4cache.commit()
+	entries = s4cache.get_entries([guid, '5678'])
+	if entries != {'5678': {'attr1': ['foobar']}}:
+		raise Exception('Test 5 failed: %s' % entries)
+	print '.',
+
 	print ' done'
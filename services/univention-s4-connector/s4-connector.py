@@ -35,9 +35,9 @@ from __future__ import absolute_import
 import cPickle
 import listener
 import os
-import time
 import shutil
 import univention.debug
+from univention.s4connector.journal import Journal, JOURNAL_DIR
 
 name = 's4-connector'
 description = 'S4 Connector replication'
@@ -59,6 +59,7 @@ if 'connector/listener/additionalbasenames' in listener.configRegistry and liste
 			dirs.append(listener.configRegistry['%s/s4/listener/dir' % configbasename])
 		else:
 			univention.debug.debug(univention.debug.LISTENER, univention.debug.WARN, "s4-connector: additional config basename %s given, but %s/s4/listener/dir not set; ignore basename." % (configbasename, configbasename))
+journals = dict((directory, Journal(directory)) for directory in dirs)
 
 
 def _save_old_object(directory, dn, old):
@@ -81,22 +82,8 @@ def _load_old_object(directory):
 	return (old_dn, old_object)
 
 
-def _dump_changes_to_file_and_check_file(directory, dn, new, old, old_dn):
-	ob = (dn, new, old, old_dn)
-
-	tmpdir = os.path.join(directory, 'tmp')
-	filename = '%f' % (time.time(),)
-	filepath = os.path.join(tmpdir, filename)
-
-	with open(filepath, 'w+') as fd:
-		os.chmod(filepath, 0600)
-		p = cPickle.Pickler(fd)
-		p.dump(ob)
-		p.clear_memo()
-
-	# prevent a race condition between the pickle file is only partly written to disk and then read
-	# by moving it to the final location after it is completely written to disk
-	shutil.move(filepath, os.path.join(directory, filename))
+def _append_change(directory, dn, new, old, old_dn):
+	journals[directory].append((dn, new, old, old_dn))
 
 
 def _is_module_disabled():
@@ -131,14 +118,14 @@ def handler(dn, new, old, command):
 				#  https://forge.univention.org/bugzilla/show_bug.cgi?id=32542
 				if old_dn and new.get('entryUUID') != old_object.get('entryUUID'):
 					univention.debug.debug(univention.debug.LISTENER, univention.debug.PROCESS, "The entryUUID attribute of the saved object (%s) does not match the entryUUID attribute of the current object (%s). This can be normal in a selective replication scenario." % (old_dn, dn))
-					_dump_changes_to_file_and_check_file(directory, old_dn, {}, old_object, None)
+					_append_change(directory, old_dn, {}, old_object, None)
 					old_dn = None
 
 				if s4_init_mode:
 					if new and 'univentionGroup' in new.get('objectClass', []):
 						group_objects.append((dn, new, old, old_dn))
 
-				_dump_changes_to_file_and_check_file(directory, dn, new, old, old_dn)
+				_append_change(directory, dn, new, old, old_dn)
 
 				if os.path.exists(os.path.join(directory, 'tmp', 'old_dn')):
 					os.unlink(os.path.join(directory, 'tmp', 'old_dn'))
@@ -153,8 +140,11 @@ def clean():
 		for directory in dirs:
 			if not os.path.exists(directory):
 				continue
+			journals[directory].close()
 			for filename in os.listdir(directory):
-				if filename != "tmp":
+				if filename == JOURNAL_DIR:
+					shutil.rmtree(os.path.join(directory, filename))
+				elif filename != "tmp":
 					os.remove(os.path.join(directory, filename))
 			if os.path.exists(os.path.join(directory, 'tmp')):
 				for filename in os.listdir(os.path.join(directory, 'tmp')):
@@ -173,13 +163,7 @@ def postrun():
 			s4_init_mode = False
 			for ob in group_objects:
 				for directory in dirs:
-					filename = os.path.join(directory, "%f" % time.time())
-					f = open(filename, 'w+')
-					os.chmod(filename, 0600)
-					p = cPickle.Pickler(f)
-					p.dump(ob)
-					p.clear_memo()
-					f.close()
+					journals[directory].append(ob)
 			del group_objects
 			group_objects = []
 		finally: